@@ -5,24 +5,74 @@ Demonstrates a simple microservice that stores product images in S3
 """
 import os
 import json
+import time
 import uuid
+import threading
+from collections import OrderedDict
 from datetime import datetime
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import boto3
-from botocore.exceptions import ClientError, NoCredentialsError
+from botocore.exceptions import ClientError
+
+from catalog_compress import compress_response
+from catalog_json import FastJSONProvider
+from catalog_metrics import Metrics
+from catalog_ready import ReadinessMonitor
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 
 # Configuration
 S3_BUCKET = os.environ.get('S3_BUCKET_NAME', 'tenant-atlantis-product-images')
 AWS_REGION = os.environ.get('AWS_REGION', 'us-west-2')
 
+# /ready answers from state refreshed in the background every ~READY_CHECK_INTERVAL seconds
+READY_CHECK_INTERVAL = float(os.environ.get('READY_CHECK_INTERVAL', '10'))
+READY_CHECK_JITTER = float(os.environ.get('READY_CHECK_JITTER', '0.2'))
+# Skip HeadBucket while S3 requests have succeeded this recently
+READY_FRESH_SECONDS = float(os.environ.get('READY_FRESH_SECONDS', '15'))
+# Consecutive failed checks before a ready replica reports not ready
+READY_FAILURE_THRESHOLD = int(os.environ.get('READY_FAILURE_THRESHOLD', '3'))
+
+# Prometheus /metrics: request latency and status per route, S3 call latency per operation
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() in ('1', 'true')
+# Comma-separated upper bounds (seconds) of the latency histogram buckets
+METRICS_LATENCY_BUCKETS = tuple(sorted(
+    float(bound) for bound in os.environ.get(
+        'METRICS_LATENCY_BUCKETS', '0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10'
+    ).split(',') if bound.strip()
+))
+
 # Initialize S3 client
 s3_client = boto3.client('s3', region_name=AWS_REGION)
 
+# Prometheus metrics served from /metrics (None = off)
+metrics = Metrics(METRICS_LATENCY_BUCKETS) if METRICS_ENABLED else None
+if metrics is not None:
+    metrics.observe(s3_client)
+
+# /ready state, refreshed by a background thread from HeadBucket or recent S3 successes
+readiness = ReadinessMonitor(
+    s3_client, S3_BUCKET, READY_CHECK_INTERVAL, READY_CHECK_JITTER, READY_FRESH_SECONDS, READY_FAILURE_THRESHOLD
+)
+readiness.observe(s3_client)
+readiness.start()
+
 PRODUCTS_PREFIX = 'products'
 METADATA_FILENAME = 'product.json'
 IMAGE_FILENAME = 'image.jpg'
+IMAGE_URL_EXPIRES_SECONDS = 3600  # 1 hour
+
+# Local cache of product ETags, so conditional GETs of unchanged products are
+# answered with 304 without calling S3. Products are never modified in place.
+# Bodies are always read from S3, so a deleted product is never served again,
+# but another replica may answer 304 for it until its entry expires.
+PRODUCT_CACHE_SIZE = int(os.environ.get('PRODUCT_CACHE_SIZE', '1000'))
+PRODUCT_CACHE_SECONDS = float(os.environ.get('PRODUCT_CACHE_SECONDS', '300'))
+
+# product_id -> (etag, expires_at), least recently used first
+product_etags = OrderedDict()
+product_etags_lock = threading.Lock()
 
 
 def build_image_key(product_id: str) -> str:
@@ -34,20 +84,53 @@ def build_metadata_key(product_id: str) -> str:
 
 
 def fetch_product(product_id: str):
+    product, _ = fetch_product_version(product_id)
+    return product
+
+
+def fetch_product_version(product_id: str):
+    """Return (product, S3 ETag of its metadata object), or (None, None) if it doesn't exist"""
     metadata_key = build_metadata_key(product_id)
     try:
         response = s3_client.get_object(Bucket=S3_BUCKET, Key=metadata_key)
-        product_data = response['Body'].read().decode('utf-8')
-        product = json.loads(product_data)
+        product = app.json.loads(response['Body'].read())
         product['metadata_s3_key'] = metadata_key
-        return product
+        return product, response['ETag'].strip('"')
     except ClientError as e:
         error_code = e.response.get('Error', {}).get('Code', '')
         if error_code in ['NoSuchKey', '404']:
-            return None
+            return None, None
         raise
 
 
+def cached_etag(product_id: str):
+    """Return the product's ETag from the local cache, or None"""
+    with product_etags_lock:
+        entry = product_etags.get(product_id)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            del product_etags[product_id]
+            return None
+        product_etags.move_to_end(product_id)
+        return entry[0]
+
+
+def cache_etag(product_id: str, etag: str):
+    if PRODUCT_CACHE_SIZE <= 0:
+        return
+    with product_etags_lock:
+        product_etags[product_id] = (etag, time.monotonic() + PRODUCT_CACHE_SECONDS)
+        product_etags.move_to_end(product_id)
+        while len(product_etags) > PRODUCT_CACHE_SIZE:
+            product_etags.popitem(last=False)
+
+
+def forget_product(product_id: str):
+    with product_etags_lock:
+        product_etags.pop(product_id, None)
+
+
 def list_product_metadata_keys():
     keys = []
     continuation_token = None
@@ -73,6 +156,29 @@ def list_product_metadata_keys():
     return keys
 
 
+@app.before_request
+def start_metrics():
+    """Start timing the request"""
+    if metrics is not None:
+        metrics.start_request(request.url_rule.rule if request.url_rule else 'unmatched')
+
+
+# Registered ahead of compress, which Flask runs first, so the timing
+# includes compressing the response
+@app.after_request
+def record_metrics(response):
+    """Count the request by route and status and record its latency once the body is sent"""
+    if metrics is not None:
+        metrics.finish_response(request.method, response)
+    return response
+
+
+@app.after_request
+def compress(response):
+    """gzip/brotli large JSON bodies (e.g. GET /products) for clients that accept it"""
+    return compress_response(response, request.accept_encodings)
+
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -85,24 +191,17 @@ def health_check():
 
 @app.route('/ready', methods=['GET'])
 def readiness_check():
-    """Readiness check - verifies S3 bucket is accessible"""
-    try:
-        s3_client.head_bucket(Bucket=S3_BUCKET)
-        return jsonify({
-            'status': 'ready',
-            'timestamp': datetime.utcnow().isoformat(),
-            's3_bucket': S3_BUCKET
-        }), 200
-    except NoCredentialsError:
-        return jsonify({
-            'status': 'not ready',
-            'error': 'AWS credentials not configured'
-        }), 503
-    except ClientError:
-        return jsonify({
-            'status': 'not ready',
-            'error': 'S3 bucket not accessible'
-        }), 503
+    """Readiness check - S3 bucket access as last refreshed in the background"""
+    ready, body = readiness.status()
+    return jsonify(body), 200 if ready else 503
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics for this worker process"""
+    if metrics is None:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 
 @app.route('/products', methods=['GET'])
@@ -114,8 +213,7 @@ def list_products():
         for key in product_keys:
             try:
                 response = s3_client.get_object(Bucket=S3_BUCKET, Key=key)
-                product_data = response['Body'].read().decode('utf-8')
-                product = json.loads(product_data)
+                product = app.json.loads(response['Body'].read())
                 product['metadata_s3_key'] = key
                 product_list.append(product)
             except ClientError as e:
@@ -199,25 +297,49 @@ def create_product():
 
 @app.route('/products/<product_id>', methods=['GET'])
 def get_product(product_id):
-    """Get a specific product with S3 signed URL for image"""
-    product = fetch_product(product_id)
+    """Get a specific product, with a link to its image; ETag is the S3 ETag of its metadata
+
+    The body links to /products/<id>/image instead of carrying a presigned
+    URL, so it only changes with the metadata object and the S3 ETag is a
+    valid strong validator on every replica.
+    """
+    etag = cached_etag(product_id)
+    if etag is not None and request.if_none_match.contains_weak(etag):
+        return Response(status=304, headers={'ETag': f'"{etag}"'})
 
+    product, etag = fetch_product_version(product_id)
     if not product:
+        forget_product(product_id)
         return jsonify({'error': 'Product not found'}), 404
-
-    # Generate presigned URL for image if it exists
+    cache_etag(product_id, etag)
     if 'image_s3_key' in product:
-        try:
-            url = s3_client.generate_presigned_url(
-                'get_object',
-                Params={'Bucket': S3_BUCKET, 'Key': product['image_s3_key']},
-                ExpiresIn=3600  # 1 hour
-            )
-            product['image_url'] = url
-        except ClientError as e:
-            product['image_url_error'] = str(e)
+        product['image_url'] = f"/{PRODUCTS_PREFIX}/{product_id}/image"
+
+    if request.if_none_match.contains_weak(etag):
+        return Response(status=304, headers={'ETag': f'"{etag}"'})
+
+    response = jsonify(product)
+    response.set_etag(etag)
+    return response, 200
 
-    return jsonify(product), 200
+
+@app.route('/products/<product_id>/image', methods=['GET'])
+def get_product_image(product_id):
+    """Redirect to a freshly presigned S3 URL for the product image"""
+    product = fetch_product(product_id)
+    if not product or 'image_s3_key' not in product:
+        return jsonify({'error': 'Product image not found'}), 404
+
+    try:
+        url = s3_client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': S3_BUCKET, 'Key': product['image_s3_key']},
+            ExpiresIn=IMAGE_URL_EXPIRES_SECONDS
+        )
+    except ClientError as e:
+        return jsonify({'error': f'Failed to sign image URL: {str(e)}'}), 500
+    # The URL expires, so clients must not keep the redirect
+    return Response(status=302, headers={'Location': url, 'Cache-Control': 'no-store'})
 
 
 @app.route('/products/<product_id>', methods=['DELETE'])
@@ -239,6 +361,7 @@ def delete_product(product_id):
         s3_client.delete_object(Bucket=S3_BUCKET, Key=metadata_key)
     except ClientError:
         pass
+    forget_product(product_id)
 
     return jsonify({'message': 'Product deleted'}), 200
 
@@ -254,7 +377,8 @@ def index():
             'GET /ready': 'Readiness check',
             'GET /products': 'List all products',
             'POST /products': 'Create a product',
-            'GET /products/<id>': 'Get a specific product',
+            'GET /products/<id>': 'Get a specific product (image_url links to GET /products/<id>/image)',
+            'GET /products/<id>/image': 'Redirect to a presigned S3 URL for the product image',
             'DELETE /products/<id>': 'Delete a product'
         },
         's3_bucket': S3_BUCKET,
@@ -263,5 +387,6 @@ def index():
 
 
 if __name__ == '__main__':
+    # Development server only - the container runs gunicorn (see gunicorn.conf.py)
     port = int(os.environ.get('PORT', 8080))
     app.run(host='0.0.0.0', port=port, debug=False)
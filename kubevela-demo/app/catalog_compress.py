@@ -0,0 +1,66 @@
+"""
+Response compression negotiated from Accept-Encoding
+JSON bodies (e.g. GET /products) are compressed with brotli (when the
+Brotli package is installed) or gzip, whichever the client prefers.
+Bodies below COMPRESS_MIN_SIZE are sent as-is.
+"""
+
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# gzip/brotli for JSON bodies of at least COMPRESS_MIN_SIZE bytes, when the client accepts it
+COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', 'true').lower() in ('1', 'true')
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', '1024'))
+COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', '6'))
+COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', '4'))
+
+# In server preference order when the client rates them equally
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate(accept_encodings):
+    """Pick a content coding from a parsed Accept-Encoding header, or None for identity"""
+    return accept_encodings.best_match(ENCODINGS)
+
+
+def compress(data, encoding):
+    """Compress a whole body"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=COMPRESS_BROTLI_QUALITY)
+    compressor = zlib.compressobj(COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _eligible(response):
+    """Whether a response may be compressed at all (before looking at its size)
+
+    Responses with an ETag stay uncompressed so the ETag keeps naming the
+    exact bytes sent.
+    """
+    return (
+        COMPRESSION_ENABLED
+        and response.status_code == 200
+        and not response.is_streamed
+        and response.mimetype == 'application/json'
+        and 'Content-Encoding' not in response.headers
+        and 'ETag' not in response.headers
+    )
+
+
+def compress_response(response, accept_encodings):
+    """Compress a Flask response in place if the client accepts it; returns the response"""
+    if not _eligible(response):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate(accept_encodings)
+    data = response.get_data()
+    if encoding is None or len(data) < COMPRESS_MIN_SIZE:
+        return response
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,98 @@
+"""
+JSON encoding for the Product Catalog API
+A Flask JSON provider that uses orjson when it is installed and the stdlib
+json module otherwise. Decimals are written as exact JSON numbers (never
+via float).
+"""
+
+import os
+import re
+import uuid
+from decimal import Decimal
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# auto: orjson if installed, else stdlib; orjson: require it; stdlib: never use it
+JSON_ENCODER = os.environ.get('JSON_ENCODER', 'auto')
+if JSON_ENCODER not in ('auto', 'orjson', 'stdlib'):
+    raise ValueError(f"JSON_ENCODER must be auto, orjson or stdlib, got {JSON_ENCODER!r}")
+if JSON_ENCODER == 'orjson' and orjson is None:
+    raise RuntimeError("JSON_ENCODER=orjson requires the orjson package")
+
+# Placeholder for Decimals while encoding (orjson < 3.9 and stdlib json)
+DECIMAL_MARKER = uuid.uuid4().hex
+DECIMAL_PLACEHOLDER = re.compile(f'"{DECIMAL_MARKER}:(\\d+)"')
+DECIMAL_PLACEHOLDER_BYTES = re.compile(DECIMAL_PLACEHOLDER.pattern.encode('ascii'))
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """JSON provider using orjson when available; Decimals become exact JSON numbers"""
+
+    fast = orjson is not None and JSON_ENCODER != 'stdlib'
+
+    def dumps(self, obj, **kwargs):
+        if self.fast and not kwargs:
+            return self._dumps_fast(obj).decode('utf-8')
+
+        numbers = []
+        default = kwargs.pop('default', self.default)
+
+        def encode_decimal(value):
+            if isinstance(value, Decimal):
+                numbers.append(str(value))
+                return f'{DECIMAL_MARKER}:{len(numbers) - 1}'
+            return default(value)
+
+        text = super().dumps(obj, default=encode_decimal, **kwargs)
+        if not numbers:
+            return text
+        return DECIMAL_PLACEHOLDER.sub(lambda match: numbers[int(match.group(1))], text)
+
+    def loads(self, s, **kwargs):
+        if self.fast and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        if not self.fast:
+            return super().response(*args, **kwargs)
+
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self._dumps_fast(obj, indent) + b'\n', mimetype=self.mimetype)
+
+    def _dumps_fast(self, obj, indent=False):
+        """Encode with orjson to UTF-8 bytes"""
+        fragment = getattr(orjson, 'Fragment', None)
+        numbers = []
+
+        def encode_decimal(value):
+            if not isinstance(value, Decimal):
+                return self.default(value)
+            if fragment is not None:
+                return fragment(str(value))
+            numbers.append(str(value).encode('ascii'))
+            return f'{DECIMAL_MARKER}:{len(numbers) - 1}'
+
+        # Dates go through self.default so they render like the stdlib provider
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+
+        try:
+            body = orjson.dumps(obj, default=encode_decimal, option=option)
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bits - let the stdlib encoder handle it
+            dump_args = {'indent': 2} if indent else {'separators': (',', ':')}
+            return self.dumps(obj, **dump_args).encode('utf-8')
+
+        if not numbers:
+            return body
+        return DECIMAL_PLACEHOLDER_BYTES.sub(lambda match: numbers[int(match.group(1))], body)
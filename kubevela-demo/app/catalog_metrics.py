@@ -0,0 +1,227 @@
+"""
+Prometheus metrics for the Product Catalog API
+Request latency and status per route, plus latency, errors, retries and
+throttles per S3 operation, fed by request hooks and botocore events and
+served as Prometheus text from /metrics.
+
+Recording is lock-free: each thread updates its own store, so request
+threads never contend. The lock is only taken when a thread records for
+the first time and when /metrics merges the stores. Each process (gunicorn
+worker) keeps its own metrics.
+"""
+
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+
+from catalog_ready import S3_THROTTLE_ERRORS
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name: (type, help, label names)
+METRICS = {
+    'http_requests_total': (
+        'counter', 'HTTP requests by route and response status', ('method', 'route', 'status')
+    ),
+    'http_request_duration_seconds': (
+        'histogram', 'Time until the HTTP response body is sent, by route', ('method', 'route')
+    ),
+    'aws_call_duration_seconds': (
+        'histogram', 'AWS API call latency including SDK retries', ('service', 'operation')
+    ),
+    'aws_call_errors_total': (
+        'counter', 'AWS API calls that failed, by error code', ('service', 'operation', 'code')
+    ),
+    'aws_call_retries_total': (
+        'counter', 'Attempts the SDK retried', ('service', 'operation')
+    ),
+    'aws_call_throttles_total': (
+        'counter', 'Attempts throttled by the service', ('service', 'operation')
+    ),
+}
+
+# Route and start time of the request being served
+_request = contextvars.ContextVar('metrics_request', default=('background', None))
+
+
+class _Store:
+    """One thread's counters and histograms, keyed by (metric name, label values)"""
+
+    def __init__(self, width):
+        self.width = width
+        self.counters = {}
+        # Per-bucket (not cumulative) counts, with +Inf last, then the sum
+        self.histograms = {}
+
+    def merge(self, counters, histograms):
+        for key, value in counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+        for key, values in histograms.items():
+            totals = self.histograms.get(key)
+            if totals is None:
+                self.histograms[key] = list(values)
+            else:
+                for i, value in enumerate(values):
+                    totals[i] += value
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metrics:
+    """Process-wide registry of the METRICS series, recorded per thread"""
+
+    def __init__(self, buckets=DEFAULT_LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # (thread, store) for every thread that has recorded
+        self._stores = []
+        # Totals of threads that have exited
+        self._retired = _Store(len(self.buckets) + 2)
+
+    def _store(self):
+        try:
+            return self._local.store
+        except AttributeError:
+            store = self._local.store = _Store(len(self.buckets) + 2)
+            with self._lock:
+                self._retire()
+                self._stores.append((threading.current_thread(), store))
+            return store
+
+    def _retire(self):
+        """Fold the stores of exited threads (e.g. per-scan executors) into the totals; caller holds the lock"""
+        alive = []
+        for thread, store in self._stores:
+            if thread.is_alive():
+                alive.append((thread, store))
+            else:
+                self._retired.merge(store.counters, store.histograms)
+        self._stores = alive
+
+    def inc(self, name, labels, value=1):
+        counters = self._store().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe_latency(self, name, labels, seconds):
+        store = self._store()
+        key = (name, labels)
+        values = store.histograms.get(key)
+        if values is None:
+            values = store.histograms[key] = [0] * store.width
+        # bisect_left: a value equal to a bound belongs in that bucket (le)
+        values[bisect_left(self.buckets, seconds)] += 1
+        values[-1] += seconds
+
+    def start_request(self, route):
+        """Note the start of a request to `route`"""
+        _request.set((route, time.perf_counter()))
+
+    def finish_request(self, method, status):
+        """A callback recording the request started by start_request() with its response status,
+        to call once the body has been sent; None if no request was started"""
+        route, started = _request.get()
+        if started is None:
+            return None
+
+        def record():
+            self.inc('http_requests_total', (method, route, str(status)))
+            self.observe_latency('http_request_duration_seconds', (method, route), time.perf_counter() - started)
+        return record
+
+    def finish_response(self, method, response):
+        """Record a Flask response's request when the server closes it, after streamed bodies are sent"""
+        record = self.finish_request(method, response.status_code)
+        if record is not None:
+            response.call_on_close(record)
+
+    def observe(self, client):
+        """Time and count the calls made through a boto3 client"""
+        def before_call(model, context, **kwargs):
+            context['metrics_call'] = ((model.service_model.service_name, model.name), time.perf_counter())
+
+        def needs_retry(operation, response=None, **kwargs):
+            if response is not None and response[1].get('Error', {}).get('Code') in S3_THROTTLE_ERRORS:
+                self.inc('aws_call_throttles_total', (operation.service_model.service_name, operation.name))
+
+        def finish_call(context):
+            """The call's labels after recording its latency (None if before-call never ran)"""
+            call = context.get('metrics_call')
+            if call is None:
+                return None
+            labels, started = call
+            self.observe_latency('aws_call_duration_seconds', labels, time.perf_counter() - started)
+            return labels
+
+        def after_call(http_response, parsed, context, **kwargs):
+            labels = finish_call(context)
+            if labels is None:
+                return
+            retries = parsed.get('ResponseMetadata', {}).get('RetryAttempts')
+            if retries:
+                self.inc('aws_call_retries_total', labels, retries)
+            if http_response.status_code >= 300:
+                code = parsed.get('Error', {}).get('Code') or str(http_response.status_code)
+                self.inc('aws_call_errors_total', labels + (code,))
+
+        def after_call_error(exception, context, **kwargs):
+            # Connection errors and timeouts, once the SDK has given up retrying
+            labels = finish_call(context)
+            if labels is not None:
+                self.inc('aws_call_errors_total', labels + (type(exception).__name__,))
+
+        events = client.meta.events
+        events.register('before-call', before_call)
+        events.register('needs-retry', needs_retry)
+        events.register('after-call', after_call)
+        events.register('after-call-error', after_call_error)
+
+    def collect(self):
+        """Merged (counters, histograms) across all threads"""
+        totals = _Store(len(self.buckets) + 2)
+        with self._lock:
+            self._retire()
+            totals.merge(self._retired.counters, self._retired.histograms)
+            stores = [store for _, store in self._stores]
+        for store in stores:
+            # Copies are atomic under the GIL; a histogram read mid-update may
+            # be off by one observation, which the next scrape corrects
+            totals.merge(store.counters.copy(), {
+                key: list(values) for key, values in store.histograms.copy().items()
+            })
+        return totals.counters, totals.histograms
+
+    def render(self):
+        """The metrics in Prometheus text exposition format (0.0.4)"""
+        counters, histograms = self.collect()
+        lines = []
+        for name, (kind, help_text, label_names) in METRICS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == 'counter':
+                for (metric, values), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f'{name}{_labels(label_names, values)} {repr(value)}')
+                continue
+            for (metric, values), buckets in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), buckets):
+                    cumulative += count
+                    le = 'le="+Inf"' if bound == float('inf') else f'le="{bound!r}"'
+                    lines.append(f'{name}_bucket{_labels(label_names, values, (le,))} {cumulative}')
+                lines.append(f'{name}_sum{_labels(label_names, values)} {repr(buckets[-1])}')
+                lines.append(f'{name}_count{_labels(label_names, values)} {cumulative}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,96 @@
+"""
+Cached readiness state for the /ready probe
+A background thread refreshes readiness at jittered intervals, so replicas
+don't call HeadBucket in lockstep. The check is skipped while other S3
+requests have succeeded recently, and a throttled check keeps the last
+known state instead of flapping. The probe itself only reads the cached
+state.
+"""
+
+import random
+import threading
+import time
+from datetime import datetime
+
+from botocore.exceptions import ClientError, NoCredentialsError
+
+# S3 error codes that mean "slow down" - the bucket is reachable
+S3_THROTTLE_ERRORS = ('SlowDown', 'Throttling', 'ThrottlingException', 'RequestLimitExceeded', '503')
+
+
+class ReadinessMonitor:
+    """S3 bucket readiness refreshed in the background and served from memory"""
+
+    def __init__(self, s3_client, bucket, interval, jitter, fresh_seconds, failure_threshold):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.interval = interval
+        self.jitter = jitter
+        self.fresh_seconds = fresh_seconds
+        self.failure_threshold = failure_threshold
+        # (ready, body), replaced as a whole so readers never see half an update
+        self._state = (False, {'status': 'not ready', 'error': 'Readiness not checked yet'})
+        self._failures = 0
+        # Monotonic time of the last successful S3 request other than the check
+        self._last_success = float('-inf')
+        self._stop = threading.Event()
+
+    def status(self):
+        """Return (ready, body) for the probe"""
+        return self._state
+
+    def observe(self, client):
+        """Record successful S3 requests made through a client; recent ones stand in for HeadBucket"""
+        def after_call(http_response, model, **kwargs):
+            if http_response.status_code < 300 and model.name != 'HeadBucket':
+                self._last_success = time.monotonic()
+
+        client.meta.events.register('after-call.s3', after_call)
+
+    def next_delay(self):
+        """Seconds until the next refresh, jittered so replicas drift apart"""
+        return self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _ready(self, source):
+        self._failures = 0
+        self._state = (True, {
+            'status': 'ready', 'timestamp': datetime.utcnow().isoformat(), 's3_bucket': self.bucket,
+            'source': source
+        })
+
+    def refresh(self):
+        """Update the state once (short-circuit or HeadBucket)"""
+        if time.monotonic() - self._last_success < self.fresh_seconds:
+            self._ready('s3_requests')
+            return
+
+        try:
+            self.s3_client.head_bucket(Bucket=self.bucket)
+        except NoCredentialsError:
+            error = 'AWS credentials not configured'
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code', '') in S3_THROTTLE_ERRORS:
+                # Throttled means reachable - keep the last known state
+                return
+            error = 'S3 bucket not accessible'
+        except Exception:
+            error = 'S3 bucket not accessible'
+        else:
+            self._ready('head_bucket')
+            return
+
+        self._failures += 1
+        if self._failures >= self.failure_threshold or not self._state[0]:
+            self._state = (False, {'status': 'not ready', 'error': error})
+
+    def start(self):
+        """Refresh on a background thread, starting now"""
+        def run():
+            while not self._stop.is_set():
+                self.refresh()
+                self._stop.wait(self.next_delay())
+
+        threading.Thread(target=run, name='readiness', daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,40 @@
+"""
+Gunicorn configuration for the Product Catalog API
+Production entry point: gunicorn -c gunicorn.conf.py app:app
+"""
+
+import os
+
+
+def available_cpus():
+    """CPUs this container may use, honouring the cgroup v2 CPU limit"""
+    cpus = len(os.sched_getaffinity(0))
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            # e.g. a 500m limit still gets one worker
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+
+# One worker process per available core, each serving requests on a thread pool
+workers = int(os.environ.get('WEB_WORKERS', available_cpus()))
+threads = int(os.environ.get('WEB_THREADS', '8'))
+worker_class = 'gthread'
+
+# Import the app in each worker after the fork, so every worker creates its own
+# boto3 S3 client and connection pool instead of sharing sockets with the master
+preload_app = False
+
+timeout = int(os.environ.get('WEB_TIMEOUT', '60'))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.environ.get('WEB_KEEPALIVE', '5'))
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('WEB_LOG_LEVEL', 'info')
@@ -0,0 +1,87 @@
+"""
+Benchmark the session data storage codecs
+For a range of payload sizes, reports the stored `data` size (what WCU/RCU
+are billed on) and the CPU to encode on write and to decode and render a
+GET /sessions/<id> response body on read. Runs offline - no table needed.
+
+    python bench/codec_bench.py --iterations 2000
+"""
+
+import argparse
+import importlib
+import os
+import sys
+import time
+
+from boto3.dynamodb.types import TypeSerializer
+from flask import Flask
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import session_codec  # noqa: E402
+from session_json import SessionJSONProvider  # noqa: E402
+from session_store import deserialize_session  # noqa: E402
+
+
+def payload(size):
+    """Session data of roughly `size` bytes of JSON"""
+    data = {'theme': 'dark', 'locale': 'en-US', 'cart': []}
+    n = 0
+    while len(str(data)) < size:
+        data['cart'].append({'sku': f'SKU-{n:06d}', 'qty': n % 5 + 1, 'price': round(9.99 + n, 2), 'gift': n % 7 == 0})
+        n += 1
+    return data
+
+
+def stored_size(attribute):
+    """Approximate DynamoDB size of the `data` attribute value"""
+    if 'S' in attribute:
+        return len(attribute['S'].encode('utf-8'))
+    if 'B' in attribute:
+        return len(attribute['B'])
+    # Maps: names + values + ~1 byte overhead per element; close enough for comparison
+    return len(str(attribute)) // 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--sizes', default='256,2048,16384,131072')
+    args = parser.parse_args()
+
+    for codec, compression in (('json', 'zlib'), ('raw', 'zlib'), ('map', 'zlib'),
+                               ('compressed', 'zlib'), ('compressed', 'zstd')):
+        os.environ['SESSION_DATA_CODEC'] = codec
+        os.environ['SESSION_DATA_COMPRESSION'] = compression
+        try:
+            codec_module = importlib.reload(session_codec)
+        except RuntimeError as e:
+            print(f"{codec}/{compression}: skipped ({e})")
+            continue
+
+        app = Flask(__name__)
+        app.json = SessionJSONProvider(app)
+        name = codec if codec != 'compressed' else f'{codec}/{compression}'
+
+        for size in (int(size) for size in args.sizes.split(',')):
+            data = payload(size)
+            attribute = TypeSerializer().serialize(codec_module.encode_data(data))
+
+            start = time.process_time()
+            for _ in range(args.iterations):
+                codec_module.encode_data(data)
+            write_us = (time.process_time() - start) / args.iterations * 1e6
+
+            # Read = attribute deserialization + decode + rendering the response body
+            start = time.process_time()
+            for _ in range(args.iterations):
+                stored = deserialize_session({'data': attribute})['data']
+                app.json.dumps({'sessionId': 'session-1', 'data': codec_module.decode_data(stored)})
+            read_us = (time.process_time() - start) / args.iterations * 1e6
+
+            print(f"{name:<16} {size:>7} B  stored {stored_size(attribute):>7} B  "
+                  f"write {write_us:>8.1f} us  read {read_us:>8.1f} us")
+
+
+if __name__ == '__main__':
+    main()
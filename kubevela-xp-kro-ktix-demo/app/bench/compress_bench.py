@@ -0,0 +1,70 @@
+"""
+Benchmark response compression of large list responses
+Compresses 10k-item GET /sessions and GET /sessions/user/<id> style bodies
+at several gzip levels and brotli qualities, and reports compressed size and
+time per response - the trade-off behind COMPRESS_GZIP_LEVEL and
+COMPRESS_BROTLI_QUALITY.
+
+    python bench/compress_bench.py --items 10000 --iterations 10
+"""
+
+import argparse
+import os
+import sys
+import time
+import zlib
+
+from flask import Flask
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from json_bench import bodies  # noqa: E402
+from session_compress import brotli  # noqa: E402
+from session_json import SessionJSONProvider  # noqa: E402
+
+
+def gzip_level(level):
+    def encode(data):
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+    return encode
+
+
+def brotli_quality(quality):
+    return lambda data: brotli.compress(data, quality=quality)
+
+
+def timed(encode, data, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        size = len(encode(data))
+    return (time.perf_counter() - start) / iterations * 1e3, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--items', type=int, default=10000)
+    parser.add_argument('--iterations', type=int, default=10)
+    args = parser.parse_args()
+
+    encoders = [(f'gzip -{level}', gzip_level(level)) for level in (1, 4, 6, 9)]
+    if brotli is not None:
+        encoders += [(f'br q{quality}', brotli_quality(quality)) for quality in (1, 4, 6, 11)]
+    else:
+        print("Brotli not installed - skipping it")
+
+    app = Flask(__name__)
+    provider = SessionJSONProvider(app)
+    with app.app_context():
+        for name, body in bodies(args.items).items():
+            data = provider.response(body).get_data()
+            print(f"{name:<10} {'identity':<10} {'':>11}  {len(data) / 1024:8.0f} KiB")
+            for encoder, encode in encoders:
+                # brotli q11 is far too slow to repeat much
+                iterations = 1 if encoder == 'br q11' else args.iterations
+                ms, size = timed(encode, data, iterations)
+                print(f"{name:<10} {encoder:<10} {ms:8.2f} ms  {size / 1024:8.0f} KiB  {len(data) / size:5.1f}x")
+
+
+if __name__ == '__main__':
+    main()
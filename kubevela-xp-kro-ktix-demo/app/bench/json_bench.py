@@ -0,0 +1,95 @@
+"""
+Benchmark JSON encoding of large list responses
+Encodes 10k-item GET /sessions and GET /sessions/user/<id> style bodies with
+Flask's default provider and with SessionJSONProvider on the stdlib and
+orjson encoders. Items carry DynamoDB Decimals; the default provider needs
+them converted to floats first (the walk is included in its time).
+
+    python bench/json_bench.py --items 10000 --iterations 20
+"""
+
+import argparse
+import os
+import sys
+import time
+from decimal import Decimal
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import session_json  # noqa: E402
+from session_json import SessionJSONProvider  # noqa: E402
+
+
+def to_float(value):
+    """What callers had to do before: turn every Decimal into a float"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, dict):
+        return {key: to_float(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [to_float(item) for item in value]
+    return value
+
+
+def bodies(items):
+    summaries = [{
+        'sessionId': f'session-user{n % 500}-{n:012x}',
+        'userId': f'user{n % 500}',
+        'createdAt': '2025-12-24T10:00:00.000000',
+        'expiresAt': '2025-12-25T10:00:00+00:00'
+    } for n in range(items)]
+    sessions = [dict(summary, data={
+        'theme': 'dark',
+        'cart': [{'sku': f'SKU-{k}', 'qty': Decimal(k + 1), 'price': Decimal('19.99')} for k in range(3)],
+        'score': Decimal('0.8125')
+    }) for summary in summaries]
+    return {
+        'summaries': {'sessionCount': items, 'sessions': summaries},
+        'sessions': {'userId': 'user1', 'sessionCount': items, 'sessions': sessions}
+    }
+
+
+def timed(encode, body, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        size = len(encode(body))
+    return (time.perf_counter() - start) / iterations * 1e3, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--items', type=int, default=10000)
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    default = DefaultJSONProvider(app)
+    stdlib = SessionJSONProvider(app)
+    stdlib.fast = False
+    fast = SessionJSONProvider(app)
+
+    encoders = [
+        ('flask default', lambda body: default.response(to_float(body)).get_data()),
+        ('stdlib', lambda body: stdlib.response(body).get_data()),
+    ]
+    if fast.fast:
+        encoders.append(('orjson', lambda body: fast.response(body).get_data()))
+    else:
+        print("orjson not installed (or JSON_ENCODER=stdlib) - skipping it")
+
+    with app.app_context():
+        for name, body in bodies(args.items).items():
+            baseline = None
+            for encoder, encode in encoders:
+                ms, size = timed(encode, body, args.iterations)
+                baseline = baseline or ms
+                print(f"{name:<10} {encoder:<14} {ms:8.2f} ms  {size / 1024:8.0f} KiB  {baseline / ms:5.1f}x")
+
+    print(f"orjson Fragment support: {session_json._Fragment is not None}")
+
+
+if __name__ == '__main__':
+    main()
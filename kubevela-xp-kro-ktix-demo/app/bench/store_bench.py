@@ -0,0 +1,96 @@
+"""
+Benchmark single-session reads/writes: boto3 resource API vs SessionStore
+Runs the same put_item/get_item mix through both paths on a thread pool and
+reports client CPU per request plus latency percentiles. Point it at a real
+table, DynamoDB Local or LocalStack (AWS_ENDPOINT_URL) - it writes and then
+deletes its own bench-* sessions.
+
+    python bench/store_bench.py --requests 5000 --concurrency 32
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.config import Config
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from session_common import AWS_REGION, TABLE_NAME, new_session_item  # noqa: E402
+from session_store import SessionStore, client_config  # noqa: E402
+
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def run(name, put, get, session_ids, requests, concurrency):
+    """Time `requests` operations (1 put : 4 gets) and print a result line"""
+    def one(n):
+        start = time.perf_counter()
+        if n % 5 == 0:
+            put(new_session_item(f'bench-{n % 100}', {'n': n, 'theme': 'dark', 'cart': list(range(20))}))
+        else:
+            get(session_ids[n % len(session_ids)])
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # Warm up the connection pool
+        list(executor.map(one, range(concurrency * 2)))
+
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        latencies = sorted(executor.map(one, range(requests)))
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+
+    print(f"{name:<10} {requests / wall:>9.0f} req/s  {cpu / requests * 1e6:>7.0f} us CPU/req  "
+          f"p50 {percentile(latencies, 0.50) * 1e3:6.2f} ms  "
+          f"p99 {percentile(latencies, 0.99) * 1e3:6.2f} ms  "
+          f"p99.9 {percentile(latencies, 0.999) * 1e3:6.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--sessions', type=int, default=500, help='sessions seeded for reads')
+    args = parser.parse_args()
+
+    # Baseline: what session-api.py used before - default botocore settings
+    table = boto3.resource('dynamodb', region_name=AWS_REGION).Table(TABLE_NAME)
+    store = SessionStore(boto3.client('dynamodb', region_name=AWS_REGION, config=client_config()), TABLE_NAME)
+    tuned_table = boto3.resource('dynamodb', region_name=AWS_REGION, config=client_config()).Table(TABLE_NAME)
+
+    items = [new_session_item(f'bench-{n}', {'n': n, 'theme': 'dark'}) for n in range(args.sessions)]
+    with table.batch_writer() as batch:
+        for item in items:
+            batch.put_item(Item=item)
+    session_ids = [item['id'] for item in items]
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}, "
+          f"pool {Config().max_pool_connections} (default) vs {client_config().max_pool_connections}")
+    try:
+        run('resource', lambda item: table.put_item(Item=item),
+            lambda session_id: table.get_item(Key={'id': session_id}),
+            session_ids, args.requests, args.concurrency)
+        run('resource+', lambda item: tuned_table.put_item(Item=item),
+            lambda session_id: tuned_table.get_item(Key={'id': session_id}),
+            session_ids, args.requests, args.concurrency)
+        run('store', store.put, store.get, session_ids, args.requests, args.concurrency)
+    finally:
+        # Remove everything the benchmark wrote
+        with table.batch_writer() as batch:
+            for page in table.meta.client.get_paginator('scan').paginate(
+                    TableName=TABLE_NAME, ProjectionExpression='id',
+                    FilterExpression='begins_with(id, :prefix)',
+                    ExpressionAttributeValues={':prefix': 'session-bench-'}):
+                for item in page['Items']:
+                    batch.delete_item(Key={'id': item['id']})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,872 @@
+"""
+Session Management API using AWS DynamoDB - ASGI variant
+Same routes and response shapes as session-api.py, served by Quart on an
+async DynamoDB client (aioboto3) so one process can keep hundreds of
+DynamoDB calls in flight instead of blocking a thread per request
+"""
+
+import os
+import time
+import asyncio
+import logging
+from contextlib import AsyncExitStack
+from datetime import datetime, timezone
+from quart import Quart, Response, request, jsonify
+import aioboto3
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from session_batch import batch_get_async, batch_write_async, parallel_batch_write_async
+from session_cache import SessionCache
+from session_codec import decode_data, encode_data
+from session_compress import compress_response_async
+from session_common import (
+    AWS_REGION, BATCH_MAX_ITEMS, BATCH_MAX_RETRIES, BATCH_RETRY_BASE_DELAY, BATCH_WRITE_WORKERS,
+    MIGRATION_TARGET_TABLE, SCAN_SEGMENTS, SERVING_TABLE_STATUSES, SESSION_CACHE_MAX_STALENESS_SECONDS,
+    SESSION_CACHE_SIZE, SESSION_TTL_HOURS, SHARDING_ENABLED, STREAMS_ENABLED, TABLE_LAYOUT, TABLE_NAME,
+    TOUCH_DEBOUNCE_SECONDS, TOUCH_TRACKER_SIZE, USER_INDEX_NAME,
+    active_filter, batch_session_ids, expiry_bucket, get_ttl_timestamp, new_session_item, page_request, page_token,
+    rate_limiter, readiness_monitor, request_metrics, session_etag, session_payload, session_summary,
+    summary_projection, user_index_status, wants_ndjson
+)
+from session_json import SessionJSONProvider
+from session_limiter import instrument_async, throttle_retry_after
+from session_scan import parallel_scan_async, parallel_scan_pages_async, scan_pages_async
+from session_streams import pod_stream_reader
+from session_touch import TouchTracker
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# The composite layout, its migration dual-write and sharding are served by session-api.py only
+if TABLE_LAYOUT != 'id' or MIGRATION_TARGET_TABLE or SHARDING_ENABLED:
+    raise ValueError('session-api-async.py supports a single TABLE_LAYOUT=id table without MIGRATION_TARGET_TABLE')
+
+app = Quart(__name__)
+# orjson-backed encoding; also copies stored JSON text into responses unparsed
+app.json = SessionJSONProvider(app)
+
+# Max concurrent HTTP connections to DynamoDB per process (aiobotocore defaults to 10)
+ASYNC_MAX_POOL_CONNECTIONS = int(os.environ.get('ASYNC_MAX_POOL_CONNECTIONS', '200'))
+
+# DynamoDB resource/table are opened when the server starts (inside its event loop)
+_aws = AsyncExitStack()
+dynamodb = None
+table = None
+
+# Cached result of the user index lookup (None = not checked yet)
+_user_index_active = None
+
+session_cache = SessionCache(SESSION_CACHE_SIZE, SESSION_CACHE_MAX_STALENESS_SECONDS)
+touch_tracker = TouchTracker(TOUCH_DEBOUNCE_SECONDS, TOUCH_TRACKER_SIZE)
+# Adaptive rate limit on DynamoDB calls (None = unlimited)
+limiter = rate_limiter()
+# Optional DynamoDB Streams consumer keeping session_cache coherent across replicas.
+# One worker per pod polls on its own thread with a blocking client and passes the
+# changes on to the others; the cache is thread-safe.
+streams = pod_stream_reader(session_cache, [TABLE_NAME], app.json) if STREAMS_ENABLED else None
+# Prometheus metrics served from /metrics (None = off)
+metrics = request_metrics()
+
+
+async def table_ready():
+    """Readiness check: the table exists and is serving"""
+    status = (await table.meta.client.describe_table(TableName=TABLE_NAME))['Table']['TableStatus']
+    return status in SERVING_TABLE_STATUSES, {'table_status': status}
+
+
+# /ready answers from this; item calls succeeding stand in for DescribeTable
+readiness = readiness_monitor(table_ready)
+_readiness_task = None
+
+
+@app.before_serving
+async def open_dynamodb():
+    """Create the async DynamoDB resource on the server's event loop"""
+    global dynamodb, table, _readiness_task
+    session = aioboto3.Session()
+    dynamodb = await _aws.enter_async_context(session.resource(
+        'dynamodb',
+        region_name=AWS_REGION,
+        config=Config(max_pool_connections=ASYNC_MAX_POOL_CONNECTIONS)
+    ))
+    table = await dynamodb.Table(TABLE_NAME)
+    if limiter is not None:
+        instrument_async(dynamodb.meta.client, limiter)
+    if metrics is not None:
+        metrics.observe(dynamodb.meta.client)
+    readiness.observe(dynamodb.meta.client)
+    _readiness_task = asyncio.create_task(readiness.run_async())
+    if streams is not None:
+        streams.start()
+    logger.info(f"Initialized async Session API with table: {TABLE_NAME}, region: {AWS_REGION}")
+
+
+@app.after_serving
+async def close_dynamodb():
+    """Close the DynamoDB connection pool on shutdown"""
+    if _readiness_task is not None:
+        _readiness_task.cancel()
+    if streams is not None:
+        streams.stop()
+    await _aws.aclose()
+
+
+def throttled(retry_after):
+    """429 response telling the client to back off while DynamoDB capacity is exhausted"""
+    return jsonify({'error': 'Too many requests, retry later'}), 429, {'Retry-After': str(retry_after)}
+
+
+def not_modified(etag):
+    """304 response for a client that already holds this version of a session"""
+    return Response(status=304, headers={'ETag': f'"{etag}"'})
+
+
+def session_response(payload, etag):
+    """GET /sessions/<id> response: 304 if If-None-Match already names this ETag"""
+    if etag is None:
+        return jsonify(payload), 200
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
+    response = jsonify(payload)
+    response.set_etag(etag)
+    return response, 200
+
+
+def error_response(e):
+    """Response for an unexpected error: 429 if DynamoDB (or the rate limiter) is throttling, else 500"""
+    retry_after = throttle_retry_after(e)
+    if retry_after is not None:
+        return throttled(retry_after)
+    return jsonify({'error': str(e)}), 500
+
+
+# Registered ahead of admit_request and compress, so the timing covers requests
+# it turns away and includes compressing the response
+@app.before_request
+async def start_metrics():
+    """Start timing the request and charge its DynamoDB capacity to its route"""
+    if metrics is not None:
+        metrics.start_request(request.url_rule.rule if request.url_rule else 'unmatched')
+
+
+@app.after_request
+async def record_metrics(response):
+    """Count the request by route and status and record its latency once the body is sent"""
+    if metrics is not None:
+        metrics.finish_response_async(request.method, response)
+    return response
+
+
+@app.after_request
+async def compress(response):
+    """gzip/brotli large JSON and streamed NDJSON bodies for clients that accept it"""
+    return await compress_response_async(response, request.accept_encodings)
+
+
+@app.before_request
+async def admit_request():
+    """Turn requests away up front while the DynamoDB rate limit is saturated"""
+    if limiter is None or not request.path.startswith('/sessions'):
+        return None
+    retry_after = limiter.admit()
+    if retry_after is not None:
+        return throttled(retry_after)
+    return None
+
+
+async def ndjson_sessions(items):
+    """Yield sessions as NDJSON lines while scan pages arrive"""
+    count = 0
+    try:
+        async for item in items:
+            count += 1
+            yield app.json.dumps(session_summary(item)) + '\n'
+    except Exception as e:
+        # Headers are already sent, so report the failure in-band as the last line
+        logger.error(f"Error streaming sessions after {count} items: {str(e)}")
+        yield app.json.dumps({'error': str(e)}) + '\n'
+        return
+
+    logger.info(f"Streamed {count} active sessions")
+
+
+async def user_index_available():
+    """Check whether the userId secondary index exists and is ACTIVE on the table"""
+    global _user_index_active
+    if _user_index_active is not None:
+        return _user_index_active
+
+    try:
+        description = (await table.meta.client.describe_table(TableName=TABLE_NAME))['Table']
+    except ClientError as e:
+        # Don't cache the failure - try again on the next lookup
+        logger.warning(f"Could not describe table {TABLE_NAME}: {str(e)}")
+        return False
+
+    status = user_index_status(description)
+    if status is None:
+        # Still backfilling - scan for now and check again next time
+        return False
+    _user_index_active = status
+    return status
+
+
+async def paginate(operation, **kwargs):
+    """Collect items from a Scan/Query, following LastEvaluatedKey across pages (>1MB)"""
+    items = []
+    async for response in scan_pages_async(operation, **kwargs):
+        items.extend(response.get('Items', []))
+    return items
+
+
+async def user_lookup(user_id):
+    """Return (operation, kwargs, source) reading a user's sessions: index query or filtered scan"""
+    if await user_index_available():
+        # Oldest first, ordered by the createdAt sort key
+        return table.query, {
+            'IndexName': USER_INDEX_NAME,
+            'KeyConditionExpression': Key('userId').eq(user_id),
+            'FilterExpression': active_filter()
+        }, 'index'
+    return table.scan, {'FilterExpression': Attr('userId').eq(user_id) & active_filter()}, 'scan'
+
+
+def forget_user_index(e):
+    """Reset the index check when a query reports the index is gone; re-raise anything else"""
+    global _user_index_active
+    if e.response['Error']['Code'] != 'ValidationException' or not _user_index_active:
+        raise e
+    logger.warning(f"Query on index {USER_INDEX_NAME} failed, falling back to scan: {str(e)}")
+    _user_index_active = None
+
+
+async def fetch_user_items(user_id):
+    """Fetch all session items for a user via the userId index, or a filtered scan without it"""
+    operation, kwargs, _ = await user_lookup(user_id)
+    try:
+        return await paginate(operation, **kwargs)
+    except ClientError as e:
+        # Index was removed after we checked - forget it and fall back to the scan
+        forget_user_index(e)
+
+    return await paginate(table.scan, FilterExpression=Attr('userId').eq(user_id) & active_filter())
+
+
+async def user_session_ids(user_id):
+    """Return (session IDs, source) for all of a user's sessions, expired ones included
+
+    Reads only the keys: from the userId index if it is available, else
+    with a parallel filtered scan.
+    """
+    keys_only = {'ProjectionExpression': '#id', 'ExpressionAttributeNames': {'#id': 'id'}}
+    if await user_index_available():
+        try:
+            items = await paginate(
+                table.query, IndexName=USER_INDEX_NAME, KeyConditionExpression=Key('userId').eq(user_id), **keys_only
+            )
+            return [item['id'] for item in items], 'index'
+        except ClientError as e:
+            # Index was removed after we checked - forget it and fall back to the scan
+            forget_user_index(e)
+
+    items = parallel_scan_async(table.scan, SCAN_SEGMENTS, FilterExpression=Attr('userId').eq(user_id), **keys_only)
+    return [item['id'] async for item in items], 'scan'
+
+
+async def count_matches(pages):
+    """Sum Count/ScannedCount over Select=COUNT responses"""
+    count = 0
+    scanned = 0
+    async for response in pages:
+        count += response['Count']
+        scanned += response['ScannedCount']
+    return count, scanned
+
+
+async def read_page(operation, limit, start_key=None, **kwargs):
+    """Read up to `limit` items from a Scan/Query, starting after start_key
+
+    Keeps reading while pages come back short (items removed by the
+    FilterExpression) and returns (items, last_evaluated_key).
+    """
+    items = []
+    last_key = start_key
+    while len(items) < limit:
+        if last_key:
+            kwargs['ExclusiveStartKey'] = last_key
+        # Limit caps evaluated items, so this page can't overshoot the request
+        response = await operation(Limit=limit - len(items), **kwargs)
+        items.extend(response.get('Items', []))
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            break
+    return items, last_key
+
+
+@app.route('/health', methods=['GET'])
+async def health():
+    """Health check endpoint"""
+    return jsonify({
+        'status': 'healthy',
+        'service': 'session-api',
+        'timestamp': datetime.utcnow().isoformat()
+    }), 200
+
+
+@app.route('/ready', methods=['GET'])
+async def ready():
+    """Readiness check - DynamoDB table state as last refreshed in the background"""
+    is_ready, body = readiness.status()
+    return jsonify(body), 200 if is_ready else 503
+
+
+@app.route('/ready/stats', methods=['GET'])
+async def ready_stats():
+    """Readiness check/short-circuit/throttle counters"""
+    return jsonify(readiness.stats()), 200
+
+
+@app.route('/cache/stats', methods=['GET'])
+async def cache_stats():
+    """Session cache hit/miss/eviction counters"""
+    return jsonify(session_cache.stats()), 200
+
+
+@app.route('/touch/stats', methods=['GET'])
+async def touch_stats():
+    """Touch write/debounce counters"""
+    return jsonify(touch_tracker.stats()), 200
+
+
+@app.route('/rate-limit/stats', methods=['GET'])
+async def rate_limit_stats():
+    """DynamoDB rate limiter rate, tokens and throttle/rejection counters"""
+    if limiter is None:
+        return jsonify({'enabled': False}), 200
+    return jsonify(limiter.stats()), 200
+
+
+@app.route('/streams/stats', methods=['GET'])
+async def streams_stats():
+    """Stream consumer lag, checkpoints and cache eviction counters"""
+    if streams is None:
+        return jsonify({'enabled': False}), 200
+    return jsonify(streams.stats()), 200
+
+
+@app.route('/metrics', methods=['GET'])
+async def metrics_endpoint():
+    """Prometheus metrics for this worker process"""
+    if metrics is None:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/sessions', methods=['POST'])
+async def create_session():
+    """Create a new user session"""
+    try:
+        data = await request.get_json()
+
+        if not data or 'userId' not in data:
+            return jsonify({'error': 'userId is required'}), 400
+
+        user_id = data['userId']
+        session_data = data.get('data', {})
+
+        # Create session item with generated ID and TTL
+        item = new_session_item(user_id, session_data)
+        session_id = item['id']
+        ttl = item['ttl']
+
+        # Put item in DynamoDB
+        await table.put_item(Item=item)
+
+        # Sessions are usually read right after login, so warm the cache
+        session_cache.put(session_id, session_payload(item, session_data), ttl, etag=session_etag(item))
+
+        logger.info(f"Created session {session_id} for user {user_id}")
+
+        return jsonify({
+            'sessionId': session_id,
+            'userId': user_id,
+            'expiresAt': datetime.fromtimestamp(ttl, tz=timezone.utc).isoformat(),
+            'data': session_data
+        }), 201
+
+    except Exception as e:
+        logger.error(f"Error creating session: {str(e)}")
+        return error_response(e)
+
+
+@app.route('/sessions/<session_id>', methods=['GET'])
+async def get_session(session_id):
+    """Retrieve a session by ID"""
+    try:
+        # Cache entries never outlive the session's TTL, so a hit is always active,
+        # and its ETag lets a conditional GET finish without touching DynamoDB
+        cached = session_cache.get_with_etag(session_id)
+        if cached is not None:
+            return session_response(*cached)
+
+        generation = session_cache.generation()
+        response = await table.get_item(Key={'id': session_id})
+
+        if 'Item' not in response:
+            return jsonify({'error': 'Session not found'}), 404
+
+        item = response['Item']
+
+        # Check if session has expired
+        if int(item['ttl']) < int(time.time()):
+            return jsonify({'error': 'Session has expired'}), 410
+
+        etag = session_etag(item)
+        if request.if_none_match.contains_weak(etag):
+            # Unchanged - skip decoding and encoding the data
+            return not_modified(etag)
+
+        payload = session_payload(item, decode_data(item['data']))
+        session_cache.put(session_id, payload, item['ttl'], generation, etag=etag)
+
+        return session_response(payload, etag)
+
+    except Exception as e:
+        logger.error(f"Error retrieving session {session_id}: {str(e)}")
+        return error_response(e)
+
+
+@app.route('/sessions/<session_id>', methods=['PUT'])
+async def update_session(session_id):
+    """Update a session's data"""
+    try:
+        data = await request.get_json()
+
+        if not data:
+            return jsonify({'error': 'Request body is required'}), 400
+
+        session_data = data.get('data', {})
+
+        # Update the session data
+        response = await table.update_item(
+            Key={'id': session_id},
+            UpdateExpression='SET #data = :data, updatedAt = :updated',
+            ConditionExpression='attribute_exists(id)',
+            ExpressionAttributeNames={'#data': 'data'},
+            ExpressionAttributeValues={
+                ':data': encode_data(session_data),
+                ':updated': datetime.utcnow().isoformat()
+            },
+            ReturnValues='ALL_NEW'
+        )
+        session_cache.invalidate(session_id)
+
+        item = response['Attributes']
+
+        logger.info(f"Updated session {session_id}")
+
+        return jsonify({
+            'sessionId': item['id'],
+            'userId': item['userId'],
+            'data': decode_data(item['data']),
+            'updatedAt': item.get('updatedAt', item['createdAt'])
+        }), 200
+
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            # Deleted elsewhere - make sure we don't keep serving it
+            session_cache.invalidate(session_id)
+            return jsonify({'error': 'Session not found'}), 404
+        logger.error(f"Error updating session {session_id}: {str(e)}")
+        return error_response(e)
+    except Exception as e:
+        logger.error(f"Error updating session {session_id}: {str(e)}")
+        return error_response(e)
+
+
+@app.route('/sessions/<session_id>', methods=['DELETE'])
+async def delete_session(session_id):
+    """Delete a session"""
+    try:
+        await table.delete_item(Key={'id': session_id})
+        session_cache.invalidate(session_id)
+        touch_tracker.forget(session_id)
+
+        logger.info(f"Deleted session {session_id}")
+
+        return jsonify({'message': 'Session deleted successfully'}), 200
+
+    except Exception as e:
+        logger.error(f"Error deleting session {session_id}: {str(e)}")
+        return error_response(e)
+
+
+@app.route('/sessions/<session_id>/touch', methods=['POST'])
+async def touch_session(session_id):
+    """Extend a session's expiry (sliding expiration) without rewriting its data"""
+    try:
+        ttl = get_ttl_timestamp(SESSION_TTL_HOURS)
+        written = touch_tracker.claim(session_id, ttl)
+        if written is not None:
+            # Touched recently - the TTL written then is close enough
+            return jsonify({
+                'sessionId': session_id,
+                'expiresAt': datetime.fromtimestamp(written, tz=timezone.utc).isoformat(),
+                'extended': False
+            }), 200
+
+        try:
+            await table.update_item(
+                Key={'id': session_id},
+                UpdateExpression='SET #ttl = :ttl, expiryBucket = :bucket',
+                ConditionExpression='attribute_exists(id) AND #ttl > :now',
+                ExpressionAttributeNames={'#ttl': 'ttl'},
+                ExpressionAttributeValues={
+                    ':ttl': ttl,
+                    ':bucket': expiry_bucket(session_id, ttl),
+                    ':now': int(time.time())
+                },
+                ReturnValuesOnConditionCheckFailure='ALL_OLD'
+            )
+        except ClientError as e:
+            touch_tracker.forget(session_id)
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            session_cache.invalidate(session_id)
+            if 'Item' in e.response:
+                return jsonify({'error': 'Session has expired'}), 410
+            return jsonify({'error': 'Session not found'}), 404
+        except Exception:
+            touch_tracker.forget(session_id)
+            raise
+
+        # Cached payloads carry the old expiresAt
+        session_cache.invalidate(session_id)
+
+        return jsonify({
+            'sessionId': session_id,
+            'expiresAt': datetime.fromtimestamp(ttl, tz=timezone.utc).isoformat(),
+            'extended': True
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Error touching session {session_id}: {str(e)}")
+        return error_response(e)
+
+
+@app.route('/sessions:batchCreate', methods=['POST'])
+async def batch_create_sessions():
+    """Create many sessions with BatchWriteItem, reporting a result per entry"""
+    try:
+        data = await request.get_json()
+
+        if not data or not isinstance(data.get('sessions'), list):
+            return jsonify({'error': 'sessions must be a list'}), 400
+        if len(data['sessions']) > BATCH_MAX_ITEMS:
+            return jsonify({'error': f'at most {BATCH_MAX_ITEMS} sessions per request'}), 400
+
+        results = []
+        items = {}
+        for index, entry in enumerate(data['sessions']):
+            if not isinstance(entry, dict) or 'userId' not in entry:
+                results.append({'index': index, 'status': 400, 'error': 'userId is required'})
+                continue
+
+            item = new_session_item(entry['userId'], entry.get('data', {}))
+            items[item['id']] = (index, item, entry.get('data', {}))
+            results.append(None)
+
+        failed = await batch_write_async(
+            dynamodb, TABLE_NAME,
+            [{'PutRequest': {'Item': item}} for _, item, _ in items.values()],
+            max_retries=BATCH_MAX_RETRIES, base_delay=BATCH_RETRY_BASE_DELAY
+        )
+        errors = {write['PutRequest']['Item']['id']: error for write, error in failed}
+
+        for session_id, (index, item, session_data) in items.items():
+            if session_id in errors:
+                results[index] = {'index': index, 'status': 500, 'error': errors[session_id]}
+                continue
+
+            session_cache.put(session_id, session_payload(item, session_data), item['ttl'], etag=session_etag(item))
+            results[index] = {
+                'index': index,
+                'status': 201,
+                'sessionId': session_id,
+                'userId': item['userId'],
+                'expiresAt': datetime.fromtimestamp(item['ttl'], tz=timezone.utc).isoformat(),
+                'data': session_data
+            }
+
+        created = sum(1 for result in results if result['status'] == 201)
+        logger.info(f"Batch created {created}/{len(results)} sessions")
+
+        return jsonify({
+            'created': created,
+            'failed': len(results) - created,
+            'results': results
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Error batch creating sessions: {str(e)}")
+        return error_response(e)
+
+
+@app.route('/sessions:batchGet', methods=['POST'])
+async def batch_get_sessions():
+    """Retrieve many sessions with BatchGetItem, reporting a result per ID"""
+    try:
+        session_ids, error = batch_session_ids(await request.get_json())
+        if error:
+            return jsonify({'error': error}), 400
+
+        # Serve what we can from the cache, fetch the rest
+        payloads = {}
+        for session_id in session_ids:
+            payload = session_cache.get(session_id)
+            if payload is not None:
+                payloads[session_id] = payload
+
+        generation = session_cache.generation()
+        items, failed = await batch_get_async(
+            dynamodb, TABLE_NAME,
+            [{'id': session_id} for session_id in session_ids if session_id not in payloads],
+            max_retries=BATCH_MAX_RETRIES, base_delay=BATCH_RETRY_BASE_DELAY
+        )
+        errors = {key['id']: error for key, error in failed}
+        found = {item['id']: item for item in items}
+        current_time = int(time.time())
+
+        results = []
+        for session_id in session_ids:
+            if session_id in payloads:
+                results.append({'sessionId': session_id, 'status': 200, 'session': payloads[session_id]})
+            elif session_id in errors:
+                results.append({'sessionId': session_id, 'status': 500, 'error': errors[session_id]})
+            elif session_id not in found:
+                results.append({'sessionId': session_id, 'status': 404, 'error': 'Session not found'})
+            elif int(found[session_id]['ttl']) < current_time:
+                results.append({'sessionId': session_id, 'status': 410, 'error': 'Session has expired'})
+            else:
+                item = found[session_id]
+                payload = session_payload(item, decode_data(item['data']))
+                session_cache.put(session_id, payload, item['ttl'], generation, etag=session_etag(item))
+                results.append({'sessionId': session_id, 'status': 200, 'session': payload})
+
+        return jsonify({
+            'found': sum(1 for result in results if result['status'] == 200),
+            'results': results
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Error batch retrieving sessions: {str(e)}")
+        return error_response(e)
+
+
+@app.route('/sessions:batchDelete', methods=['POST'])
+async def batch_delete_sessions():
+    """Delete many sessions with BatchWriteItem, reporting a result per ID"""
+    try:
+        session_ids, error = batch_session_ids(await request.get_json())
+        if error:
+            return jsonify({'error': error}), 400
+
+        failed = await batch_write_async(
+            dynamodb, TABLE_NAME,
+            [{'DeleteRequest': {'Key': {'id': session_id}}} for session_id in session_ids],
+            max_retries=BATCH_MAX_RETRIES, base_delay=BATCH_RETRY_BASE_DELAY
+        )
+        errors = {write['DeleteRequest']['Key']['id']: error for write, error in failed}
+
+        results = []
+        for session_id in session_ids:
+            session_cache.invalidate(session_id)
+            touch_tracker.forget(session_id)
+            if session_id in errors:
+                results.append({'sessionId': session_id, 'status': 500, 'error': errors[session_id]})
+            else:
+                results.append({'sessionId': session_id, 'status': 200})
+
+        deleted = len(session_ids) - len(errors)
+        logger.info(f"Batch deleted {deleted}/{len(session_ids)} sessions")
+
+        return jsonify({
+            'deleted': deleted,
+            'failed': len(errors),
+            'results': results
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Error batch deleting sessions: {str(e)}")
+        return error_response(e)
+
+
+@app.route('/sessions/user/<user_id>', methods=['GET'])
+async def get_user_sessions(user_id):
+    """Get all sessions for a specific user"""
+    try:
+        operation, kwargs, source = await user_lookup(user_id)
+        scope = f'user:{user_id}:{source}'
+        try:
+            limit, start_key = page_request(request.args, scope)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        next_token = None
+        if limit is not None:
+            # One page of up to `limit` sessions
+            try:
+                items, last_key = await read_page(operation, limit, start_key, **kwargs)
+            except ClientError as e:
+                forget_user_index(e)
+                raise
+            next_token = page_token(scope, last_key)
+        else:
+            # Query the userId index (if created) or scan with filter, with pagination support
+            items = await fetch_user_items(user_id)
+
+        # Expired sessions were already filtered out server-side
+        active_sessions = [session_payload(item, decode_data(item['data'])) for item in items]
+
+        body = {
+            'userId': user_id,
+            'sessionCount': len(active_sessions),
+            'sessions': active_sessions
+        }
+        if limit is not None:
+            body['nextToken'] = next_token
+        return jsonify(body), 200
+
+    except Exception as e:
+        logger.error(f"Error retrieving sessions for user {user_id}: {str(e)}")
+        return error_response(e)
+
+
+@app.route('/sessions/user/<user_id>', methods=['DELETE'])
+async def delete_user_sessions(user_id):
+    """Delete all of a user's sessions (forced logout) with concurrent BatchWriteItem calls"""
+    try:
+        session_ids, source = await user_session_ids(user_id)
+        failed = await parallel_batch_write_async(
+            dynamodb, TABLE_NAME,
+            [{'DeleteRequest': {'Key': {'id': session_id}}} for session_id in session_ids],
+            BATCH_WRITE_WORKERS, max_retries=BATCH_MAX_RETRIES, base_delay=BATCH_RETRY_BASE_DELAY
+        )
+        failed_ids = [write['DeleteRequest']['Key']['id'] for write, _ in failed]
+
+        for session_id in session_ids:
+            session_cache.invalidate(session_id)
+            touch_tracker.forget(session_id)
+
+        deleted = len(session_ids) - len(failed_ids)
+        logger.info(f"Deleted {deleted}/{len(session_ids)} sessions of user {user_id} (keys via {source})")
+
+        # Deletes are idempotent: repeat the call to retry failed ones
+        return jsonify({
+            'userId': user_id,
+            'deleted': deleted,
+            'failed': len(failed_ids),
+            'failedSessionIds': failed_ids
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Error deleting sessions for user {user_id}: {str(e)}")
+        return error_response(e)
+
+
+@app.route('/sessions/user/<user_id>/count', methods=['GET'])
+async def count_user_sessions(user_id):
+    """Count a user's active sessions without fetching them"""
+    try:
+        operation, kwargs, _ = await user_lookup(user_id)
+        try:
+            count, _ = await count_matches(scan_pages_async(operation, Select='COUNT', **kwargs))
+        except ClientError as e:
+            forget_user_index(e)
+            count, _ = await count_matches(scan_pages_async(
+                table.scan, Select='COUNT',
+                FilterExpression=Attr('userId').eq(user_id) & active_filter()
+            ))
+
+        return jsonify({
+            'userId': user_id,
+            'sessionCount': count
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Error counting sessions for user {user_id}: {str(e)}")
+        return error_response(e)
+
+
+@app.route('/sessions/count', methods=['GET'])
+async def count_sessions():
+    """Count all active sessions (admin endpoint) without fetching them"""
+    try:
+        # Parallel segmented scan returning only counts - no items are materialized
+        count, scanned = await count_matches(parallel_scan_pages_async(
+            table.scan, SCAN_SEGMENTS,
+            Select='COUNT', FilterExpression=active_filter()
+        ))
+
+        return jsonify({
+            'sessionCount': count,
+            'scannedCount': scanned
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Error counting sessions: {str(e)}")
+        return error_response(e)
+
+
+@app.route('/sessions', methods=['GET'])
+async def list_sessions():
+    """List all active sessions (admin endpoint)"""
+    try:
+        try:
+            limit, start_key = page_request(request.args, 'all')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if limit is not None:
+            # One page of up to `limit` sessions
+            items, last_key = await read_page(
+                table.scan, limit, start_key,
+                FilterExpression=active_filter(), **summary_projection()
+            )
+            return jsonify({
+                'sessionCount': len(items),
+                'sessions': [session_summary(item) for item in items],
+                'nextToken': page_token('all', last_key)
+            }), 200
+
+        # Parallel segmented scan, each segment paginated for large result sets (>1MB)
+        # Only active sessions, without the data blob
+        items = parallel_scan_async(
+            table.scan, SCAN_SEGMENTS,
+            FilterExpression=active_filter(), **summary_projection()
+        )
+
+        # Streaming mode: one session per line, sent as each scan page arrives
+        if wants_ndjson(request):
+            return Response(ndjson_sessions(items), mimetype='application/x-ndjson')
+
+        # Expired sessions were already filtered out server-side
+        active_sessions = [session_summary(item) async for item in items]
+
+        return jsonify({
+            'sessionCount': len(active_sessions),
+            'sessions': active_sessions
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Error listing sessions: {str(e)}")
+        return error_response(e)
+
+
+if __name__ == '__main__':
+    # Development server only - the container runs uvicorn (see Dockerfile.async)
+    port = int(os.environ.get('PORT', 8080))
+    app.run(host='0.0.0.0', port=port)
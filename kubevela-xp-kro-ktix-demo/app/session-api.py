@@ -4,37 +4,412 @@ A simple REST API for managing user sessions with automatic TTL expiration
 """
 
 import os
-import json
 import time
-import uuid
+import atexit
 import logging
-from datetime import datetime, timedelta, timezone
-from flask import Flask, request, jsonify
-import boto3
+from datetime import datetime, timezone
+from itertools import chain
+from flask import Flask, Response, request, jsonify
+from boto3.dynamodb.conditions import Attr, Key
 from botocore.exceptions import ClientError
 
+from session_batch import batch_get, batch_write, parallel_batch_write
+from session_cache import SessionCache
+from session_codec import decode_data, encode_data
+from session_compress import compress_response
+from session_common import (
+    AWS_REGION, BATCH_MAX_ITEMS, BATCH_MAX_RETRIES, BATCH_RETRY_BASE_DELAY, BATCH_WRITE_WORKERS, KEY_ATTRIBUTES,
+    SCAN_MAX_WORKERS, SCAN_SEGMENTS, SERVING_TABLE_STATUSES,
+    SESSION_CACHE_MAX_STALENESS_SECONDS, SESSION_CACHE_SIZE, SESSION_TTL_HOURS, STREAMS_ENABLED, SWEEPER_ENABLED,
+    TABLE_LAYOUT, TOUCH_DEBOUNCE_SECONDS, TOUCH_TRACKER_SIZE, USER_INDEX_NAME, WRITE_BEHIND_ENABLED,
+    WRITE_BEHIND_ENQUEUE_TIMEOUT, WRITE_BEHIND_FLUSH_INTERVAL, WRITE_BEHIND_FLUSHERS, WRITE_BEHIND_MAX_PENDING,
+    WRITE_BEHIND_SETTLE_TIMEOUT,
+    active_filter, batch_session_ids, expiry_bucket, get_ttl_timestamp, key_session_id, new_session_item,
+    page_request, page_token, rate_limiter, readiness_monitor, request_metrics, session_etag, session_key,
+    session_payload, session_summary, summary_projection, user_index_status, wants_ndjson
+)
+from session_json import SessionJSONProvider
+from session_limiter import fail_fast, instrument, throttle_retry_after
+from session_migrate import dual_writer
+from session_scan import parallel_scan, parallel_scan_pages, scan_pages
+from session_shard import shard_router
+from session_streams import pod_stream_reader
+from session_sweeper import SessionSweeper
+from session_touch import TouchTracker
+from session_writer import WriteBehindQueue
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+# orjson-backed encoding; also copies stored JSON text into responses unparsed
+app.json = SessionJSONProvider(app)
+
+# Initialize DynamoDB clients: one Shard per session table (just DYNAMODB_TABLE_NAME
+# unless SHARD_TABLES / SHARD_TENANT_TABLES are set). Single-session reads/writes use
+# its low-level store; scans, queries and batches keep the resource API for its
+# condition expression builders
+shards = shard_router()
+
+# An adaptive rate limit per table across both its clients (None = unlimited),
+# so one throttled shard doesn't slow the others down
+for shard in shards:
+    shard.limiter = rate_limiter()
+    if shard.limiter is not None:
+        for client in shard.clients:
+            instrument(client, shard.limiter)
+
+# Mirrors session writes to MIGRATION_TARGET_TABLE during a layout migration (None = not migrating)
+migration = dual_writer()
+if migration is not None:
+    for client in shards.default.clients:
+        migration.observe(client)
+
+# Prometheus metrics served from /metrics (None = off). Observing after the limiter
+# keeps its wait for capacity out of the AWS call latency
+metrics = request_metrics()
+if metrics is not None:
+    for shard in shards:
+        for client in shard.clients:
+            metrics.observe(client)
+
+
+def table_ready():
+    """Readiness check: every session table exists and is serving"""
+    statuses = {
+        shard.name: shard.table.meta.client.describe_table(TableName=shard.name)['Table']['TableStatus']
+        for shard in shards
+    }
+    ready = all(status in SERVING_TABLE_STATUSES for status in statuses.values())
+    if len(statuses) == 1:
+        return ready, {'table_status': statuses[shards.default.name]}
+    return ready, {'table_statuses': statuses}
+
+
+# /ready answers from this; item calls succeeding stand in for DescribeTable
+readiness = readiness_monitor(table_ready)
+for shard in shards:
+    for client in shard.clients:
+        readiness.observe(client)
+readiness.start()
+
+session_cache = SessionCache(SESSION_CACHE_SIZE, SESSION_CACHE_MAX_STALENESS_SECONDS)
+touch_tracker = TouchTracker(TOUCH_DEBOUNCE_SECONDS, TOUCH_TRACKER_SIZE)
+
+for shard in shards:
+    # Optional write-behind queue for new sessions (None = write synchronously)
+    if WRITE_BEHIND_ENABLED:
+        shard.write_behind = WriteBehindQueue(
+            shard.dynamodb, shard.name, WRITE_BEHIND_MAX_PENDING, WRITE_BEHIND_FLUSH_INTERVAL,
+            WRITE_BEHIND_ENQUEUE_TIMEOUT, flushers=WRITE_BEHIND_FLUSHERS,
+            max_retries=BATCH_MAX_RETRIES, base_delay=BATCH_RETRY_BASE_DELAY
+        )
+        shard.write_behind.start()
+        # Runs when the gunicorn worker exits after SIGTERM, once in-flight requests are done
+        atexit.register(shard.write_behind.close)
+
+    # Optional in-process expired-session sweeper; every worker that enables it
+    # sweeps, so prefer the session_sweeper.py CronJob for multi-worker deployments
+    if SWEEPER_ENABLED:
+        shard.sweeper = SessionSweeper(shard.dynamodb, shard.name)
+        shard.sweeper.start()
+        atexit.register(shard.sweeper.stop)
+
+# Optional DynamoDB Streams consumer: one worker per pod reads every table's stream and
+# evicts sessions other replicas changed from all the pod's caches, which lets cached
+# sessions live longer while it keeps up (None = off)
+stream_reader = None
+if STREAMS_ENABLED:
+    stream_reader = pod_stream_reader(session_cache, [shard.name for shard in shards], app.json)
+    stream_reader.start()
+    atexit.register(stream_reader.stop)
+
+logger.info(f"Initialized Session API with tables: {', '.join(shard.name for shard in shards)}, region: {AWS_REGION}")
+
+
+def ndjson_sessions(items):
+    """Yield sessions as NDJSON lines while scan pages arrive"""
+    count = 0
+    try:
+        for item in items:
+            count += 1
+            yield app.json.dumps(session_summary(item)) + '\n'
+    except Exception as e:
+        # Headers are already sent, so report the failure in-band as the last line
+        logger.error(f"Error streaming sessions after {count} items: {str(e)}")
+        yield app.json.dumps({'error': str(e)}) + '\n'
+        return
+
+    logger.info(f"Streamed {count} active sessions")
+
+
+def user_index_available(shard):
+    """Check whether the userId secondary index exists and is ACTIVE on the shard's table"""
+    if shard.user_index_active is not None:
+        return shard.user_index_active
+
+    try:
+        description = shard.table.meta.client.describe_table(TableName=shard.name)['Table']
+    except ClientError as e:
+        # Don't cache the failure - try again on the next lookup
+        logger.warning(f"Could not describe table {shard.name}: {str(e)}")
+        return False
+
+    status = user_index_status(description)
+    if status is None:
+        # Still backfilling - scan for now and check again next time
+        return False
+    shard.user_index_active = status
+    return status
+
+
+def pending_session(shard, session_id):
+    """Return a session still waiting in the write-behind queue, so this process reads its own writes"""
+    if shard.write_behind is None:
+        return None
+    return shard.write_behind.get(session_id)
+
+
+def settle_session(shard, session_id):
+    """Wait for a queued write of this session to land before changing it; False on timeout"""
+    return shard.write_behind is None or shard.write_behind.settle(session_id, WRITE_BEHIND_SETTLE_TIMEOUT)
+
+
+def shard_stats(component):
+    """Stats route body for a per-shard worker: its stats with one table, keyed by table with several"""
+    workers = {shard.name: component(shard) for shard in shards}
+    if all(worker is None for worker in workers.values()):
+        return {'enabled': False}
+    if len(workers) == 1:
+        return workers[shards.default.name].stats()
+    return {
+        'enabled': True,
+        'shards': {name: worker.stats() for name, worker in workers.items() if worker is not None}
+    }
+
+
+def write_backlog():
+    """503 response telling the client to back off while queued session writes catch up"""
+    return jsonify({'error': 'Session writes are backed up, retry later'}), 503, {'Retry-After': '1'}
+
+
+def throttled(retry_after):
+    """429 response telling the client to back off while DynamoDB capacity is exhausted"""
+    return jsonify({'error': 'Too many requests, retry later'}), 429, {'Retry-After': str(retry_after)}
+
+
+def not_modified(etag):
+    """304 response for a client that already holds this version of a session"""
+    return Response(status=304, headers={'ETag': f'"{etag}"'})
+
+
+def session_response(payload, etag):
+    """GET /sessions/<id> response: 304 if If-None-Match already names this ETag"""
+    if etag is None:
+        return jsonify(payload), 200
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
+    response = jsonify(payload)
+    response.set_etag(etag)
+    return response, 200
+
+
+def error_response(e):
+    """Response for an unexpected error: 429 if DynamoDB (or the rate limiter) is throttling, else 500"""
+    retry_after = throttle_retry_after(e)
+    if retry_after is not None:
+        return throttled(retry_after)
+    return jsonify({'error': str(e)}), 500
+
+
+# Registered ahead of admit_request and compress, so the timing covers requests
+# it turns away and includes compressing the response
+@app.before_request
+def start_metrics():
+    """Start timing the request and charge its DynamoDB capacity to its route"""
+    if metrics is not None:
+        metrics.start_request(request.url_rule.rule if request.url_rule else 'unmatched')
+
+
+@app.after_request
+def record_metrics(response):
+    """Count the request by route and status and record its latency once the body is sent"""
+    if metrics is not None:
+        metrics.finish_response(request.method, response)
+    return response
+
+
+@app.after_request
+def compress(response):
+    """gzip/brotli large JSON and streamed NDJSON bodies for clients that accept it"""
+    return compress_response(response, request.accept_encodings)
+
+
+def request_shard():
+    """The shard a request works on, or None if it spans shards (or names no session)"""
+    if len(shards) == 1:
+        return shards.default
+    args = request.view_args or {}
+    if 'session_id' in args:
+        return shards.for_session(args['session_id'])
+    if 'user_id' in args:
+        return shards.for_user(args['user_id'])
+    return None
+
+
+@app.before_request
+def admit_request():
+    """Turn requests away up front while their table's DynamoDB rate limit is saturated"""
+    if not request.path.startswith('/sessions'):
+        return None
+    shard = request_shard()
+    if shard is None:
+        # Calls to any shard still fail fast instead of queueing
+        fail_fast()
+        return None
+    if shard.limiter is None:
+        return None
+    retry_after = shard.limiter.admit()
+    if retry_after is not None:
+        return throttled(retry_after)
+    return None
+
+
+def paginate(operation, **kwargs):
+    """Yield items from a Scan/Query, following LastEvaluatedKey across pages (>1MB)"""
+    for response in scan_pages(operation, **kwargs):
+        yield from response.get('Items', [])
+
+
+def user_lookup(shard, user_id):
+    """Return (operation, kwargs, source) reading a user's sessions: table or index query, or filtered scan"""
+    table = shard.table
+    if TABLE_LAYOUT == 'composite':
+        # The user's partition, oldest first by the createdAtId sort key
+        return table.query, {
+            'KeyConditionExpression': Key('userId').eq(user_id),
+            'FilterExpression': active_filter()
+        }, 'table'
+    if user_index_available(shard):
+        # Oldest first, ordered by the createdAt sort key
+        return table.query, {
+            'IndexName': USER_INDEX_NAME,
+            'KeyConditionExpression': Key('userId').eq(user_id),
+            'FilterExpression': active_filter()
+        }, 'index'
+    return table.scan, {'FilterExpression': Attr('userId').eq(user_id) & active_filter()}, 'scan'
+
+
+def forget_user_index(shard, e):
+    """Reset the index check when a query reports the index is gone; re-raise anything else"""
+    if e.response['Error']['Code'] != 'ValidationException' or not shard.user_index_active:
+        raise e
+    logger.warning(f"Query on index {USER_INDEX_NAME} of {shard.name} failed, falling back to scan: {str(e)}")
+    shard.user_index_active = None
 
-# Configuration from environment variables
-TABLE_NAME = os.environ.get('DYNAMODB_TABLE_NAME', 'tenant-atlantis-user-sessions-kratix')
-AWS_REGION = os.environ.get('AWS_REGION', 'us-west-2')
-SESSION_TTL_HOURS = int(os.environ.get('SESSION_TTL_HOURS', '24'))
 
-# Initialize DynamoDB client
-dynamodb = boto3.resource('dynamodb', region_name=AWS_REGION)
-table = dynamodb.Table(TABLE_NAME)
+def fetch_user_items(shard, user_id):
+    """Fetch all session items for a user via the userId index, or a filtered scan without it"""
+    operation, kwargs, _ = user_lookup(shard, user_id)
+    try:
+        return list(paginate(operation, **kwargs))
+    except ClientError as e:
+        # Index was removed after we checked - forget it and fall back to the scan
+        forget_user_index(shard, e)
+
+    return list(paginate(shard.table.scan, FilterExpression=Attr('userId').eq(user_id) & active_filter()))
+
+
+def user_session_keys(shard, user_id):
+    """Return (table keys, source) for all of a user's sessions, expired ones included
+
+    Reads only the keys: from the user's partition in the composite layout,
+    the userId index if it is available, else with a parallel filtered scan.
+    """
+    keys_only = {
+        'ProjectionExpression': ', '.join(f'#k{n}' for n in range(len(KEY_ATTRIBUTES))),
+        'ExpressionAttributeNames': {f'#k{n}': name for n, name in enumerate(KEY_ATTRIBUTES)}
+    }
+    table = shard.table
+    if TABLE_LAYOUT == 'composite':
+        items = paginate(table.query, KeyConditionExpression=Key('userId').eq(user_id), **keys_only)
+        return [session_key(item) for item in items], 'table'
+    if user_index_available(shard):
+        try:
+            items = paginate(
+                table.query, IndexName=USER_INDEX_NAME, KeyConditionExpression=Key('userId').eq(user_id), **keys_only
+            )
+            return [session_key(item) for item in items], 'index'
+        except ClientError as e:
+            # Index was removed after we checked - forget it and fall back to the scan
+            forget_user_index(shard, e)
+
+    items = parallel_scan(
+        table.scan, SCAN_SEGMENTS, SCAN_MAX_WORKERS, FilterExpression=Attr('userId').eq(user_id), **keys_only
+    )
+    return [session_key(item) for item in items], 'scan'
+
+
+def count_matches(pages):
+    """Sum Count/ScannedCount over Select=COUNT responses"""
+    count = 0
+    scanned = 0
+    for response in pages:
+        count += response['Count']
+        scanned += response['ScannedCount']
+    return count, scanned
+
+
+def read_page(operation, limit, start_key=None, **kwargs):
+    """Read up to `limit` items from a Scan/Query, starting after start_key
+
+    Keeps reading while pages come back short (items removed by the
+    FilterExpression) and returns (items, last_evaluated_key).
+    """
+    items = []
+    last_key = start_key
+    while len(items) < limit:
+        if last_key:
+            kwargs['ExclusiveStartKey'] = last_key
+        # Limit caps evaluated items, so this page can't overshoot the request
+        response = operation(Limit=limit - len(items), **kwargs)
+        items.extend(response.get('Items', []))
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            break
+    return items, last_key
+
 
-logger.info(f"Initialized Session API with table: {TABLE_NAME}, region: {AWS_REGION}")
+def read_shards_page(limit, start_key=None, **kwargs):
+    """read_page over a Scan of every shard table in turn
 
+    With one table the key is its LastEvaluatedKey; with several it is
+    {'table': ..., 'key': ...} so the next page resumes in the right table.
+    """
+    if len(shards) == 1:
+        if start_key is not None and set(start_key) != set(KEY_ATTRIBUTES):
+            # Issued while several tables were configured
+            raise ValueError('nextToken is invalid')
+        return read_page(shards.default.table.scan, limit, start_key, **kwargs)
 
-def get_ttl_timestamp(hours_from_now):
-    """Calculate Unix timestamp for TTL expiration"""
-    expiration_time = datetime.utcnow() + timedelta(hours=hours_from_now)
-    return int(expiration_time.timestamp())
+    names = [shard.name for shard in shards]
+    position = start_key or {'table': names[0], 'key': None}
+    if position.get('table') not in names:
+        # Issued before SHARD_TABLES changed
+        raise ValueError('nextToken is invalid')
+    index = names.index(position['table'])
+    key = position['key']
+    items = []
+    while len(items) < limit:
+        page, key = read_page(shards.shards[names[index]].table.scan, limit - len(items), key, **kwargs)
+        items.extend(page)
+        if key:
+            continue
+        index += 1
+        if index == len(names):
+            return items, None
+    return items, {'table': names[index], 'key': key}
 
 
 @app.route('/health', methods=['GET'])
@@ -49,28 +424,75 @@ def health():
 
 @app.route('/ready', methods=['GET'])
 def ready():
-    """Readiness check - verifies DynamoDB table is accessible"""
-    try:
-        # Try to describe the table to check connectivity
-        response = table.meta.client.describe_table(TableName=TABLE_NAME)
-        if response['Table']['TableStatus'] == 'ACTIVE':
-            return jsonify({
-                'status': 'ready',
-                'table': TABLE_NAME,
-                'table_status': 'ACTIVE'
-            }), 200
-        else:
-            return jsonify({
-                'status': 'not_ready',
-                'table': TABLE_NAME,
-                'table_status': response['Table']['TableStatus']
-            }), 503
-    except Exception as e:
-        logger.error(f"Readiness check failed: {str(e)}")
-        return jsonify({
-            'status': 'not_ready',
-            'error': str(e)
-        }), 503
+    """Readiness check - DynamoDB table state as last refreshed in the background"""
+    is_ready, body = readiness.status()
+    return jsonify(body), 200 if is_ready else 503
+
+
+@app.route('/ready/stats', methods=['GET'])
+def ready_stats():
+    """Readiness check/short-circuit/throttle counters"""
+    return jsonify(readiness.stats()), 200
+
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Session cache hit/miss/eviction counters"""
+    return jsonify(session_cache.stats()), 200
+
+
+@app.route('/touch/stats', methods=['GET'])
+def touch_stats():
+    """Touch write/debounce counters"""
+    return jsonify(touch_tracker.stats()), 200
+
+
+@app.route('/write-behind/stats', methods=['GET'])
+def write_behind_stats():
+    """Write-behind queue depth and flush counters"""
+    return jsonify(shard_stats(lambda shard: shard.write_behind)), 200
+
+
+@app.route('/rate-limit/stats', methods=['GET'])
+def rate_limit_stats():
+    """DynamoDB rate limiter rate, tokens and throttle/rejection counters"""
+    return jsonify(shard_stats(lambda shard: shard.limiter)), 200
+
+
+@app.route('/sweeper/stats', methods=['GET'])
+def sweeper_stats():
+    """Expired-session sweeper run and delete counters"""
+    return jsonify(shard_stats(lambda shard: shard.sweeper)), 200
+
+
+@app.route('/streams/stats', methods=['GET'])
+def streams_stats():
+    """Stream consumer lag, checkpoints and cache eviction counters"""
+    if stream_reader is None:
+        return jsonify({'enabled': False}), 200
+    return jsonify(stream_reader.stats()), 200
+
+
+@app.route('/shards/stats', methods=['GET'])
+def shards_stats():
+    """Per-table call, error, throttle, capacity and latency counters"""
+    return jsonify(shards.stats()), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics for this worker process"""
+    if metrics is None:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/migration/stats', methods=['GET'])
+def migration_stats():
+    """Dual-write mirror counters while migrating to the composite layout"""
+    if migration is None:
+        return jsonify({'enabled': False}), 200
+    return jsonify(migration.stats()), 200
 
 
 @app.route('/sessions', methods=['POST'])
@@ -85,23 +507,23 @@ def create_session():
         user_id = data['userId']
         session_data = data.get('data', {})
 
-        # Generate session ID (UUID4 ensures uniqueness even with concurrent requests)
-        session_id = f"session-{user_id}-{uuid.uuid4().hex[:12]}"
-
-        # Calculate TTL
-        ttl = get_ttl_timestamp(SESSION_TTL_HOURS)
+        # Create session item with generated ID and TTL
+        item = new_session_item(user_id, session_data)
+        session_id = item['id']
+        ttl = item['ttl']
 
-        # Create session item
-        item = {
-            'id': session_id,
-            'userId': user_id,
-            'data': json.dumps(session_data),
-            'createdAt': datetime.utcnow().isoformat(),
-            'ttl': ttl
-        }
+        # Put item in DynamoDB, or hand it to the write-behind queue
+        shard = shards.for_user(user_id)
+        if shard.write_behind is None:
+            shard.store.put(item)
+        elif not shard.write_behind.submit(item):
+            logger.warning(f"Write-behind queue full, rejecting session for user {user_id}")
+            return write_backlog()
+        else:
+            shard.store.remember([item])
 
-        # Put item in DynamoDB
-        table.put_item(Item=item)
+        # Sessions are usually read right after login, so warm the cache
+        session_cache.put(session_id, session_payload(item, session_data), ttl, etag=session_etag(item))
 
         logger.info(f"Created session {session_id} for user {user_id}")
 
@@ -114,35 +536,46 @@ def create_session():
 
     except Exception as e:
         logger.error(f"Error creating session: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        return error_response(e)
 
 
 @app.route('/sessions/<session_id>', methods=['GET'])
 def get_session(session_id):
     """Retrieve a session by ID"""
     try:
-        response = table.get_item(Key={'id': session_id})
+        # Cache entries never outlive the session's TTL, so a hit is always active,
+        # and its ETag lets a conditional GET finish without touching DynamoDB
+        cached = session_cache.get_with_etag(session_id)
+        if cached is not None:
+            return session_response(*cached)
 
-        if 'Item' not in response:
+        shard = shards.for_session(session_id)
+        if shard is None:
             return jsonify({'error': 'Session not found'}), 404
 
-        item = response['Item']
+        generation = session_cache.generation()
+        item = pending_session(shard, session_id) or shard.store.get(session_id)
+
+        if item is None:
+            return jsonify({'error': 'Session not found'}), 404
 
         # Check if session has expired
         if int(item['ttl']) < int(time.time()):
             return jsonify({'error': 'Session has expired'}), 410
 
-        return jsonify({
-            'sessionId': item['id'],
-            'userId': item['userId'],
-            'data': json.loads(item['data']),
-            'createdAt': item['createdAt'],
-            'expiresAt': datetime.fromtimestamp(int(item['ttl']), tz=timezone.utc).isoformat()
-        }), 200
+        etag = session_etag(item)
+        if request.if_none_match.contains_weak(etag):
+            # Unchanged - skip decoding and encoding the data
+            return not_modified(etag)
+
+        payload = session_payload(item, decode_data(item['data']))
+        session_cache.put(session_id, payload, item['ttl'], generation, etag=etag)
+
+        return session_response(payload, etag)
 
     except Exception as e:
         logger.error(f"Error retrieving session {session_id}: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        return error_response(e)
 
 
 @app.route('/sessions/<session_id>', methods=['PUT'])
@@ -156,45 +589,50 @@ def update_session(session_id):
 
         session_data = data.get('data', {})
 
-        # Update the session data
-        response = table.update_item(
-            Key={'id': session_id},
-            UpdateExpression='SET #data = :data, updatedAt = :updated',
-            ConditionExpression='attribute_exists(id)',
-            ExpressionAttributeNames={'#data': 'data'},
-            ExpressionAttributeValues={
-                ':data': json.dumps(session_data),
-                ':updated': datetime.utcnow().isoformat()
-            },
-            ReturnValues='ALL_NEW'
-        )
+        shard = shards.for_session(session_id)
+        if shard is None:
+            return jsonify({'error': 'Session not found'}), 404
+        if not settle_session(shard, session_id):
+            return write_backlog()
 
-        item = response['Attributes']
+        # Update the session data
+        item = shard.store.update_data(session_id, encode_data(session_data), datetime.utcnow().isoformat())
+        session_cache.invalidate(session_id)
 
         logger.info(f"Updated session {session_id}")
 
         return jsonify({
             'sessionId': item['id'],
             'userId': item['userId'],
-            'data': json.loads(item['data']),
+            'data': decode_data(item['data']),
             'updatedAt': item.get('updatedAt', item['createdAt'])
         }), 200
 
     except ClientError as e:
         if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            # Deleted elsewhere - make sure we don't keep serving it
+            session_cache.invalidate(session_id)
             return jsonify({'error': 'Session not found'}), 404
         logger.error(f"Error updating session {session_id}: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        return error_response(e)
     except Exception as e:
         logger.error(f"Error updating session {session_id}: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        return error_response(e)
 
 
 @app.route('/sessions/<session_id>', methods=['DELETE'])
 def delete_session(session_id):
     """Delete a session"""
     try:
-        table.delete_item(Key={'id': session_id})
+        # An ID that routes nowhere names no session: nothing to delete
+        shard = shards.for_session(session_id)
+        if shard is not None:
+            if not settle_session(shard, session_id):
+                return write_backlog()
+            shard.store.delete(session_id)
+
+        session_cache.invalidate(session_id)
+        touch_tracker.forget(session_id)
 
         logger.info(f"Deleted session {session_id}")
 
@@ -202,82 +640,402 @@ def delete_session(session_id):
 
     except Exception as e:
         logger.error(f"Error deleting session {session_id}: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        return error_response(e)
 
 
-@app.route('/sessions/user/<user_id>', methods=['GET'])
-def get_user_sessions(user_id):
-    """Get all sessions for a specific user"""
+@app.route('/sessions/<session_id>/touch', methods=['POST'])
+def touch_session(session_id):
+    """Extend a session's expiry (sliding expiration) without rewriting its data"""
     try:
-        # Query using GSI (if created) or scan with filter, with pagination support
-        items = []
-        response = table.scan(
-            FilterExpression='userId = :uid',
-            ExpressionAttributeValues={':uid': user_id}
-        )
-        items.extend(response.get('Items', []))
+        shard = shards.for_session(session_id)
+        if shard is None:
+            return jsonify({'error': 'Session not found'}), 404
+
+        ttl = get_ttl_timestamp(SESSION_TTL_HOURS)
+        written = touch_tracker.claim(session_id, ttl)
+        if written is not None:
+            # Touched recently - the TTL written then is close enough
+            return jsonify({
+                'sessionId': session_id,
+                'expiresAt': datetime.fromtimestamp(written, tz=timezone.utc).isoformat(),
+                'extended': False
+            }), 200
+
+        try:
+            if not settle_session(shard, session_id):
+                touch_tracker.forget(session_id)
+                return write_backlog()
+            shard.store.touch(session_id, ttl, expiry_bucket(session_id, ttl), int(time.time()))
+        except ClientError as e:
+            touch_tracker.forget(session_id)
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            session_cache.invalidate(session_id)
+            if 'Item' in e.response:
+                return jsonify({'error': 'Session has expired'}), 410
+            return jsonify({'error': 'Session not found'}), 404
+        except Exception:
+            touch_tracker.forget(session_id)
+            raise
+
+        # Cached payloads carry the old expiresAt
+        session_cache.invalidate(session_id)
+
+        return jsonify({
+            'sessionId': session_id,
+            'expiresAt': datetime.fromtimestamp(ttl, tz=timezone.utc).isoformat(),
+            'extended': True
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Error touching session {session_id}: {str(e)}")
+        return error_response(e)
+
+
+@app.route('/sessions:batchCreate', methods=['POST'])
+def batch_create_sessions():
+    """Create many sessions with BatchWriteItem, reporting a result per entry"""
+    try:
+        data = request.get_json()
+
+        if not data or not isinstance(data.get('sessions'), list):
+            return jsonify({'error': 'sessions must be a list'}), 400
+        if len(data['sessions']) > BATCH_MAX_ITEMS:
+            return jsonify({'error': f'at most {BATCH_MAX_ITEMS} sessions per request'}), 400
+
+        results = []
+        items = {}
+        for index, entry in enumerate(data['sessions']):
+            if not isinstance(entry, dict) or 'userId' not in entry:
+                results.append({'index': index, 'status': 400, 'error': 'userId is required'})
+                continue
+
+            item = new_session_item(entry['userId'], entry.get('data', {}))
+            items[item['id']] = (index, item, entry.get('data', {}))
+            results.append(None)
 
-        # Handle pagination for large result sets (>1MB)
-        while 'LastEvaluatedKey' in response:
-            response = table.scan(
-                FilterExpression='userId = :uid',
-                ExpressionAttributeValues={':uid': user_id},
-                ExclusiveStartKey=response['LastEvaluatedKey']
+        by_shard = {}
+        for _, item, _ in items.values():
+            by_shard.setdefault(shards.for_user(item['userId']), []).append({'PutRequest': {'Item': item}})
+
+        errors = {}
+        for shard, writes in by_shard.items():
+            failed = batch_write(
+                shard.dynamodb, shard.name, writes,
+                max_retries=BATCH_MAX_RETRIES, base_delay=BATCH_RETRY_BASE_DELAY
             )
-            items.extend(response.get('Items', []))
-        current_time = int(time.time())
+            errors.update((write['PutRequest']['Item']['id'], error) for write, error in failed)
+            shard.store.remember(
+                write['PutRequest']['Item'] for write in writes if write['PutRequest']['Item']['id'] not in errors
+            )
+
+        for session_id, (index, item, session_data) in items.items():
+            if session_id in errors:
+                results[index] = {'index': index, 'status': 500, 'error': errors[session_id]}
+                continue
 
-        # Filter out expired sessions
-        active_sessions = [
-            {
-                'sessionId': item['id'],
+            session_cache.put(session_id, session_payload(item, session_data), item['ttl'], etag=session_etag(item))
+            results[index] = {
+                'index': index,
+                'status': 201,
+                'sessionId': session_id,
                 'userId': item['userId'],
-                'data': json.loads(item['data']),
-                'createdAt': item['createdAt'],
-                'expiresAt': datetime.fromtimestamp(int(item['ttl']), tz=timezone.utc).isoformat()
+                'expiresAt': datetime.fromtimestamp(item['ttl'], tz=timezone.utc).isoformat(),
+                'data': session_data
             }
-            for item in items
-            if int(item['ttl']) > current_time
-        ]
+
+        created = sum(1 for result in results if result['status'] == 201)
+        logger.info(f"Batch created {created}/{len(results)} sessions")
+
+        return jsonify({
+            'created': created,
+            'failed': len(results) - created,
+            'results': results
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Error batch creating sessions: {str(e)}")
+        return error_response(e)
+
+
+@app.route('/sessions:batchGet', methods=['POST'])
+def batch_get_sessions():
+    """Retrieve many sessions with BatchGetItem, reporting a result per ID"""
+    try:
+        session_ids, error = batch_session_ids(request.get_json())
+        if error:
+            return jsonify({'error': error}), 400
+
+        # Serve what we can from the cache, fetch the rest
+        payloads = {}
+        for session_id in session_ids:
+            payload = session_cache.get(session_id)
+            if payload is not None:
+                payloads[session_id] = payload
+
+        # IDs that route to no shard name no session and are reported as not found
+        by_shard, _ = shards.group([session_id for session_id in session_ids if session_id not in payloads])
+        for shard, shard_ids in by_shard.items():
+            for session_id in shard_ids:
+                item = pending_session(shard, session_id)
+                if item is not None:
+                    payloads[session_id] = session_payload(item, decode_data(item['data']))
+
+        generation = session_cache.generation()
+        errors = {}
+        found = {}
+        for shard, shard_ids in by_shard.items():
+            # IDs with no key (composite layout: no such session) are reported as not found
+            keys = shard.store.keys([session_id for session_id in shard_ids if session_id not in payloads])
+            items, failed = batch_get(
+                shard.dynamodb, shard.name, list(keys.values()),
+                max_retries=BATCH_MAX_RETRIES, base_delay=BATCH_RETRY_BASE_DELAY
+            )
+            errors.update((key_session_id(key), error) for key, error in failed)
+            found.update((item['id'], item) for item in items)
+        current_time = int(time.time())
+
+        results = []
+        for session_id in session_ids:
+            if session_id in payloads:
+                results.append({'sessionId': session_id, 'status': 200, 'session': payloads[session_id]})
+            elif session_id in errors:
+                results.append({'sessionId': session_id, 'status': 500, 'error': errors[session_id]})
+            elif session_id not in found:
+                results.append({'sessionId': session_id, 'status': 404, 'error': 'Session not found'})
+            elif int(found[session_id]['ttl']) < current_time:
+                results.append({'sessionId': session_id, 'status': 410, 'error': 'Session has expired'})
+            else:
+                item = found[session_id]
+                payload = session_payload(item, decode_data(item['data']))
+                session_cache.put(session_id, payload, item['ttl'], generation, etag=session_etag(item))
+                results.append({'sessionId': session_id, 'status': 200, 'session': payload})
+
+        return jsonify({
+            'found': sum(1 for result in results if result['status'] == 200),
+            'results': results
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Error batch retrieving sessions: {str(e)}")
+        return error_response(e)
+
+
+@app.route('/sessions:batchDelete', methods=['POST'])
+def batch_delete_sessions():
+    """Delete many sessions with BatchWriteItem, reporting a result per ID"""
+    try:
+        session_ids, error = batch_session_ids(request.get_json())
+        if error:
+            return jsonify({'error': error}), 400
+
+        # IDs that route to no shard name no session: nothing to delete
+        by_shard, _ = shards.group(session_ids)
+        if not all(
+            settle_session(shard, session_id) for shard, shard_ids in by_shard.items() for session_id in shard_ids
+        ):
+            return write_backlog()
+
+        errors = {}
+        for shard, shard_ids in by_shard.items():
+            failed = batch_write(
+                shard.dynamodb, shard.name,
+                [{'DeleteRequest': {'Key': key}} for key in shard.store.keys(shard_ids).values()],
+                max_retries=BATCH_MAX_RETRIES, base_delay=BATCH_RETRY_BASE_DELAY
+            )
+            errors.update((key_session_id(write['DeleteRequest']['Key']), error) for write, error in failed)
+
+        results = []
+        for session_id in session_ids:
+            session_cache.invalidate(session_id)
+            touch_tracker.forget(session_id)
+            if session_id in errors:
+                results.append({'sessionId': session_id, 'status': 500, 'error': errors[session_id]})
+            else:
+                results.append({'sessionId': session_id, 'status': 200})
+
+        deleted = len(session_ids) - len(errors)
+        logger.info(f"Batch deleted {deleted}/{len(session_ids)} sessions")
 
         return jsonify({
+            'deleted': deleted,
+            'failed': len(errors),
+            'results': results
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Error batch deleting sessions: {str(e)}")
+        return error_response(e)
+
+
+@app.route('/sessions/user/<user_id>', methods=['GET'])
+def get_user_sessions(user_id):
+    """Get all sessions for a specific user"""
+    try:
+        shard = shards.for_user(user_id)
+        operation, kwargs, source = user_lookup(shard, user_id)
+        scope = f'user:{user_id}:{source}'
+        try:
+            limit, start_key = page_request(request.args, scope)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        next_token = None
+        if limit is not None:
+            # One page of up to `limit` sessions
+            try:
+                items, last_key = read_page(operation, limit, start_key, **kwargs)
+            except ClientError as e:
+                forget_user_index(shard, e)
+                raise
+            next_token = page_token(scope, last_key)
+        else:
+            # Query the userId index (if created) or scan with filter, with pagination support
+            items = fetch_user_items(shard, user_id)
+
+        # Expired sessions were already filtered out server-side
+        active_sessions = [session_payload(item, decode_data(item['data'])) for item in items]
+
+        body = {
             'userId': user_id,
             'sessionCount': len(active_sessions),
             'sessions': active_sessions
-        }), 200
+        }
+        if limit is not None:
+            body['nextToken'] = next_token
+        return jsonify(body), 200
 
     except Exception as e:
         logger.error(f"Error retrieving sessions for user {user_id}: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        return error_response(e)
+
+
+@app.route('/sessions/user/<user_id>', methods=['DELETE'])
+def delete_user_sessions(user_id):
+    """Delete all of a user's sessions (forced logout) with parallel BatchWriteItem calls"""
+    try:
+        # New sessions still in the write-behind queue must land first, or they'd survive the logout
+        shard = shards.for_user(user_id)
+        if shard.write_behind is not None and not all(
+            settle_session(shard, session_id) for session_id in shard.write_behind.pending_ids(user_id)
+        ):
+            return write_backlog()
+
+        keys, source = user_session_keys(shard, user_id)
+        failed = parallel_batch_write(
+            shard.dynamodb, shard.name, [{'DeleteRequest': {'Key': key}} for key in keys],
+            BATCH_WRITE_WORKERS, max_retries=BATCH_MAX_RETRIES, base_delay=BATCH_RETRY_BASE_DELAY
+        )
+        failed_ids = [key_session_id(write['DeleteRequest']['Key']) for write, _ in failed]
+
+        session_ids = [key_session_id(key) for key in keys]
+        for session_id in session_ids:
+            session_cache.invalidate(session_id)
+            touch_tracker.forget(session_id)
+
+        deleted = len(session_ids) - len(failed_ids)
+        logger.info(f"Deleted {deleted}/{len(session_ids)} sessions of user {user_id} (keys via {source})")
+
+        # Deletes are idempotent: repeat the call to retry failed ones
+        return jsonify({
+            'userId': user_id,
+            'deleted': deleted,
+            'failed': len(failed_ids),
+            'failedSessionIds': failed_ids
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Error deleting sessions for user {user_id}: {str(e)}")
+        return error_response(e)
+
+
+@app.route('/sessions/user/<user_id>/count', methods=['GET'])
+def count_user_sessions(user_id):
+    """Count a user's active sessions without fetching them"""
+    try:
+        shard = shards.for_user(user_id)
+        operation, kwargs, _ = user_lookup(shard, user_id)
+        try:
+            count, _ = count_matches(scan_pages(operation, Select='COUNT', **kwargs))
+        except ClientError as e:
+            forget_user_index(shard, e)
+            count, _ = count_matches(scan_pages(
+                shard.table.scan, Select='COUNT',
+                FilterExpression=Attr('userId').eq(user_id) & active_filter()
+            ))
+
+        return jsonify({
+            'userId': user_id,
+            'sessionCount': count
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Error counting sessions for user {user_id}: {str(e)}")
+        return error_response(e)
+
+
+@app.route('/sessions/count', methods=['GET'])
+def count_sessions():
+    """Count all active sessions (admin endpoint) without fetching them"""
+    try:
+        # Parallel segmented scan of each table returning only counts - no items are materialized
+        count, scanned = count_matches(chain.from_iterable(
+            parallel_scan_pages(
+                shard.table.scan, SCAN_SEGMENTS, SCAN_MAX_WORKERS,
+                Select='COUNT', FilterExpression=active_filter()
+            )
+            for shard in shards
+        ))
+
+        return jsonify({
+            'sessionCount': count,
+            'scannedCount': scanned
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Error counting sessions: {str(e)}")
+        return error_response(e)
 
 
 @app.route('/sessions', methods=['GET'])
 def list_sessions():
     """List all active sessions (admin endpoint)"""
     try:
-        # Scan with pagination support for large result sets (>1MB)
-        items = []
-        response = table.scan()
-        items.extend(response.get('Items', []))
+        try:
+            limit, start_key = page_request(request.args, 'all')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if limit is not None:
+            # One page of up to `limit` sessions
+            try:
+                items, last_key = read_shards_page(
+                    limit, start_key, FilterExpression=active_filter(), **summary_projection()
+                )
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            return jsonify({
+                'sessionCount': len(items),
+                'sessions': [session_summary(item) for item in items],
+                'nextToken': page_token('all', last_key)
+            }), 200
 
-        # Handle pagination
-        while 'LastEvaluatedKey' in response:
-            response = table.scan(ExclusiveStartKey=response['LastEvaluatedKey'])
-            items.extend(response.get('Items', []))
+        # Parallel segmented scan of each table, each segment paginated for large
+        # result sets (>1MB). Only active sessions, without the data blob
+        items = chain.from_iterable(
+            parallel_scan(
+                shard.table.scan, SCAN_SEGMENTS, SCAN_MAX_WORKERS,
+                FilterExpression=active_filter(), **summary_projection()
+            )
+            for shard in shards
+        )
 
-        current_time = int(time.time())
+        # Streaming mode: one session per line, sent as each scan page arrives
+        if wants_ndjson(request):
+            return Response(ndjson_sessions(items), mimetype='application/x-ndjson')
 
-        # Filter out expired sessions
-        active_sessions = [
-            {
-                'sessionId': item['id'],
-                'userId': item['userId'],
-                'createdAt': item['createdAt'],
-                'expiresAt': datetime.fromtimestamp(int(item['ttl']), tz=timezone.utc).isoformat()
-            }
-            for item in items
-            if int(item['ttl']) > current_time
-        ]
+        # Expired sessions were already filtered out server-side
+        active_sessions = [session_summary(item) for item in items]
 
         return jsonify({
             'sessionCount': len(active_sessions),
@@ -286,9 +1044,10 @@ def list_sessions():
 
     except Exception as e:
         logger.error(f"Error listing sessions: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        return error_response(e)
 
 
 if __name__ == '__main__':
+    # Development server only - the container runs gunicorn (see gunicorn.conf.py)
     port = int(os.environ.get('PORT', 8080))
     app.run(host='0.0.0.0', port=port)
@@ -0,0 +1,213 @@
+"""
+Batch helpers for DynamoDB BatchWriteItem / BatchGetItem
+Splits requests at the DynamoDB per-call limits and retries unprocessed
+items with exponential backoff
+"""
+
+import asyncio
+import contextvars
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+# DynamoDB per-call limits
+BATCH_WRITE_LIMIT = 25
+BATCH_GET_LIMIT = 100
+
+# Errors worth retrying like unprocessed items; anything else fails the chunk
+RETRYABLE_ERRORS = ('ProvisionedThroughputExceededException', 'ThrottlingException')
+
+
+def chunked(items, size):
+    """Split a list into consecutive chunks of at most `size` items"""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def backoff_delay(attempt, base_delay):
+    """Full-jitter exponential backoff delay in seconds for a retry attempt"""
+    return random.uniform(0, base_delay * (2 ** attempt))
+
+
+def batch_write(dynamodb, table_name, write_requests, max_retries=5, base_delay=0.05):
+    """Write PutRequest/DeleteRequest entries in chunks of 25
+
+    Unprocessed items are retried with backoff up to max_retries times.
+    Returns a list of (write_request, error_message) for entries that
+    could not be written.
+    """
+    failed = []
+    for chunk in chunked(write_requests, BATCH_WRITE_LIMIT):
+        pending = chunk
+        attempt = 0
+        while pending:
+            try:
+                response = dynamodb.batch_write_item(RequestItems={table_name: pending})
+            except ClientError as e:
+                error = e.response['Error']['Code']
+                if error in RETRYABLE_ERRORS and attempt < max_retries:
+                    time.sleep(backoff_delay(attempt, base_delay))
+                    attempt += 1
+                    continue
+                logger.error(f"BatchWriteItem on {table_name} failed: {str(e)}")
+                failed.extend((request, error) for request in pending)
+                break
+
+            pending = response.get('UnprocessedItems', {}).get(table_name, [])
+            if not pending:
+                break
+            if attempt >= max_retries:
+                logger.warning(f"Giving up on {len(pending)} unprocessed writes after {attempt} retries")
+                failed.extend((request, 'UnprocessedItems') for request in pending)
+                break
+
+            time.sleep(backoff_delay(attempt, base_delay))
+            attempt += 1
+
+    return failed
+
+
+def parallel_batch_write(dynamodb, table_name, write_requests, max_workers, max_retries=5, base_delay=0.05):
+    """batch_write with the 25-item chunks sent concurrently on a thread pool
+
+    Returns the failed (write_request, error_message) entries of all chunks.
+    """
+    chunks = list(chunked(write_requests, BATCH_WRITE_LIMIT))
+    if len(chunks) <= 1 or max_workers <= 1:
+        return batch_write(dynamodb, table_name, write_requests, max_retries, base_delay)
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks)), thread_name_prefix='batch-write') as executor:
+        # Chunks run in the caller's context (e.g. its rate-limit mode)
+        futures = [
+            executor.submit(contextvars.copy_context().run, batch_write,
+                            dynamodb, table_name, chunk, max_retries, base_delay)
+            for chunk in chunks
+        ]
+        return [entry for future in futures for entry in future.result()]
+
+
+def batch_get(dynamodb, table_name, keys, max_retries=5, base_delay=0.05, **kwargs):
+    """Read items by key in chunks of 100
+
+    Unprocessed keys are retried with backoff up to max_retries times.
+    Extra keyword arguments (e.g. ProjectionExpression) are added to each
+    table's request. Returns (items, failed) where failed is a list of
+    (key, error_message) for keys that could not be read.
+    """
+    items = []
+    failed = []
+    for chunk in chunked(keys, BATCH_GET_LIMIT):
+        pending = {'Keys': chunk, **kwargs}
+        attempt = 0
+        while pending:
+            try:
+                response = dynamodb.batch_get_item(RequestItems={table_name: pending})
+            except ClientError as e:
+                error = e.response['Error']['Code']
+                if error in RETRYABLE_ERRORS and attempt < max_retries:
+                    time.sleep(backoff_delay(attempt, base_delay))
+                    attempt += 1
+                    continue
+                logger.error(f"BatchGetItem on {table_name} failed: {str(e)}")
+                failed.extend((key, error) for key in pending['Keys'])
+                break
+
+            items.extend(response.get('Responses', {}).get(table_name, []))
+            pending = response.get('UnprocessedKeys', {}).get(table_name)
+            if not pending:
+                break
+            if attempt >= max_retries:
+                logger.warning(f"Giving up on {len(pending['Keys'])} unprocessed keys after {attempt} retries")
+                failed.extend((key, 'UnprocessedKeys') for key in pending['Keys'])
+                break
+
+            time.sleep(backoff_delay(attempt, base_delay))
+            attempt += 1
+
+    return items, failed
+
+
+async def batch_write_async(dynamodb, table_name, write_requests, max_retries=5, base_delay=0.05):
+    """Async version of batch_write for an aioboto3 DynamoDB resource"""
+    failed = []
+    for chunk in chunked(write_requests, BATCH_WRITE_LIMIT):
+        pending = chunk
+        attempt = 0
+        while pending:
+            try:
+                response = await dynamodb.batch_write_item(RequestItems={table_name: pending})
+            except ClientError as e:
+                error = e.response['Error']['Code']
+                if error in RETRYABLE_ERRORS and attempt < max_retries:
+                    await asyncio.sleep(backoff_delay(attempt, base_delay))
+                    attempt += 1
+                    continue
+                logger.error(f"BatchWriteItem on {table_name} failed: {str(e)}")
+                failed.extend((request, error) for request in pending)
+                break
+
+            pending = response.get('UnprocessedItems', {}).get(table_name, [])
+            if not pending:
+                break
+            if attempt >= max_retries:
+                logger.warning(f"Giving up on {len(pending)} unprocessed writes after {attempt} retries")
+                failed.extend((request, 'UnprocessedItems') for request in pending)
+                break
+
+            await asyncio.sleep(backoff_delay(attempt, base_delay))
+            attempt += 1
+
+    return failed
+
+
+async def parallel_batch_write_async(dynamodb, table_name, write_requests, max_concurrency,
+                                     max_retries=5, base_delay=0.05):
+    """Async version of parallel_batch_write: up to max_concurrency chunks in flight"""
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def write(chunk):
+        async with semaphore:
+            return await batch_write_async(dynamodb, table_name, chunk, max_retries, base_delay)
+
+    results = await asyncio.gather(*(write(chunk) for chunk in chunked(write_requests, BATCH_WRITE_LIMIT)))
+    return [entry for failed in results for entry in failed]
+
+
+async def batch_get_async(dynamodb, table_name, keys, max_retries=5, base_delay=0.05, **kwargs):
+    """Async version of batch_get for an aioboto3 DynamoDB resource"""
+    items = []
+    failed = []
+    for chunk in chunked(keys, BATCH_GET_LIMIT):
+        pending = {'Keys': chunk, **kwargs}
+        attempt = 0
+        while pending:
+            try:
+                response = await dynamodb.batch_get_item(RequestItems={table_name: pending})
+            except ClientError as e:
+                error = e.response['Error']['Code']
+                if error in RETRYABLE_ERRORS and attempt < max_retries:
+                    await asyncio.sleep(backoff_delay(attempt, base_delay))
+                    attempt += 1
+                    continue
+                logger.error(f"BatchGetItem on {table_name} failed: {str(e)}")
+                failed.extend((key, error) for key in pending['Keys'])
+                break
+
+            items.extend(response.get('Responses', {}).get(table_name, []))
+            pending = response.get('UnprocessedKeys', {}).get(table_name)
+            if not pending:
+                break
+            if attempt >= max_retries:
+                logger.warning(f"Giving up on {len(pending['Keys'])} unprocessed keys after {attempt} retries")
+                failed.extend((key, 'UnprocessedKeys') for key in pending['Keys'])
+                break
+
+            await asyncio.sleep(backoff_delay(attempt, base_delay))
+            attempt += 1
+
+    return items, failed
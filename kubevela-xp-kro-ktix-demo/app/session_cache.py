@@ -0,0 +1,157 @@
+"""
+In-process read-through cache for session lookups
+A bounded LRU keyed by session ID whose entries expire at the earlier of
+the session's own TTL and a configurable maximum staleness. Entries may
+carry the session's ETag so conditional GETs can be answered from memory,
+and can be refreshed in place from DynamoDB Streams (session_streams.py).
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class SessionCache:
+    """Thread-safe LRU cache of session payloads with per-entry expiry"""
+
+    def __init__(self, max_size, max_staleness_seconds):
+        self.max_size = max_size
+        self.max_staleness_seconds = max_staleness_seconds
+        # owner -> max staleness it allows (set_max_staleness)
+        self._staleness = {}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped on every invalidation so in-flight reads can't re-cache stale data
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.refreshes = 0
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def generation(self):
+        """Return a marker to pass to put() for a value read from DynamoDB"""
+        return self._generation
+
+    def get(self, session_id):
+        """Return the cached payload for a session, or None on a miss"""
+        entry = self.get_with_etag(session_id)
+        return entry[0] if entry is not None else None
+
+    def get_with_etag(self, session_id):
+        """Return (payload, etag) for a cached session, or None on a miss
+
+        etag is None if the entry was cached without one.
+        """
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            payload, expires_at, etag, _ = entry
+            if expires_at <= now:
+                del self._entries[session_id]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(session_id)
+            self.hits += 1
+            return payload, etag
+
+    def put(self, session_id, payload, ttl, generation=None, etag=None):
+        """Cache a payload until min(ttl, now + max staleness)
+
+        If generation is given and an invalidation happened since it was
+        taken, the value may already be stale and is not cached.
+        """
+        if not self.enabled:
+            return
+
+        expires_at = min(int(ttl), time.time() + self.max_staleness_seconds)
+        if expires_at <= time.time():
+            return
+
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+
+            self._entries[session_id] = (payload, expires_at, etag, time.time())
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def refresh(self, session_id, payload, ttl, etag, written_at):
+        """Replace a cached session with a version written at `written_at`
+
+        Only sessions already in the cache are refreshed, and only if they
+        were cached before that write; anything cached later may be newer
+        than this version, so it is dropped instead.
+        """
+        if not self.enabled:
+            return
+
+        expires_at = min(int(ttl), time.time() + self.max_staleness_seconds)
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return
+            self._generation += 1
+            if entry[3] < written_at and expires_at > time.time():
+                self._entries[session_id] = (payload, expires_at, etag, time.time())
+                self.refreshes += 1
+            else:
+                del self._entries[session_id]
+                self.invalidations += 1
+
+    def set_max_staleness(self, owner, seconds):
+        """Set the max age an owner (e.g. one table's stream consumer) allows; the shortest one applies"""
+        with self._lock:
+            self._staleness[owner] = seconds
+            self.max_staleness_seconds = min(self._staleness.values())
+
+    def invalidate(self, session_id):
+        """Drop a session from the cache after it was changed or deleted"""
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._generation += 1
+            if self._entries.pop(session_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        """Drop every cached session, e.g. when changes may have been missed"""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        """Return cache counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'size': len(self._entries),
+                'maxSize': self.max_size,
+                'maxStalenessSeconds': self.max_staleness_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRatio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'refreshes': self.refreshes
+            }
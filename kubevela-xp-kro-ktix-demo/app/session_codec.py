@@ -0,0 +1,92 @@
+"""
+Storage codec for the session `data` attribute
+Writes session data as a JSON string (the original format), a native
+DynamoDB map, or JSON compressed into a Binary attribute once it passes a
+size threshold. Reads accept every format regardless of the configured
+codec, so items written before a codec change stay readable.
+"""
+
+import os
+import json
+import zlib
+from decimal import Decimal
+
+from boto3.dynamodb.types import Binary
+
+from session_json import RawJSON
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# json: JSON string, parsed on read (original format)
+# raw: JSON string, copied into responses without parsing
+# map: native DynamoDB map
+# compressed: like raw, stored as zlib/zstd Binary from the threshold up
+SESSION_DATA_CODEC = os.environ.get('SESSION_DATA_CODEC', 'json')
+SESSION_DATA_COMPRESSION = os.environ.get('SESSION_DATA_COMPRESSION', 'zlib')
+SESSION_DATA_COMPRESS_THRESHOLD = int(os.environ.get('SESSION_DATA_COMPRESS_THRESHOLD', '1024'))
+
+CODECS = ('json', 'raw', 'map', 'compressed')
+COMPRESSIONS = ('zlib', 'zstd')
+
+# Frame magic of a zstd payload; anything else in a Binary `data` is zlib
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+if SESSION_DATA_CODEC not in CODECS:
+    raise ValueError(f"SESSION_DATA_CODEC must be one of {', '.join(CODECS)}, got {SESSION_DATA_CODEC!r}")
+if SESSION_DATA_COMPRESSION not in COMPRESSIONS:
+    raise ValueError(f"SESSION_DATA_COMPRESSION must be one of {', '.join(COMPRESSIONS)}, got {SESSION_DATA_COMPRESSION!r}")
+if SESSION_DATA_COMPRESSION == 'zstd' and zstandard is None:
+    raise RuntimeError("SESSION_DATA_COMPRESSION=zstd requires the zstandard package")
+
+
+def _compress(raw):
+    if SESSION_DATA_COMPRESSION == 'zstd':
+        return zstandard.ZstdCompressor().compress(raw)
+    return zlib.compress(raw)
+
+
+def _decompress(raw):
+    if raw.startswith(ZSTD_MAGIC):
+        if zstandard is None:
+            raise RuntimeError("Session data is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(raw)
+    return zlib.decompress(raw)
+
+
+def encode_data(session_data):
+    """Convert session data to the value stored in the `data` attribute"""
+    if SESSION_DATA_CODEC == 'map':
+        # DynamoDB numbers must be Decimals (floats are rejected)
+        return json.loads(json.dumps(session_data), parse_float=Decimal)
+
+    # Compact separators: every byte stored counts towards WCU/RCU
+    text = json.dumps(session_data, separators=(',', ':'))
+    if SESSION_DATA_CODEC == 'compressed':
+        raw = text.encode('utf-8')
+        if len(raw) >= SESSION_DATA_COMPRESS_THRESHOLD:
+            return _compress(raw)
+    return text
+
+
+def decode_data(value):
+    """Convert a stored `data` attribute (any format) back to session data
+
+    With the raw and compressed codecs, JSON text is returned as RawJSON
+    and copied into the response without being parsed and re-encoded.
+    """
+    if isinstance(value, dict):
+        # Numbers stay Decimals; the JSON provider writes them exactly
+        return value
+
+    if isinstance(value, Binary):
+        value = value.value
+    if isinstance(value, bytes):
+        value = _decompress(value).decode('utf-8')
+
+    if SESSION_DATA_CODEC == 'json':
+        return json.loads(value)
+    return RawJSON(value)
+
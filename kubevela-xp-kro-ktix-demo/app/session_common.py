@@ -0,0 +1,366 @@
+"""
+Shared configuration and helpers for the Session Management API
+Used by both the WSGI (session-api.py) and ASGI (session-api-async.py) apps
+"""
+
+import os
+import re
+import time
+import hashlib
+import uuid
+import zlib
+import logging
+from datetime import datetime, timedelta, timezone
+from itsdangerous import BadSignature, URLSafeSerializer
+from boto3.dynamodb.conditions import Attr
+
+from session_codec import encode_data
+from session_limiter import AdaptiveRateLimiter
+from session_metrics import DEFAULT_LATENCY_BUCKETS, Metrics
+from session_ready import ReadinessMonitor
+
+logger = logging.getLogger(__name__)
+
+# Configuration from environment variables
+TABLE_NAME = os.environ.get('DYNAMODB_TABLE_NAME', 'tenant-atlantis-user-sessions-kratix')
+AWS_REGION = os.environ.get('AWS_REGION', 'us-west-2')
+SESSION_TTL_HOURS = int(os.environ.get('SESSION_TTL_HOURS', '24'))
+# Table key layout: `id` (partition key = session ID) or `composite` (partition key
+# userId, sort key createdAtId = "<createdAt>#<id>"); see session_migrate.py
+TABLE_LAYOUT = os.environ.get('TABLE_LAYOUT', 'id')
+if TABLE_LAYOUT not in ('id', 'composite'):
+    raise ValueError(f"TABLE_LAYOUT must be id or composite, got {TABLE_LAYOUT!r}")
+SORT_KEY_ATTRIBUTE = 'createdAtId'
+# Table key attributes of a session in each layout
+LAYOUT_KEY_ATTRIBUTES = {'id': ('id',), 'composite': ('userId', SORT_KEY_ATTRIBUTE)}
+KEY_ATTRIBUTES = LAYOUT_KEY_ATTRIBUTES[TABLE_LAYOUT]
+# While set (on the `id` layout), every session write is mirrored to this composite-layout table
+MIGRATION_TARGET_TABLE = os.environ.get('MIGRATION_TARGET_TABLE')
+if MIGRATION_TARGET_TABLE and TABLE_LAYOUT != 'id':
+    raise ValueError('MIGRATION_TARGET_TABLE migrates from TABLE_LAYOUT=id')
+# Sharding: sessions spread over these tables on a consistent-hash ring (comma-separated;
+# unset = everything in DYNAMODB_TABLE_NAME), hashed by userId or by tenant; see session_shard.py
+SHARD_TABLES = [name.strip() for name in os.environ.get('SHARD_TABLES', '').split(',') if name.strip()]
+SHARD_BY = os.environ.get('SHARD_BY', 'user')
+if SHARD_BY not in ('user', 'tenant'):
+    raise ValueError(f"SHARD_BY must be user or tenant, got {SHARD_BY!r}")
+# A userId's tenant is the part before the first separator ("acme:alice" -> "acme")
+SHARD_TENANT_SEPARATOR = os.environ.get('SHARD_TENANT_SEPARATOR', ':')
+# Tenants pinned to their own table, off the ring: "acme=sessions-acme,globex=sessions-globex"
+SHARD_TENANT_TABLES = dict(
+    entry.strip().split('=', 1) for entry in os.environ.get('SHARD_TENANT_TABLES', '').split(',') if '=' in entry
+)
+SHARD_VIRTUAL_NODES = int(os.environ.get('SHARD_VIRTUAL_NODES', '64'))
+SHARDING_ENABLED = bool(SHARD_TABLES or SHARD_TENANT_TABLES)
+if MIGRATION_TARGET_TABLE and SHARDING_ENABLED:
+    raise ValueError('MIGRATION_TARGET_TABLE migrates a single table; unset SHARD_TABLES and SHARD_TENANT_TABLES')
+# Secondary index keyed on userId (partition) + createdAt (sort) used for per-user lookups
+USER_INDEX_NAME = os.environ.get('USER_INDEX_NAME', 'userId-createdAt-index')
+# Read-through cache for GET /sessions/<id> (size 0 disables it)
+SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', '10000'))
+SESSION_CACHE_MAX_STALENESS_SECONDS = int(os.environ.get('SESSION_CACHE_MAX_STALENESS_SECONDS', '30'))
+# Composite layout: sort keys of sessions remembered per store, so they skip the partition Query
+SORT_KEY_CACHE_SIZE = int(os.environ.get('SORT_KEY_CACHE_SIZE', '100000'))
+# Cursor pagination (?limit=N&nextToken=...) for the listing endpoints
+PAGE_DEFAULT_LIMIT = int(os.environ.get('PAGE_DEFAULT_LIMIT', '100'))
+PAGE_MAX_LIMIT = int(os.environ.get('PAGE_MAX_LIMIT', '1000'))
+# Shared by all replicas so a nextToken issued by one pod is accepted by the others
+PAGE_TOKEN_SECRET = os.environ.get('PAGE_TOKEN_SECRET')
+# Parallel scan for full-table admin listings (1 = sequential scan)
+SCAN_SEGMENTS = int(os.environ.get('SCAN_SEGMENTS', '4'))
+SCAN_MAX_WORKERS = int(os.environ.get('SCAN_MAX_WORKERS', str(SCAN_SEGMENTS)))
+# Batch endpoints: max entries per HTTP request and retry policy for unprocessed items
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', '1000'))
+BATCH_MAX_RETRIES = int(os.environ.get('BATCH_MAX_RETRIES', '5'))
+BATCH_RETRY_BASE_DELAY = float(os.environ.get('BATCH_RETRY_BASE_DELAY', '0.05'))
+# Concurrent BatchWriteItem calls for bulk deletes (DELETE /sessions/user/<id>)
+BATCH_WRITE_WORKERS = int(os.environ.get('BATCH_WRITE_WORKERS', '8'))
+# botocore connection pool, timeouts and retries for DynamoDB calls
+DYNAMODB_MAX_POOL_CONNECTIONS = int(os.environ.get('DYNAMODB_MAX_POOL_CONNECTIONS', '50'))
+DYNAMODB_TCP_KEEPALIVE = os.environ.get('DYNAMODB_TCP_KEEPALIVE', 'true').lower() in ('1', 'true')
+DYNAMODB_CONNECT_TIMEOUT = float(os.environ.get('DYNAMODB_CONNECT_TIMEOUT', '2'))
+DYNAMODB_READ_TIMEOUT = float(os.environ.get('DYNAMODB_READ_TIMEOUT', '5'))
+DYNAMODB_RETRY_MODE = os.environ.get('DYNAMODB_RETRY_MODE', 'standard')
+DYNAMODB_MAX_ATTEMPTS = int(os.environ.get('DYNAMODB_MAX_ATTEMPTS', '3'))
+# Write-behind for POST /sessions: queue new sessions and write them in batches
+WRITE_BEHIND_ENABLED = os.environ.get('WRITE_BEHIND_ENABLED', 'false').lower() in ('1', 'true')
+WRITE_BEHIND_MAX_PENDING = int(os.environ.get('WRITE_BEHIND_MAX_PENDING', '10000'))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.environ.get('WRITE_BEHIND_FLUSH_INTERVAL', '0.05'))
+WRITE_BEHIND_ENQUEUE_TIMEOUT = float(os.environ.get('WRITE_BEHIND_ENQUEUE_TIMEOUT', '0.5'))
+WRITE_BEHIND_FLUSHERS = int(os.environ.get('WRITE_BEHIND_FLUSHERS', '2'))
+WRITE_BEHIND_SETTLE_TIMEOUT = float(os.environ.get('WRITE_BEHIND_SETTLE_TIMEOUT', '5'))
+# POST /sessions/<id>/touch: skip TTL writes for sessions touched within the window
+TOUCH_DEBOUNCE_SECONDS = float(os.environ.get('TOUCH_DEBOUNCE_SECONDS', '60'))
+TOUCH_TRACKER_SIZE = int(os.environ.get('TOUCH_TRACKER_SIZE', '100000'))
+# Sparse index of sessions by expiry hour (expiryBucket) + ttl, used by the sweeper
+EXPIRY_INDEX_NAME = os.environ.get('EXPIRY_INDEX_NAME', 'expiryBucket-ttl-index')
+EXPIRY_BUCKET_SECONDS = int(os.environ.get('EXPIRY_BUCKET_SECONDS', '3600'))
+# Spread each bucket over several index partitions so an hour's logins don't share one
+EXPIRY_BUCKET_SHARDS = int(os.environ.get('EXPIRY_BUCKET_SHARDS', '4'))
+# Expired-session sweeper (session_sweeper.py)
+SWEEPER_ENABLED = os.environ.get('SWEEPER_ENABLED', 'false').lower() in ('1', 'true')
+SWEEPER_INTERVAL = float(os.environ.get('SWEEPER_INTERVAL', '300'))
+SWEEPER_LOOKBACK_HOURS = int(os.environ.get('SWEEPER_LOOKBACK_HOURS', '72'))
+SWEEPER_DELETES_PER_SECOND = float(os.environ.get('SWEEPER_DELETES_PER_SECOND', '100'))
+# DynamoDB Streams consumer that keeps the session cache coherent across replicas (session_streams.py)
+STREAMS_ENABLED = os.environ.get('STREAMS_ENABLED', 'false').lower() in ('1', 'true')
+# evict: drop changed sessions from the cache; refresh: replace cached ones from NEW_IMAGE records
+STREAMS_CACHE_MODE = os.environ.get('STREAMS_CACHE_MODE', 'evict')
+STREAMS_POLL_INTERVAL = float(os.environ.get('STREAMS_POLL_INTERVAL', '1'))
+STREAMS_SHARD_REFRESH_SECONDS = float(os.environ.get('STREAMS_SHARD_REFRESH_SECONDS', '60'))
+# Lag beyond which cached sessions fall back to SESSION_CACHE_MAX_STALENESS_SECONDS
+STREAMS_MAX_LAG_SECONDS = float(os.environ.get('STREAMS_MAX_LAG_SECONDS', '10'))
+# Max age of a cached session while the consumer keeps up
+STREAMS_CACHE_MAX_STALENESS_SECONDS = int(os.environ.get('STREAMS_CACHE_MAX_STALENESS_SECONDS', '3600'))
+# Private directory where a pod's workers elect the one stream reader and receive its changes
+STREAMS_SOCKET_DIR = os.environ.get('STREAMS_SOCKET_DIR', '/tmp/session-streams')
+# /ready is answered from state refreshed in the background every ~READY_CHECK_INTERVAL seconds
+READY_CHECK_INTERVAL = float(os.environ.get('READY_CHECK_INTERVAL', '10'))
+READY_CHECK_JITTER = float(os.environ.get('READY_CHECK_JITTER', '0.2'))
+# Skip DescribeTable while item calls have succeeded this recently
+READY_FRESH_SECONDS = float(os.environ.get('READY_FRESH_SECONDS', '15'))
+# Consecutive failed checks before a ready replica reports not ready
+READY_FAILURE_THRESHOLD = int(os.environ.get('READY_FAILURE_THRESHOLD', '3'))
+# Table statuses that serve reads and writes (UPDATING covers e.g. an index backfill)
+SERVING_TABLE_STATUSES = ('ACTIVE', 'UPDATING')
+# Adaptive client-side rate limit on DynamoDB calls, in capacity units/second per process
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'false').lower() in ('1', 'true')
+RATE_LIMIT_INITIAL_RATE = float(os.environ.get('RATE_LIMIT_INITIAL_RATE', '1000'))
+RATE_LIMIT_MIN_RATE = float(os.environ.get('RATE_LIMIT_MIN_RATE', '10'))
+RATE_LIMIT_MAX_RATE = float(os.environ.get('RATE_LIMIT_MAX_RATE', '20000'))
+RATE_LIMIT_BURST_SECONDS = float(os.environ.get('RATE_LIMIT_BURST_SECONDS', '1'))
+# Longest a request waits for capacity before it gets 429
+RATE_LIMIT_MAX_WAIT = float(os.environ.get('RATE_LIMIT_MAX_WAIT', '0.25'))
+# Rate growth (units/s per second at full use) while DynamoDB isn't throttling
+RATE_LIMIT_INCREASE = float(os.environ.get('RATE_LIMIT_INCREASE', '50'))
+# Factor the rate is cut by on throttling
+RATE_LIMIT_DECREASE = float(os.environ.get('RATE_LIMIT_DECREASE', '0.7'))
+# Prometheus /metrics (session_metrics.py)
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() in ('1', 'true')
+# Comma-separated upper bounds (seconds) of the request and AWS call latency histograms
+METRICS_LATENCY_BUCKETS = tuple(
+    float(bound) for bound in os.environ.get('METRICS_LATENCY_BUCKETS', '').split(',') if bound.strip()
+) or DEFAULT_LATENCY_BUCKETS
+
+if not PAGE_TOKEN_SECRET:
+    logger.warning("PAGE_TOKEN_SECRET not set, nextTokens will only be valid on this replica until it restarts")
+    PAGE_TOKEN_SECRET = uuid.uuid4().hex
+page_token_serializer = URLSafeSerializer(PAGE_TOKEN_SECRET, salt='session-api-page-token')
+
+
+def get_ttl_timestamp(hours_from_now):
+    """Calculate Unix timestamp for TTL expiration"""
+    expiration_time = datetime.utcnow() + timedelta(hours=hours_from_now)
+    return int(expiration_time.timestamp())
+
+
+def rate_limiter():
+    """A DynamoDB rate limiter from the RATE_LIMIT_* settings, or None when RATE_LIMIT_ENABLED is off"""
+    if not RATE_LIMIT_ENABLED:
+        return None
+    return AdaptiveRateLimiter(
+        RATE_LIMIT_INITIAL_RATE, RATE_LIMIT_MIN_RATE, RATE_LIMIT_MAX_RATE, RATE_LIMIT_BURST_SECONDS,
+        RATE_LIMIT_MAX_WAIT, RATE_LIMIT_INCREASE, RATE_LIMIT_DECREASE
+    )
+
+
+def request_metrics():
+    """The process's Prometheus metrics from the METRICS_* settings, or None when METRICS_ENABLED is off"""
+    if not METRICS_ENABLED:
+        return None
+    return Metrics(METRICS_LATENCY_BUCKETS)
+
+
+def readiness_monitor(check):
+    """ReadinessMonitor for the session table driven by the READY_* settings"""
+    return ReadinessMonitor(
+        check, READY_CHECK_INTERVAL, READY_CHECK_JITTER, READY_FRESH_SECONDS,
+        READY_FAILURE_THRESHOLD, labels={'table': TABLE_NAME}
+    )
+
+
+def expiry_bucket(session_id, ttl):
+    """expiryBucket attribute for a session: start of its TTL bucket + a stable shard"""
+    shard = zlib.crc32(session_id.encode('utf-8')) % EXPIRY_BUCKET_SHARDS
+    return f"{int(ttl) // EXPIRY_BUCKET_SECONDS * EXPIRY_BUCKET_SECONDS}#{shard}"
+
+
+def session_etag(item):
+    """Strong ETag for a session's GET representation
+
+    Changes whenever the data (updatedAt) or the expiry (ttl) does; the
+    other fields never change.
+    """
+    version = f"{item['id']}|{item.get('updatedAt', item['createdAt'])}|{int(item['ttl'])}"
+    return hashlib.blake2b(version.encode('utf-8'), digest_size=12).hexdigest()
+
+
+def session_payload(item, session_data):
+    """Build the GET /sessions/<id> response body for a session item"""
+    return {
+        'sessionId': item['id'],
+        'userId': item['userId'],
+        'data': session_data,
+        'createdAt': item['createdAt'],
+        'expiresAt': datetime.fromtimestamp(int(item['ttl']), tz=timezone.utc).isoformat()
+    }
+
+
+def new_session_item(user_id, session_data):
+    """Build a new session item with a generated ID and TTL"""
+    # Generate session ID (UUID4 ensures uniqueness even with concurrent requests)
+    session_id = f"session-{user_id}-{uuid.uuid4().hex[:12]}"
+    ttl = get_ttl_timestamp(SESSION_TTL_HOURS)
+
+    item = {
+        'id': session_id,
+        'userId': user_id,
+        'data': encode_data(session_data),
+        'createdAt': datetime.utcnow().isoformat(),
+        'ttl': ttl,
+        'expiryBucket': expiry_bucket(session_id, ttl)
+    }
+    if TABLE_LAYOUT == 'composite':
+        item[SORT_KEY_ATTRIBUTE] = composite_sort_key(item)
+    return item
+
+
+def composite_sort_key(item):
+    """createdAtId sort key of a session item in the composite layout"""
+    return f"{item['createdAt']}#{item['id']}"
+
+
+def session_key(item, layout=TABLE_LAYOUT):
+    """Table key of a session item (or of an item holding just the key attributes)"""
+    if layout == 'composite':
+        sort_key = item.get(SORT_KEY_ATTRIBUTE) or composite_sort_key(item)
+        return {'userId': item['userId'], SORT_KEY_ATTRIBUTE: sort_key}
+    return {'id': item['id']}
+
+
+def key_session_id(key):
+    """Session ID from a table key in either layout"""
+    if 'id' in key:
+        return key['id']
+    # createdAt is an ISO timestamp, so the first '#' ends it
+    return key[SORT_KEY_ATTRIBUTE].split('#', 1)[1]
+
+
+_SESSION_ID = re.compile(r'session-(.+)-[0-9a-f]{12}', re.DOTALL)
+
+
+def session_user_id(session_id):
+    """userId embedded in a generated session ID (session-<userId>-<12 hex>), or None"""
+    match = _SESSION_ID.fullmatch(session_id)
+    return match.group(1) if match else None
+
+
+def batch_session_ids(data):
+    """Validate a batch request body and return its de-duplicated session IDs, or an error"""
+    if not data or not isinstance(data.get('sessionIds'), list):
+        return None, 'sessionIds must be a list'
+
+    session_ids = list(dict.fromkeys(data['sessionIds']))
+    if not all(isinstance(session_id, str) and session_id for session_id in session_ids):
+        return None, 'sessionIds must be non-empty strings'
+    if len(session_ids) > BATCH_MAX_ITEMS:
+        return None, f'at most {BATCH_MAX_ITEMS} sessionIds per request'
+    return session_ids, None
+
+
+def session_summary(item):
+    """Build the admin listing entry for a session item (no session data)"""
+    return {
+        'sessionId': item['id'],
+        'userId': item['userId'],
+        'createdAt': item['createdAt'],
+        'expiresAt': datetime.fromtimestamp(int(item['ttl']), tz=timezone.utc).isoformat()
+    }
+
+
+def wants_ndjson(request):
+    """Check whether the client opted into a streamed NDJSON response"""
+    if request.args.get('stream', '').lower() in ('1', 'true'):
+        return True
+    best = request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson'])
+    return best == 'application/x-ndjson'
+
+
+def active_filter():
+    """FilterExpression condition matching sessions that have not expired yet
+
+    DynamoDB's TTL reaper can take up to 48h to delete expired items, so
+    listings filter them out server-side instead of shipping them to us.
+    """
+    return Attr('ttl').gt(int(time.time()))
+
+
+def summary_projection():
+    """Scan/Query arguments fetching only the attributes used by session_summary (no data blob)"""
+    return {
+        'ProjectionExpression': '#id, #userId, #createdAt, #ttl',
+        'ExpressionAttributeNames': {
+            '#id': 'id',
+            '#userId': 'userId',
+            '#createdAt': 'createdAt',
+            '#ttl': 'ttl'
+        }
+    }
+
+
+def user_index_status(description):
+    """Return True if the userId index is ACTIVE in a DescribeTable result,
+    None if it exists but is still backfilling and False if it is missing"""
+    indexes = description.get('GlobalSecondaryIndexes', []) + description.get('LocalSecondaryIndexes', [])
+    for index in indexes:
+        if index['IndexName'] == USER_INDEX_NAME:
+            # GSIs are unusable while backfilling; LSIs have no IndexStatus
+            if index.get('IndexStatus', 'ACTIVE') != 'ACTIVE':
+                logger.info(f"Index {USER_INDEX_NAME} is {index['IndexStatus']}, using scan until it is ACTIVE")
+                return None
+            logger.info(f"Using index {USER_INDEX_NAME} for per-user session lookups")
+            return True
+
+    logger.warning(f"Index {USER_INDEX_NAME} not found on {TABLE_NAME}, per-user lookups will scan the table")
+    return False
+
+
+def page_request(args, scope):
+    """Parse the limit and nextToken query args for a listing bound to `scope`
+
+    Returns (limit, start_key), with limit None when the client did not
+    ask for a page. Raises ValueError for invalid parameters.
+    """
+    limit = args.get('limit')
+    token = args.get('nextToken')
+    if limit is None and token is None:
+        return None, None
+
+    if limit is None:
+        limit = PAGE_DEFAULT_LIMIT
+    else:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError('limit must be an integer')
+        if not 1 <= limit <= PAGE_MAX_LIMIT:
+            raise ValueError(f'limit must be between 1 and {PAGE_MAX_LIMIT}')
+
+    if not token:
+        return limit, None
+
+    try:
+        payload = page_token_serializer.loads(token)
+    except BadSignature:
+        raise ValueError('nextToken is invalid')
+    # Tokens are only valid for the listing (and read path) that issued them
+    if payload.get('scope') != scope:
+        raise ValueError('nextToken does not belong to this listing')
+    return limit, payload['key']
+
+
+def page_token(scope, last_key):
+    """Encode a LastEvaluatedKey as an opaque signed nextToken (None at the end)"""
+    if not last_key:
+        return None
+    return page_token_serializer.dumps({'scope': scope, 'key': last_key})
@@ -0,0 +1,178 @@
+"""
+Response compression negotiated from Accept-Encoding
+JSON and NDJSON responses are compressed with brotli (when the Brotli
+package is installed) or gzip, whichever the client prefers. Buffered
+bodies below COMPRESS_MIN_SIZE are sent as-is; streamed NDJSON is
+compressed on the fly and flushed every COMPRESS_STREAM_FLUSH_BYTES so
+clients still see pages as they arrive.
+"""
+
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', 'true').lower() in ('1', 'true')
+# Smallest buffered body worth compressing; below this the headers cost more than is saved
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', '1024'))
+COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', '6'))
+COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', '4'))
+# Uncompressed bytes of a stream buffered before the compressor is flushed to the client
+COMPRESS_STREAM_FLUSH_BYTES = int(os.environ.get('COMPRESS_STREAM_FLUSH_BYTES', '65536'))
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'application/x-ndjson')
+
+# In server preference order when the client rates them equally
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate(accept_encodings):
+    """Pick a content coding from a parsed Accept-Encoding header, or None for identity"""
+    return accept_encodings.best_match(ENCODINGS)
+
+
+class _Compressor:
+    """Incremental gzip/brotli compressor with sync-flush support"""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._brotli = brotli.Compressor(quality=COMPRESS_BROTLI_QUALITY)
+        else:
+            self._zlib = zlib.compressobj(COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        if self.encoding == 'br':
+            return self._brotli.process(data)
+        return self._zlib.compress(data)
+
+    def flush(self):
+        """Emit everything compressed so far without ending the stream"""
+        if self.encoding == 'br':
+            return self._brotli.flush()
+        return self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+
+def compress(data, encoding):
+    """Compress a whole body"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=COMPRESS_BROTLI_QUALITY)
+    compressor = _Compressor(encoding)
+    return compressor.compress(data) + compressor.finish()
+
+
+def compress_stream(chunks, encoding):
+    """Compress an iterable of byte chunks, flushing every COMPRESS_STREAM_FLUSH_BYTES"""
+    compressor = _Compressor(encoding)
+    pending = 0
+    try:
+        for chunk in chunks:
+            out = compressor.compress(chunk)
+            pending += len(chunk)
+            if pending >= COMPRESS_STREAM_FLUSH_BYTES:
+                out += compressor.flush()
+                pending = 0
+            if out:
+                yield out
+        yield compressor.finish()
+    finally:
+        # Stop the producer (e.g. parallel scan workers) if the client went away
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+async def compress_stream_async(chunks, encoding):
+    """compress_stream for an async iterable of byte chunks"""
+    compressor = _Compressor(encoding)
+    pending = 0
+    async for chunk in chunks:
+        out = compressor.compress(chunk)
+        pending += len(chunk)
+        if pending >= COMPRESS_STREAM_FLUSH_BYTES:
+            out += compressor.flush()
+            pending = 0
+        if out:
+            yield out
+    yield compressor.finish()
+
+
+def _eligible(response):
+    """Whether a response may be compressed at all (before looking at its size)
+
+    Responses with an ETag are left alone: a strong ETag names one exact
+    byte sequence, and the 304 path matches it against the identity body.
+    """
+    return (
+        COMPRESSION_ENABLED
+        and response.status_code == 200
+        and response.mimetype in COMPRESSIBLE_MIMETYPES
+        and 'Content-Encoding' not in response.headers
+        and 'ETag' not in response.headers
+    )
+
+
+def _mark(response, encoding):
+    response.headers['Content-Encoding'] = encoding
+    response.headers.pop('Content-Length', None)
+
+
+def compress_response(response, accept_encodings):
+    """Compress a Flask response in place if the client accepts it; returns the response"""
+    if not _eligible(response):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate(accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        inner = response.response
+        response.response = compress_stream(response.iter_encoded(), encoding)
+        if hasattr(inner, 'close'):
+            response.call_on_close(inner.close)
+        _mark(response, encoding)
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+async def compress_response_async(response, accept_encodings):
+    """compress_response for Quart responses"""
+    if not _eligible(response):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate(accept_encodings)
+    if encoding is None:
+        return response
+
+    if not isinstance(response.response, response.data_body_class):
+        body = response.response
+
+        async def chunks():
+            async with body as iterator:
+                async for item in iterator:
+                    yield item.encode('utf-8') if isinstance(item, str) else item
+
+        response.response = response.iterable_body_class(compress_stream_async(chunks(), encoding))
+        _mark(response, encoding)
+        return response
+
+    data = await response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,129 @@
+"""
+JSON encoding layer for API responses
+A Flask/Quart JSON provider that uses orjson when it is installed and the
+stdlib json module otherwise. DynamoDB Decimals are written as exact JSON
+numbers (never via float) and RawJSON values are copied into the output
+unparsed.
+"""
+
+import os
+import re
+import uuid
+from decimal import Decimal
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# auto: orjson if installed, else stdlib; orjson: require it; stdlib: never use it
+JSON_ENCODER = os.environ.get('JSON_ENCODER', 'auto')
+
+ENCODERS = ('auto', 'orjson', 'stdlib')
+
+if JSON_ENCODER not in ENCODERS:
+    raise ValueError(f"JSON_ENCODER must be one of {', '.join(ENCODERS)}, got {JSON_ENCODER!r}")
+if JSON_ENCODER == 'orjson' and orjson is None:
+    raise RuntimeError("JSON_ENCODER=orjson requires the orjson package")
+
+# orjson >= 3.9 can embed pre-encoded JSON itself; older versions use placeholders
+_Fragment = getattr(orjson, 'Fragment', None)
+
+# Placeholder for verbatim values while encoding; random per process so
+# response data can't forge it
+_RAW_MARKER = uuid.uuid4().hex
+_RAW_PLACEHOLDER = re.compile(f'"{_RAW_MARKER}:(\\d+)"')
+_RAW_PLACEHOLDER_BYTES = re.compile(_RAW_PLACEHOLDER.pattern.encode('ascii'))
+
+
+class RawJSON:
+    """JSON text that SessionJSONProvider writes into responses as-is"""
+
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text
+
+
+def _verbatim(value):
+    """JSON text for values that are written as-is, or None for anything else"""
+    if isinstance(value, RawJSON):
+        return value.text
+    if isinstance(value, Decimal):
+        # DynamoDB numbers: keep every digit instead of rounding through float
+        return str(value)
+    return None
+
+
+class SessionJSONProvider(DefaultJSONProvider):
+    """JSON provider using orjson when available, with Decimal and RawJSON support"""
+
+    fast = orjson is not None and JSON_ENCODER != 'stdlib'
+
+    def dumps(self, obj, **kwargs):
+        if self.fast and not kwargs:
+            return self._dumps_fast(obj).decode('utf-8')
+        return self._dumps_stdlib(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if self.fast and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        if not self.fast:
+            return super().response(*args, **kwargs)
+
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self._dumps_fast(obj, indent) + b'\n', mimetype=self.mimetype)
+
+    def _dumps_stdlib(self, obj, **kwargs):
+        fragments = []
+        default = kwargs.pop('default', self.default)
+
+        def splice(value):
+            # Emit a unique placeholder string and swap the raw text in afterwards
+            text = _verbatim(value)
+            if text is None:
+                return default(value)
+            fragments.append(text)
+            return f'{_RAW_MARKER}:{len(fragments) - 1}'
+
+        text = super().dumps(obj, default=splice, **kwargs)
+        if not fragments:
+            return text
+        return _RAW_PLACEHOLDER.sub(lambda match: fragments[int(match.group(1))], text)
+
+    def _dumps_fast(self, obj, indent=False):
+        """Encode with orjson to UTF-8 bytes"""
+        fragments = []
+
+        def splice(value):
+            text = _verbatim(value)
+            if text is None:
+                return self.default(value)
+            if _Fragment is not None:
+                return _Fragment(text)
+            fragments.append(text.encode('utf-8'))
+            return f'{_RAW_MARKER}:{len(fragments) - 1}'
+
+        # Dates go through self.default so they render like the stdlib provider
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+
+        try:
+            body = orjson.dumps(obj, default=splice, option=option)
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bits - let the stdlib encoder handle it
+            dump_args = {'indent': 2} if indent else {'separators': (',', ':')}
+            return self._dumps_stdlib(obj, **dump_args).encode('utf-8')
+
+        if not fragments:
+            return body
+        return _RAW_PLACEHOLDER_BYTES.sub(lambda match: fragments[int(match.group(1))], body)
@@ -0,0 +1,244 @@
+"""
+Adaptive client-side rate limiter for DynamoDB calls
+One token bucket per process, measured in capacity units, sits in front of
+every data-plane call made through the instrumented clients. Its rate backs
+off multiplicatively when DynamoDB throttles and creeps back up while calls
+succeed; ConsumedCapacity from each response settles the real cost of the
+call. Calls made while serving a request fail fast with RateLimited once
+the wait for capacity would exceed max_wait, so handlers can answer 429
+instead of queueing; background work (write-behind, sweeper) waits its turn.
+"""
+
+import asyncio
+import contextvars
+import math
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+from session_batch import RETRYABLE_ERRORS
+
+# DynamoDB error codes that mean "slow down"
+THROTTLE_ERRORS = RETRYABLE_ERRORS + ('RequestLimitExceeded',)
+
+# True while handling a request (set by admit()): calls fail fast instead of waiting
+_fail_fast = contextvars.ContextVar('rate_limit_fail_fast', default=False)
+
+
+class RateLimited(ClientError):
+    """Raised instead of sending a call the limiter has no capacity for
+
+    Carries a ThrottlingException error code so batch retries and error
+    handling treat it like a DynamoDB throttle.
+    """
+
+    def __init__(self, operation_name, retry_after):
+        super().__init__({'Error': {
+            'Code': 'ThrottlingException',
+            'Message': f'Client-side rate limit reached, retry in {retry_after:.2f}s'
+        }}, operation_name)
+        self.retry_after = retry_after
+
+
+def fail_fast():
+    """Make the current request's calls fail fast instead of waiting for capacity (admit() does this too)"""
+    _fail_fast.set(True)
+
+
+def throttle_retry_after(e):
+    """Seconds a client should wait before retrying if `e` is a throttle, else None"""
+    if isinstance(e, RateLimited):
+        return max(1, math.ceil(e.retry_after))
+    if isinstance(e, ClientError) and e.response.get('Error', {}).get('Code') in THROTTLE_ERRORS:
+        return 1
+    return None
+
+
+def consumed_units(parsed):
+    """Total CapacityUnits in a response's ConsumedCapacity (a dict, or a list for batches)"""
+    consumed = parsed.get('ConsumedCapacity')
+    if consumed is None:
+        return None
+    if isinstance(consumed, dict):
+        consumed = [consumed]
+    return sum(float(entry.get('CapacityUnits', 0)) for entry in consumed)
+
+
+def data_plane(model):
+    """Item operations report ConsumedCapacity; control-plane calls (DescribeTable...) don't"""
+    return 'ReturnConsumedCapacity' in model.input_shape.members
+
+
+class AdaptiveRateLimiter:
+    """Thread-safe AIMD token bucket of DynamoDB capacity units per second"""
+
+    def __init__(self, rate, min_rate, max_rate, burst_seconds, max_wait, increase, decrease=0.7, cooldown=1.0):
+        self.rate = float(rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst_seconds = burst_seconds
+        self.max_wait = max_wait
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self._tokens = self.rate * burst_seconds
+        self._updated = time.monotonic()
+        self._last_decrease = float('-inf')
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.waited = 0
+        self.rejected = 0
+        self.requests_rejected = 0
+        self.throttles = 0
+        self.consumed = 0.0
+
+    def _refill(self, now):
+        self._tokens = min(self.rate * self.burst_seconds, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _wait_for(self, cost):
+        """Seconds until `cost` units are available (0 if they are now); caller holds the lock"""
+        if self._tokens >= cost:
+            return 0.0
+        return (cost - self._tokens) / self.rate
+
+    def admit(self):
+        """Admission check at the start of a request
+
+        Returns None if the request may proceed, or the Retry-After seconds
+        if the bucket is so far behind that its calls would be rejected
+        anyway. Also makes this request's calls fail fast.
+        """
+        fail_fast()
+        with self._lock:
+            self._refill(time.monotonic())
+            wait = self._wait_for(1)
+            if wait <= self.max_wait:
+                return None
+            self.requests_rejected += 1
+        return max(1, math.ceil(wait))
+
+    def reserve(self, operation_name, cost=1):
+        """Take `cost` units and return how long to wait before sending
+
+        Raises RateLimited when failing fast and the wait exceeds max_wait.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            wait = self._wait_for(cost)
+            if wait > self.max_wait and _fail_fast.get():
+                self.rejected += 1
+                raise RateLimited(operation_name, wait)
+            # May go negative: later callers queue up behind this reservation
+            self._tokens -= cost
+            self.calls += 1
+            if wait:
+                self.waited += 1
+        return wait
+
+    def acquire(self, operation_name, cost=1):
+        wait = self.reserve(operation_name, cost)
+        if wait:
+            time.sleep(wait)
+
+    async def acquire_async(self, operation_name, cost=1):
+        wait = self.reserve(operation_name, cost)
+        if wait:
+            await asyncio.sleep(wait)
+
+    def settle(self, units, estimate=1):
+        """Charge the difference between a call's ConsumedCapacity and its up-front estimate
+
+        Successful calls also nudge the rate up, in proportion to how much
+        of the current rate they use.
+        """
+        with self._lock:
+            self._tokens -= units - estimate
+            self.consumed += units
+            if time.monotonic() - self._last_decrease >= self.cooldown:
+                self.rate = min(self.max_rate, self.rate + self.increase * max(units, estimate) / self.rate)
+
+    def throttled(self):
+        """DynamoDB throttled a call: cut the rate (at most once per cooldown) and pay for the retry"""
+        now = time.monotonic()
+        with self._lock:
+            self.throttles += 1
+            self._tokens -= 1
+            if now - self._last_decrease >= self.cooldown:
+                self._refill(now)
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self._tokens = min(self._tokens, self.rate * self.burst_seconds)
+                self._last_decrease = now
+
+    def stats(self):
+        """Return limiter counters"""
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                'enabled': True,
+                'rate': round(self.rate, 2),
+                'tokens': round(self._tokens, 2),
+                'calls': self.calls,
+                'waited': self.waited,
+                'rejected': self.rejected,
+                'requestsRejected': self.requests_rejected,
+                'throttles': self.throttles,
+                'consumedUnits': round(self.consumed, 1)
+            }
+
+
+def _on_build_params(params, model, **kwargs):
+    # Not provide-client-params: a resource's client replaces the params with a
+    # copy there, so settings added by later handlers would be dropped
+    if data_plane(model):
+        params.setdefault('ReturnConsumedCapacity', 'TOTAL')
+
+
+def request_consumed_capacity(client):
+    """Have a DynamoDB client's data-plane calls return ConsumedCapacity (registered once per client)"""
+    client.meta.events.register(
+        'before-parameter-build.dynamodb', _on_build_params, unique_id='session-consumed-capacity'
+    )
+
+
+def on_throttle(client, handler):
+    """Call handler(operation) for every attempt of a client's calls that the service throttled"""
+    def needs_retry(operation, response=None, **kwargs):
+        if response is not None and response[1].get('Error', {}).get('Code') in THROTTLE_ERRORS:
+            handler(operation)
+    client.meta.events.register('needs-retry', needs_retry)
+
+
+def _on_after_call(limiter):
+    def handler(http_response, parsed, model, **kwargs):
+        if http_response.status_code < 300 and data_plane(model):
+            units = consumed_units(parsed)
+            limiter.settle(1 if units is None else units)
+    return handler
+
+
+def instrument(client, limiter):
+    """Send a botocore DynamoDB client's data-plane calls through the limiter"""
+    def before_call(model, **kwargs):
+        if data_plane(model):
+            limiter.acquire(model.name)
+
+    request_consumed_capacity(client)
+    on_throttle(client, lambda operation: limiter.throttled())
+    events = client.meta.events
+    events.register('before-call.dynamodb', before_call)
+    events.register('after-call.dynamodb', _on_after_call(limiter))
+
+
+def instrument_async(client, limiter):
+    """instrument() for aiobotocore clients: waits for capacity without blocking the event loop"""
+    async def before_call(model, **kwargs):
+        if data_plane(model):
+            await limiter.acquire_async(model.name)
+
+    request_consumed_capacity(client)
+    on_throttle(client, lambda operation: limiter.throttled())
+    events = client.meta.events
+    events.register('before-call.dynamodb', before_call)
+    events.register('after-call.dynamodb', _on_after_call(limiter))
@@ -0,0 +1,362 @@
+"""
+Online migration from the `id` table layout to the composite layout
+The composite layout keys sessions on userId (partition) + createdAtId
+(sort, "<createdAt>#<id>"), so a user's sessions are one ordered Query
+instead of an index lookup or scan. Migrating a live table:
+
+    1. create the target table (userId HASH, createdAtId RANGE)
+    2. set MIGRATION_TARGET_TABLE on session-api.py - every session write
+       is now mirrored to the target (dual-write)
+    3. python session_migrate.py backfill    # parallel scan, copies what dual-write hasn't
+    4. python session_migrate.py verify      # compare both tables (--repair fixes drift)
+    5. python session_migrate.py cutover     # verify again and print the settings to roll out:
+       DYNAMODB_TABLE_NAME=<target>, TABLE_LAYOUT=composite, MIGRATION_TARGET_TABLE unset
+
+Session IDs keep their format, so existing IDs keep working after cutover:
+the userId is parsed out of the ID to find its partition.
+"""
+
+import argparse
+import json
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+
+from session_batch import batch_get, batch_write
+from session_common import (
+    AWS_REGION, BATCH_MAX_RETRIES, BATCH_RETRY_BASE_DELAY, MIGRATION_TARGET_TABLE, SCAN_SEGMENTS, SORT_KEY_ATTRIBUTE,
+    TABLE_NAME, composite_sort_key, session_key
+)
+from session_scan import scan_pages
+from session_store import CompositeSessionStore, client_config
+
+logger = logging.getLogger(__name__)
+
+# Operations whose writes are mirrored, and where their session keys are
+WRITE_OPERATIONS = ('PutItem', 'UpdateItem', 'DeleteItem', 'BatchWriteItem')
+
+# Differences listed by verify (the counts cover all of them)
+VERIFY_SAMPLE_SIZE = 20
+
+
+def composite_item(item):
+    """A session item as stored in the composite layout"""
+    return dict(item, **{SORT_KEY_ATTRIBUTE: composite_sort_key(item)})
+
+
+def _string(value):
+    # Resource API calls carry plain values here, client calls attribute values
+    return value['S'] if isinstance(value, dict) else value
+
+
+def written_session_ids(operation_name, params, table_name):
+    """IDs of the sessions a write request to `table_name` touches"""
+    if operation_name == 'BatchWriteItem':
+        ids = []
+        for request in params.get('RequestItems', {}).get(table_name, []):
+            if 'PutRequest' in request:
+                ids.append(_string(request['PutRequest']['Item']['id']))
+            elif 'DeleteRequest' in request:
+                ids.append(_string(request['DeleteRequest']['Key']['id']))
+        return ids
+
+    if params.get('TableName') != table_name:
+        return []
+    if operation_name == 'PutItem':
+        return [_string(params['Item']['id'])]
+    return [_string(params['Key']['id'])]
+
+
+class DualWriter:
+    """Mirrors every session write on the source table into the composite-layout target
+
+    After each successful write to the source, the sessions it touched are
+    re-read from the source with a consistent read and put into - or
+    deleted from - the target. Re-reading instead of replaying the request
+    keeps the mirror idempotent and covers UpdateItem without knowing its
+    result. A failed mirror doesn't fail the request; verify finds it.
+    """
+
+    def __init__(self, dynamodb, client, source_table, target_table,
+                 max_retries=BATCH_MAX_RETRIES, base_delay=BATCH_RETRY_BASE_DELAY):
+        # Its own resource and low-level client: their calls must not be mirrored (or rate limited) again
+        self.dynamodb = dynamodb
+        self.source_table = source_table
+        self.target_table = target_table
+        self.target = CompositeSessionStore(client, target_table)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self._lock = threading.Lock()
+        self.mirrored = 0
+        self.deleted = 0
+        self.failed = 0
+
+    def observe(self, client):
+        """Mirror the writes made through a (sync) DynamoDB client"""
+        def provide_params(params, model, context, **kwargs):
+            if model.name in WRITE_OPERATIONS:
+                ids = written_session_ids(model.name, params, self.source_table)
+                if ids:
+                    context['mirror_session_ids'] = ids
+
+        def after_call(http_response, model, context, **kwargs):
+            ids = context.get('mirror_session_ids')
+            if ids and http_response.status_code < 300:
+                self.mirror(ids)
+
+        client.meta.events.register('provide-client-params.dynamodb', provide_params)
+        client.meta.events.register('after-call.dynamodb', after_call)
+
+    def mirror(self, session_ids):
+        """Copy the sessions' current state from the source to the target; returns failures"""
+        session_ids = list(dict.fromkeys(session_ids))
+        try:
+            items, failed = batch_get(
+                self.dynamodb, self.source_table, [{'id': session_id} for session_id in session_ids],
+                max_retries=self.max_retries, base_delay=self.base_delay, ConsistentRead=True
+            )
+            unread = {key['id'] for key, _ in failed}
+            found = {item['id'] for item in items}
+
+            puts = [composite_item(item) for item in items]
+            failed_writes = batch_write(
+                self.dynamodb, self.target_table, [{'PutRequest': {'Item': item}} for item in puts],
+                max_retries=self.max_retries, base_delay=self.base_delay
+            )
+            # Lets the target delete of a session later removed from the source skip the partition Query
+            self.target.remember(puts)
+            gone = [session_id for session_id in session_ids if session_id not in found and session_id not in unread]
+            for session_id in gone:
+                self.target.delete(session_id)
+        except Exception as e:
+            logger.error(f"Mirroring sessions to {self.target_table} failed: {str(e)}")
+            with self._lock:
+                self.failed += len(session_ids)
+            return len(session_ids)
+
+        errors = len(unread) + len(failed_writes)
+        if errors:
+            logger.error(f"Mirroring {errors} sessions to {self.target_table} failed")
+        with self._lock:
+            self.mirrored += len(items) - len(failed_writes)
+            self.deleted += len(gone)
+            self.failed += errors
+        return errors
+
+    def stats(self):
+        """Return dual-write counters"""
+        with self._lock:
+            return {
+                'enabled': True,
+                'sourceTable': self.source_table,
+                'targetTable': self.target_table,
+                'mirrored': self.mirrored,
+                'deleted': self.deleted,
+                'failed': self.failed
+            }
+
+
+def dual_writer():
+    """DualWriter from the configured table to MIGRATION_TARGET_TABLE, or None when not migrating"""
+    if not MIGRATION_TARGET_TABLE:
+        return None
+    dynamodb, client = connect()
+    return DualWriter(dynamodb, client, TABLE_NAME, MIGRATION_TARGET_TABLE)
+
+
+def connect():
+    """A DynamoDB resource and low-level client (the resource's own client converts values)"""
+    return (
+        boto3.resource('dynamodb', region_name=AWS_REGION, config=client_config()),
+        boto3.client('dynamodb', region_name=AWS_REGION, config=client_config())
+    )
+
+
+def check_target(client, target_table):
+    """Fail unless the target table uses the composite key schema"""
+    schema = client.describe_table(TableName=target_table)['Table']['KeySchema']
+    keys = {entry['KeyType']: entry['AttributeName'] for entry in schema}
+    if keys != {'HASH': 'userId', 'RANGE': SORT_KEY_ATTRIBUTE}:
+        raise SystemExit(f"{target_table} must be keyed on userId (HASH) + {SORT_KEY_ATTRIBUTE} (RANGE), got {keys}")
+
+
+def run_segments(run, segments):
+    """Run `run(segment)` for every scan segment on its own thread and sum the counters it returns"""
+    totals = {}
+    with ThreadPoolExecutor(max_workers=segments, thread_name_prefix='migrate-segment') as executor:
+        for counters in executor.map(run, range(segments)):
+            for name, value in counters.items():
+                totals[name] = totals.get(name, 0) + value
+    return totals
+
+
+def backfill(dynamodb, source_table, target_table, segments=SCAN_SEGMENTS):
+    """Copy every unexpired source session the target doesn't have yet
+
+    Puts are conditional on the item being absent, so a session the
+    dual-writer already mirrored (possibly newer than what the scan read)
+    is never overwritten.
+    """
+    source = dynamodb.Table(source_table)
+    target = dynamodb.Table(target_table)
+    now = int(time.time())
+
+    def run(segment):
+        counters = {'scanned': 0, 'copied': 0, 'present': 0, 'failed': 0}
+        for response in scan_pages(
+            source.scan, Segment=segment, TotalSegments=segments, FilterExpression=Attr('ttl').gt(now)
+        ):
+            for item in response.get('Items', []):
+                counters['scanned'] += 1
+                try:
+                    target.put_item(Item=composite_item(item), ConditionExpression=Attr('userId').not_exists())
+                    counters['copied'] += 1
+                except ClientError as e:
+                    if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                        counters['present'] += 1
+                        continue
+                    logger.error(f"Copying session {item.get('id')} failed: {str(e)}")
+                    counters['failed'] += 1
+                except KeyError as e:
+                    # Not a session written by this API (missing userId/createdAt)
+                    logger.warning(f"Skipping item {item.get('id')} without {e}")
+                    counters['failed'] += 1
+            logger.info(f"Segment {segment}: {counters['scanned']} sessions scanned")
+        return counters
+
+    return run_segments(run, segments)
+
+
+def _differences(dynamodb, source_table, target_table, segments, now):
+    """Scan both tables; return (counts, {session_id: kind}) for unexpired sessions that differ"""
+    source = dynamodb.Table(source_table)
+    target = dynamodb.Table(target_table)
+    differences = {}
+    lock = threading.Lock()
+    unexpired = Attr('ttl').gt(now)
+
+    def compare_source(segment):
+        counters = {'source': 0}
+        for response in scan_pages(source.scan, Segment=segment, TotalSegments=segments, FilterExpression=unexpired):
+            items = response.get('Items', [])
+            counters['source'] += len(items)
+            found, failed = batch_get(dynamodb, target_table, [session_key(item, 'composite') for item in items])
+            found = {item['id']: item for item in found}
+            unread = {key[SORT_KEY_ATTRIBUTE] for key, _ in failed}
+            with lock:
+                for item in items:
+                    expected = composite_item(item)
+                    if expected[SORT_KEY_ATTRIBUTE] in unread:
+                        differences[item['id']] = 'unread'
+                    elif item['id'] not in found:
+                        differences[item['id']] = 'missing'
+                    elif found[item['id']] != expected:
+                        differences[item['id']] = 'mismatched'
+        return counters
+
+    def compare_target(segment):
+        counters = {'target': 0}
+        for response in scan_pages(target.scan, Segment=segment, TotalSegments=segments, FilterExpression=unexpired):
+            items = response.get('Items', [])
+            counters['target'] += len(items)
+            found, _ = batch_get(dynamodb, source_table, [{'id': item['id']} for item in items])
+            found = {item['id'] for item in found}
+            with lock:
+                for item in items:
+                    if item['id'] not in found:
+                        differences.setdefault(item['id'], 'extra')
+        return counters
+
+    counts = run_segments(compare_source, segments)
+    counts.update(run_segments(compare_target, segments))
+    return counts, differences
+
+
+def _recheck(dynamodb, client, source_table, target_table, session_ids, now):
+    """Compare sessions one by one with consistent reads; returns those that still differ"""
+    source = dynamodb.Table(source_table)
+    target = dynamodb.Table(target_table)
+    lookup = CompositeSessionStore(client, target_table)
+    differences = {}
+    for session_id in session_ids:
+        item = source.get_item(Key={'id': session_id}, ConsistentRead=True).get('Item')
+        if item is not None and int(item['ttl']) > now:
+            mirrored = target.get_item(Key=session_key(item, 'composite'), ConsistentRead=True).get('Item')
+            if mirrored is None:
+                differences[session_id] = 'missing'
+            elif mirrored != composite_item(item):
+                differences[session_id] = 'mismatched'
+        elif lookup.get(session_id) is not None:
+            differences[session_id] = 'extra'
+    return differences
+
+
+def verify(dynamodb, client, source_table, target_table, segments=SCAN_SEGMENTS, repair=False):
+    """Compare the unexpired sessions of both tables
+
+    Sessions written while the scans ran can look different, so every
+    difference is checked again with consistent reads before it counts.
+    With repair, sessions that still differ are mirrored from the source.
+    """
+    now = int(time.time())
+    counts, differences = _differences(dynamodb, source_table, target_table, segments, now)
+    if differences:
+        logger.info(f"Re-checking {len(differences)} differences")
+        differences = _recheck(dynamodb, client, source_table, target_table, list(differences), now)
+
+    if repair and differences:
+        writer = DualWriter(dynamodb, client, source_table, target_table)
+        writer.mirror(list(differences))
+        logger.info(f"Repaired {writer.mirrored + writer.deleted} sessions, {writer.failed} failed")
+        differences = _recheck(dynamodb, client, source_table, target_table, list(differences), now)
+
+    kinds = list(differences.values())
+    return dict(
+        counts,
+        missing=kinds.count('missing'),
+        mismatched=kinds.count('mismatched'),
+        extra=kinds.count('extra'),
+        sample=dict(list(differences.items())[:VERIFY_SAMPLE_SIZE]),
+        consistent=not differences
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Migrate sessions to the composite (userId + createdAtId) layout')
+    parser.add_argument('step', choices=('backfill', 'verify', 'cutover'))
+    parser.add_argument('--source', default=TABLE_NAME, help='table in the id layout (default: DYNAMODB_TABLE_NAME)')
+    parser.add_argument('--target', default=MIGRATION_TARGET_TABLE,
+                        help='table in the composite layout (default: MIGRATION_TARGET_TABLE)')
+    parser.add_argument('--segments', type=int, default=SCAN_SEGMENTS, help='parallel scan segments (and threads)')
+    parser.add_argument('--repair', action='store_true', help='verify: copy sessions that differ from the source')
+    args = parser.parse_args()
+    if not args.target:
+        parser.error('--target or MIGRATION_TARGET_TABLE is required')
+
+    logging.basicConfig(level=logging.INFO)
+    dynamodb, client = connect()
+    check_target(client, args.target)
+
+    if args.step == 'backfill':
+        print(json.dumps(backfill(dynamodb, args.source, args.target, args.segments)))
+        return
+
+    result = verify(dynamodb, client, args.source, args.target, args.segments, repair=args.repair)
+    if args.step == 'cutover' and result['consistent']:
+        result['cutover'] = {
+            'set': {'DYNAMODB_TABLE_NAME': args.target, 'TABLE_LAYOUT': 'composite'},
+            'unset': ['MIGRATION_TARGET_TABLE']
+        }
+    print(json.dumps(result))
+    if not result['consistent']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""
+Cached readiness state for the /ready probe
+A background thread (or asyncio task for the ASGI app) refreshes readiness
+at jittered intervals, so replicas don't call DescribeTable in lockstep.
+The control-plane check is skipped while the data plane has succeeded
+recently, and a throttled check keeps the last known state instead of
+flapping. The probe itself only reads the cached state.
+"""
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+
+from session_limiter import THROTTLE_ERRORS
+
+logger = logging.getLogger(__name__)
+
+# DescribeTable/DescribeTimeToLive throttling reports LimitExceededException
+CHECK_THROTTLE_ERRORS = THROTTLE_ERRORS + ('LimitExceededException',)
+
+
+class ReadinessMonitor:
+    """Readiness state refreshed in the background and served from memory
+
+    `check` returns (ready, detail) - detail is merged into the probe
+    body - or raises if the dependency is unreachable.
+    """
+
+    def __init__(self, check, interval, jitter, fresh_seconds, failure_threshold, labels=None):
+        self.check = check
+        self.interval = interval
+        self.jitter = jitter
+        self.fresh_seconds = fresh_seconds
+        self.failure_threshold = failure_threshold
+        self.labels = labels or {}
+        # (ready, body), replaced as a whole so readers never see half an update
+        self._state = (False, dict(self.labels, status='not_ready', reason='starting'))
+        self._failures = 0
+        # Monotonic time of the last successful data-plane call
+        self._last_success = float('-inf')
+        self._stop = threading.Event()
+        self.checks = 0
+        self.short_circuits = 0
+        self.throttled = 0
+
+    def status(self):
+        """Return (ready, body) for the probe"""
+        return self._state
+
+    def record_success(self):
+        """Note a successful data-plane call; recent ones stand in for the check"""
+        self._last_success = time.monotonic()
+
+    def observe(self, client):
+        """Record successful data-plane calls made through a DynamoDB client"""
+        def after_call(http_response, model, **kwargs):
+            # Item operations only - DescribeTable succeeding says nothing new
+            if http_response.status_code < 300 and 'ReturnConsumedCapacity' in model.input_shape.members:
+                self.record_success()
+
+        client.meta.events.register('after-call.dynamodb', after_call)
+
+    def next_delay(self):
+        """Seconds until the next refresh, jittered so replicas drift apart"""
+        return self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _set(self, ready, detail):
+        self._state = (ready, dict(
+            self.labels, status='ready' if ready else 'not_ready',
+            checkedAt=datetime.now(timezone.utc).isoformat(), **detail
+        ))
+
+    def _short_circuit(self):
+        """Mark ready without checking if the data plane succeeded within fresh_seconds"""
+        if time.monotonic() - self._last_success >= self.fresh_seconds:
+            return False
+        self.short_circuits += 1
+        self._failures = 0
+        self._set(True, {'source': 'data_plane'})
+        return True
+
+    def _record(self, result=None, error=None):
+        self.checks += 1
+        if error is None:
+            ready, detail = result
+            self._failures = 0 if ready else self._failures + 1
+            self._set(ready, dict(detail, source='check'))
+            return
+
+        if isinstance(error, ClientError) and error.response['Error']['Code'] in CHECK_THROTTLE_ERRORS:
+            # Throttled means reachable - keep the last known state
+            self.throttled += 1
+            logger.warning(f"Readiness check throttled, keeping previous state: {str(error)}")
+            return
+
+        self._failures += 1
+        logger.error(f"Readiness check failed ({self._failures} in a row): {str(error)}")
+        if self._failures >= self.failure_threshold or not self._state[0]:
+            self._set(False, {'source': 'check', 'error': str(error)})
+
+    def refresh(self):
+        """Update the state once (short-circuit or check)"""
+        if self._short_circuit():
+            return
+        try:
+            result = self.check()
+        except Exception as e:
+            self._record(error=e)
+        else:
+            self._record(result)
+
+    async def refresh_async(self):
+        """refresh() with an async check"""
+        if self._short_circuit():
+            return
+        try:
+            result = await self.check()
+        except Exception as e:
+            self._record(error=e)
+        else:
+            self._record(result)
+
+    def start(self):
+        """Refresh on a background thread, starting now"""
+        def run():
+            while not self._stop.is_set():
+                self.refresh()
+                self._stop.wait(self.next_delay())
+
+        threading.Thread(target=run, name='readiness', daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    async def run_async(self):
+        """Refresh forever on the event loop; cancel the task to stop"""
+        while True:
+            await self.refresh_async()
+            await asyncio.sleep(self.next_delay())
+
+    def stats(self):
+        """Return readiness counters"""
+        ready, body = self._state
+        return {
+            'ready': ready,
+            'checks': self.checks,
+            'shortCircuits': self.short_circuits,
+            'throttled': self.throttled,
+            'consecutiveFailures': self._failures,
+            'checkedAt': body.get('checkedAt')
+        }
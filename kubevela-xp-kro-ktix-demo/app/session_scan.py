@@ -0,0 +1,150 @@
+"""
+Parallel segmented scan engine
+Splits a DynamoDB Scan into TotalSegments/Segment slices, runs them on a
+bounded thread pool (or as asyncio tasks for the ASGI app) and hands pages
+back to the caller as they arrive
+"""
+
+import asyncio
+import contextvars
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Marker a segment worker puts on the queue when it has finished
+_SEGMENT_DONE = object()
+
+
+def _call_params(kwargs):
+    """Copy Scan/Query arguments for one call
+
+    boto3 merges generated placeholders into ExpressionAttributeNames in
+    place, so every call (and every segment thread) gets its own copy.
+    """
+    params = dict(kwargs)
+    if 'ExpressionAttributeNames' in params:
+        params['ExpressionAttributeNames'] = dict(params['ExpressionAttributeNames'])
+    return params
+
+
+def scan_pages(scan, **kwargs):
+    """Yield raw Scan/Query responses, following LastEvaluatedKey across pages"""
+    while True:
+        response = scan(**_call_params(kwargs))
+        yield response
+        if 'LastEvaluatedKey' not in response:
+            return
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def parallel_scan_pages(scan, total_segments, max_workers=None, **kwargs):
+    """Yield raw scan responses from all segments in arrival order
+
+    At most 2 pages per worker are buffered, so memory stays flat when the
+    consumer is slower than DynamoDB. If the consumer stops early (e.g. the
+    client disconnected from a streamed response) the workers are told to
+    stop after their current page.
+    """
+    if total_segments <= 1:
+        yield from scan_pages(scan, **kwargs)
+        return
+
+    workers = min(total_segments, max_workers or total_segments)
+    pages = queue.Queue(maxsize=workers * 2)
+    stop = threading.Event()
+
+    def put(entry):
+        # Re-check stop periodically so an abandoned consumer can't block us forever
+        while not stop.is_set():
+            try:
+                pages.put(entry, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run(segment):
+        try:
+            for response in scan_pages(scan, Segment=segment, TotalSegments=total_segments, **kwargs):
+                if not put(response):
+                    return
+        except Exception as e:
+            put(e)
+            return
+        put(_SEGMENT_DONE)
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scan-segment')
+    try:
+        for segment in range(total_segments):
+            # Segments run in the caller's context (e.g. its rate-limit mode)
+            executor.submit(contextvars.copy_context().run, run, segment)
+
+        remaining = total_segments
+        while remaining:
+            entry = pages.get()
+            if entry is _SEGMENT_DONE:
+                remaining -= 1
+            elif isinstance(entry, Exception):
+                raise entry
+            else:
+                yield entry
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def parallel_scan(scan, total_segments, max_workers=None, **kwargs):
+    """Yield items from a (possibly parallel) scan as pages arrive"""
+    for response in parallel_scan_pages(scan, total_segments, max_workers, **kwargs):
+        yield from response.get('Items', [])
+
+
+async def scan_pages_async(scan, **kwargs):
+    """Async version of scan_pages for aioboto3 Scan/Query calls"""
+    while True:
+        response = await scan(**_call_params(kwargs))
+        yield response
+        if 'LastEvaluatedKey' not in response:
+            return
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+async def parallel_scan_pages_async(scan, total_segments, **kwargs):
+    """Async version of parallel_scan_pages running each segment as a task"""
+    if total_segments <= 1:
+        async for response in scan_pages_async(scan, **kwargs):
+            yield response
+        return
+
+    pages = asyncio.Queue(maxsize=total_segments * 2)
+
+    async def run(segment):
+        try:
+            async for response in scan_pages_async(scan, Segment=segment, TotalSegments=total_segments, **kwargs):
+                await pages.put(response)
+        except Exception as e:
+            await pages.put(e)
+            return
+        await pages.put(_SEGMENT_DONE)
+
+    tasks = [asyncio.create_task(run(segment)) for segment in range(total_segments)]
+    try:
+        remaining = total_segments
+        while remaining:
+            entry = await pages.get()
+            if entry is _SEGMENT_DONE:
+                remaining -= 1
+            elif isinstance(entry, Exception):
+                raise entry
+            else:
+                yield entry
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def parallel_scan_async(scan, total_segments, **kwargs):
+    """Async version of parallel_scan"""
+    async for response in parallel_scan_pages_async(scan, total_segments, **kwargs):
+        for item in response.get('Items', []):
+            yield item
@@ -0,0 +1,370 @@
+"""
+Tenant sharding of sessions across DynamoDB tables
+One table caps the write throughput of every tenant sharing it. With
+SHARD_TABLES set, each user's sessions live in one of several tables,
+picked on a consistent-hash ring keyed by userId (SHARD_BY=user) or by the
+tenant prefix of the userId (SHARD_BY=tenant, keeps a tenant together).
+SHARD_TENANT_TABLES pins tenants to tables of their own, off the ring.
+Session IDs embed the userId, so a session's table follows from its ID.
+
+Every table gets its own Shard: resource, low-level store and metrics, so
+one hot shard's throttling shows up (and is rate limited) on its own.
+
+Adding tables moves about 1/N of the users to new owners. To reshard:
+
+    python session_shard.py plan --to a,b,c      # count the sessions that would move
+    python session_shard.py copy --to a,b,c      # copy them to their new tables
+    # roll out SHARD_TABLES=a,b,c, then catch up with what was written meanwhile
+    python session_shard.py copy --to a,b,c
+    python session_shard.py cleanup --to a,b,c   # delete moved sessions from their old tables
+
+--from defaults to the current SHARD_TABLES / DYNAMODB_TABLE_NAME.
+"""
+
+import argparse
+import bisect
+import hashlib
+import json
+import logging
+import threading
+import time
+from functools import partial
+
+import boto3
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+
+from session_batch import batch_get, batch_write
+from session_common import (
+    AWS_REGION, BATCH_MAX_RETRIES, BATCH_RETRY_BASE_DELAY, SCAN_SEGMENTS, SHARD_BY, SHARD_TABLES,
+    SHARD_TENANT_SEPARATOR, SHARD_TENANT_TABLES, SHARD_VIRTUAL_NODES, TABLE_LAYOUT, TABLE_NAME,
+    session_key, session_user_id
+)
+from session_limiter import consumed_units, data_plane, on_throttle, request_consumed_capacity
+from session_migrate import run_segments
+from session_scan import scan_pages
+from session_store import client_config, session_store
+
+logger = logging.getLogger(__name__)
+
+
+def _hash(key):
+    """Stable 64-bit hash (the same in every process, unlike hash())"""
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent-hash ring: adding a node only moves the keys that land on it"""
+
+    def __init__(self, nodes, virtual_nodes=64):
+        points = sorted((_hash(f'{node}#{replica}'), node) for node in nodes for replica in range(virtual_nodes))
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node(self, key):
+        """The node owning `key`: the first point clockwise from its hash"""
+        return self._nodes[bisect.bisect(self._hashes, _hash(key)) % len(self._nodes)]
+
+
+class Placement:
+    """Which table holds a user's sessions"""
+
+    def __init__(self, tables, by='user', tenant_tables=None, separator=':', virtual_nodes=64):
+        self.by = by
+        self.tenant_tables = dict(tenant_tables or {})
+        self.separator = separator
+        self.ring = HashRing(tables, virtual_nodes)
+        # Ring tables first, then the pinned tenants' tables
+        self.tables = list(dict.fromkeys(list(tables) + list(self.tenant_tables.values())))
+
+    def tenant(self, user_id):
+        return user_id.split(self.separator, 1)[0]
+
+    def table_for_user(self, user_id):
+        tenant = self.tenant(user_id)
+        if tenant in self.tenant_tables:
+            return self.tenant_tables[tenant]
+        return self.ring.node(tenant if self.by == 'tenant' else user_id)
+
+
+def placement(tables=None, tenant_tables=None):
+    """Placement from the SHARD_* settings
+
+    The ring defaults to SHARD_TABLES, or just DYNAMODB_TABLE_NAME - which
+    then holds every tenant not pinned by SHARD_TENANT_TABLES.
+    """
+    if tables is None:
+        tables = SHARD_TABLES or [TABLE_NAME]
+    if tenant_tables is None:
+        tenant_tables = SHARD_TENANT_TABLES
+    return Placement(tables, SHARD_BY, tenant_tables, SHARD_TENANT_SEPARATOR, SHARD_VIRTUAL_NODES)
+
+
+class ShardMetrics:
+    """Per-table call, error, throttle, capacity and latency counters, fed by botocore events"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = {}
+        self.errors = 0
+        self.throttles = 0
+        self.consumed = 0.0
+        self.latency = 0.0
+
+    def observe(self, client):
+        """Count the data-plane calls made through a DynamoDB client"""
+        def before_call(context, **kwargs):
+            context['shard_call_started'] = time.perf_counter()
+
+        def throttled(operation):
+            with self._lock:
+                self.throttles += 1
+
+        def after_call(http_response, parsed, model, context, **kwargs):
+            if not data_plane(model):
+                return
+            elapsed = time.perf_counter() - context.get('shard_call_started', time.perf_counter())
+            units = consumed_units(parsed)
+            with self._lock:
+                self.calls[model.name] = self.calls.get(model.name, 0) + 1
+                self.latency += elapsed
+                if http_response.status_code >= 300:
+                    self.errors += 1
+                if units is not None:
+                    self.consumed += units
+
+        # Ask for ConsumedCapacity so each shard's load is visible
+        request_consumed_capacity(client)
+        on_throttle(client, throttled)
+        events = client.meta.events
+        events.register('before-call.dynamodb', before_call)
+        events.register('after-call.dynamodb', after_call)
+
+    def stats(self):
+        with self._lock:
+            calls = sum(self.calls.values())
+            return {
+                'calls': calls,
+                'callsByOperation': dict(self.calls),
+                'errors': self.errors,
+                'throttles': self.throttles,
+                'consumedUnits': round(self.consumed, 1),
+                'meanLatencyMs': round(self.latency / calls * 1e3, 2) if calls else None
+            }
+
+
+class Shard:
+    """Handles for one session table
+
+    Its own resource (scans, queries, batches) and low-level store (single
+    items), so shards keep separate connection pools and metrics. The app
+    sets up the per-shard workers (limiter, write-behind, sweeper); those
+    left None are off.
+    """
+
+    def __init__(self, name, layout=TABLE_LAYOUT):
+        self.name = name
+        self.dynamodb = boto3.resource('dynamodb', region_name=AWS_REGION, config=client_config())
+        self.table = self.dynamodb.Table(name)
+        self.store = session_store(
+            boto3.client('dynamodb', region_name=AWS_REGION, config=client_config()), name, layout
+        )
+        self.clients = (self.dynamodb.meta.client, self.store.client)
+        self.metrics = ShardMetrics()
+        for client in self.clients:
+            self.metrics.observe(client)
+
+        self.limiter = None
+        self.write_behind = None
+        self.sweeper = None
+        # Cached result of the user index lookup (None = not checked yet)
+        self.user_index_active = None
+
+
+class ShardRouter:
+    """Routes users and session IDs to their Shard"""
+
+    def __init__(self, placement, shard_factory=Shard):
+        self.placement = placement
+        self.shards = {name: shard_factory(name) for name in placement.tables}
+
+    def __iter__(self):
+        return iter(self.shards.values())
+
+    def __len__(self):
+        return len(self.shards)
+
+    @property
+    def default(self):
+        """The first table: the only one when sharding is off"""
+        return next(iter(self.shards.values()))
+
+    def for_user(self, user_id):
+        return self.shards[self.placement.table_for_user(user_id)]
+
+    def for_session(self, session_id):
+        """The shard holding a session, or None if the ID names no user (so no such session)"""
+        if len(self.shards) == 1:
+            return self.default
+        user_id = session_user_id(session_id)
+        return self.for_user(user_id) if user_id is not None else None
+
+    def group(self, session_ids):
+        """Split session IDs by shard: ({shard: [ids]}, [IDs that route nowhere])"""
+        groups = {}
+        unrouted = []
+        for session_id in session_ids:
+            shard = self.for_session(session_id)
+            if shard is None:
+                unrouted.append(session_id)
+            else:
+                groups.setdefault(shard, []).append(session_id)
+        return groups, unrouted
+
+    def stats(self):
+        return {
+            'enabled': len(self.shards) > 1,
+            'shardBy': self.placement.by,
+            'tenantTables': self.placement.tenant_tables,
+            'shards': {shard.name: shard.metrics.stats() for shard in self}
+        }
+
+
+def shard_router():
+    """ShardRouter over the SHARD_* tables (a single DYNAMODB_TABLE_NAME shard when sharding is off)"""
+    return ShardRouter(placement())
+
+
+def _moves(items, table_name, new):
+    """The items of a table's scan page that the new placement puts elsewhere, as (item, new table)"""
+    for item in items:
+        target = new.table_for_user(item['userId'])
+        if target != table_name:
+            yield item, target
+
+
+def _plan_segment(dynamodb, table_name, new, segments, segment):
+    counters = {}
+    for response in scan_pages(
+        dynamodb.Table(table_name).scan, Segment=segment, TotalSegments=segments, ProjectionExpression='userId'
+    ):
+        for _, target in _moves(response.get('Items', []), table_name, new):
+            counters[target] = counters.get(target, 0) + 1
+    return counters
+
+
+def _copy_segment(dynamodb, table_name, new, segments, segment):
+    counters = {'copied': 0, 'current': 0, 'failed': 0}
+    unexpired = Attr('ttl').gt(int(time.time()))
+    for response in scan_pages(
+        dynamodb.Table(table_name).scan, Segment=segment, TotalSegments=segments, FilterExpression=unexpired
+    ):
+        for item, target in _moves(response.get('Items', []), table_name, new):
+            # Touch extends ttl without changing updatedAt, so a later ttl is newer too
+            condition = Attr('id').not_exists() | Attr('ttl').lt(item['ttl'])
+            if 'updatedAt' in item:
+                condition = condition | Attr('updatedAt').not_exists() | Attr('updatedAt').lt(item['updatedAt'])
+            try:
+                dynamodb.Table(target).put_item(Item=item, ConditionExpression=condition)
+                counters['copied'] += 1
+            except ClientError as e:
+                if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                    counters['current'] += 1
+                    continue
+                logger.error(f"Copying session {item['id']} to {target} failed: {str(e)}")
+                counters['failed'] += 1
+    return counters
+
+
+def _cleanup_segment(dynamodb, table_name, new, layout, segments, segment):
+    counters = {'deleted': 0, 'notCopied': 0, 'failed': 0}
+    for response in scan_pages(dynamodb.Table(table_name).scan, Segment=segment, TotalSegments=segments):
+        by_target = {}
+        for item, target in _moves(response.get('Items', []), table_name, new):
+            by_target.setdefault(target, []).append(item)
+
+        for target, items in by_target.items():
+            found, unread = batch_get(
+                dynamodb, target, [session_key(item, layout) for item in items],
+                max_retries=BATCH_MAX_RETRIES, base_delay=BATCH_RETRY_BASE_DELAY,
+                ConsistentRead=True, ProjectionExpression='id'
+            )
+            copied = {item['id'] for item in found}
+            deletes = [{'DeleteRequest': {'Key': session_key(item, layout)}} for item in items if item['id'] in copied]
+            failed = batch_write(
+                dynamodb, table_name, deletes, max_retries=BATCH_MAX_RETRIES, base_delay=BATCH_RETRY_BASE_DELAY
+            )
+            counters['deleted'] += len(deletes) - len(failed)
+            counters['failed'] += len(failed) + len(unread)
+            counters['notCopied'] += len(items) - len(copied) - len(unread)
+    return counters
+
+
+def plan(dynamodb, old, new, segments=SCAN_SEGMENTS):
+    """Count, per current table, the sessions the new placement would move to each other table"""
+    return {
+        table_name: run_segments(partial(_plan_segment, dynamodb, table_name, new, segments), segments)
+        for table_name in old.tables
+    }
+
+
+def copy(dynamodb, old, new, segments=SCAN_SEGMENTS):
+    """Copy unexpired sessions to the table the new placement gives them
+
+    A copy never replaces a newer version: it only overwrites a target
+    item that is missing, older by updatedAt, or expiring earlier (a touch
+    only moves ttl). Safe to repeat, so run it before the rollout and again
+    after it to catch up.
+    """
+    totals = {}
+    for table_name in old.tables:
+        totals[table_name] = run_segments(partial(_copy_segment, dynamodb, table_name, new, segments), segments)
+        logger.info(f"{table_name}: {totals[table_name]}")
+    return totals
+
+
+def cleanup(dynamodb, old, new, segments=SCAN_SEGMENTS, layout=TABLE_LAYOUT):
+    """Delete moved sessions from their old tables, once their new table has them
+
+    Sessions the new table lacks (expired, or not copied yet) stay put:
+    expired ones go with DynamoDB TTL, the rest need another copy run.
+    """
+    totals = {}
+    for table_name in old.tables:
+        totals[table_name] = run_segments(
+            partial(_cleanup_segment, dynamodb, table_name, new, layout, segments), segments
+        )
+        logger.info(f"{table_name}: {totals[table_name]}")
+    return totals
+
+
+def _tables(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def _tenant_tables(value):
+    return dict(entry.strip().split('=', 1) for entry in value.split(',') if '=' in entry)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Move sessions between shard tables after a placement change')
+    parser.add_argument('step', choices=('plan', 'copy', 'cleanup'))
+    parser.add_argument('--from', dest='source', type=_tables, help='current shard tables (default: SHARD_TABLES)')
+    parser.add_argument('--to', dest='target', type=_tables, required=True, help='new shard tables, comma-separated')
+    parser.add_argument('--from-tenant-tables', type=_tenant_tables,
+                        help='current tenant=table pins (default: SHARD_TENANT_TABLES)')
+    parser.add_argument('--to-tenant-tables', type=_tenant_tables,
+                        help='new tenant=table pins (default: SHARD_TENANT_TABLES)')
+    parser.add_argument('--segments', type=int, default=SCAN_SEGMENTS, help='parallel scan segments (and threads)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    dynamodb = boto3.resource('dynamodb', region_name=AWS_REGION, config=client_config())
+    old = placement(args.source, args.from_tenant_tables)
+    new = placement(args.target, args.to_tenant_tables)
+    step = {'plan': plan, 'copy': copy, 'cleanup': cleanup}[args.step]
+    print(json.dumps(step(dynamodb, old, new, args.segments)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+"""
+Low-level DynamoDB data access for single-session operations
+Talks to the plain botocore client with a hand-rolled attribute
+serializer for the fixed session schema, skipping the resource layer's
+generic TypeSerializer/TypeDeserializer and Decimal conversion
+"""
+
+import threading
+from collections import OrderedDict, defaultdict
+
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from session_common import (
+    DYNAMODB_CONNECT_TIMEOUT, DYNAMODB_MAX_ATTEMPTS, DYNAMODB_MAX_POOL_CONNECTIONS,
+    DYNAMODB_READ_TIMEOUT, DYNAMODB_RETRY_MODE, DYNAMODB_TCP_KEEPALIVE, SORT_KEY_ATTRIBUTE, SORT_KEY_CACHE_SIZE,
+    TABLE_LAYOUT, session_user_id
+)
+
+# Session attributes and their DynamoDB types
+STRING_ATTRIBUTES = ('id', 'userId', 'data', 'createdAt', 'updatedAt', 'expiryBucket', SORT_KEY_ATTRIBUTE)
+NUMBER_ATTRIBUTES = ('ttl',)
+
+# Fallback for attributes outside the fixed schema
+_serializer = TypeSerializer()
+_deserializer = TypeDeserializer()
+
+
+def client_config():
+    """botocore Config for the DynamoDB client and resource"""
+    return Config(
+        max_pool_connections=DYNAMODB_MAX_POOL_CONNECTIONS,
+        tcp_keepalive=DYNAMODB_TCP_KEEPALIVE,
+        connect_timeout=DYNAMODB_CONNECT_TIMEOUT,
+        read_timeout=DYNAMODB_READ_TIMEOUT,
+        retries={'mode': DYNAMODB_RETRY_MODE, 'max_attempts': DYNAMODB_MAX_ATTEMPTS}
+    )
+
+
+def serialize_value(name, value):
+    """Convert one session attribute to a DynamoDB attribute value"""
+    # `data` may also be a map or compressed bytes, depending on the storage codec
+    if name in STRING_ATTRIBUTES and isinstance(value, str):
+        return {'S': value}
+    if name in NUMBER_ATTRIBUTES:
+        return {'N': str(int(value))}
+    return _serializer.serialize(value)
+
+
+def serialize_session(item):
+    """Convert a session item to DynamoDB attribute values"""
+    return {name: serialize_value(name, value) for name, value in item.items()}
+
+
+def deserialize_session(attributes):
+    """Convert DynamoDB attribute values to a session item (ttl as int, not Decimal)"""
+    item = {}
+    for name, value in attributes.items():
+        if name in STRING_ATTRIBUTES and 'S' in value:
+            item[name] = value['S']
+        elif name in NUMBER_ATTRIBUTES and 'N' in value:
+            item[name] = int(value['N'])
+        else:
+            item[name] = _deserializer.deserialize(value)
+    return item
+
+
+class SessionStore:
+    """Get/put/update/delete of single sessions on a low-level DynamoDB client"""
+
+    def __init__(self, client, table_name):
+        self.client = client
+        self.table_name = table_name
+
+    def _key(self, session_id):
+        """Table key of a session as DynamoDB attribute values, or None if it can't exist"""
+        return {'id': {'S': session_id}}
+
+    def keys(self, session_ids):
+        """Map session IDs to table keys (plain values, for the resource API)"""
+        return {session_id: {'id': session_id} for session_id in session_ids}
+
+    def remember(self, items):
+        """Note the keys of session items written without this store; the id layout needs none"""
+
+    def get(self, session_id):
+        """Return the session item, or None if it does not exist"""
+        response = self.client.get_item(TableName=self.table_name, Key=self._key(session_id))
+        if 'Item' not in response:
+            return None
+        return deserialize_session(response['Item'])
+
+    def put(self, item):
+        """Write a session item"""
+        self.client.put_item(TableName=self.table_name, Item=serialize_session(item))
+
+    def update_data(self, session_id, data, updated_at):
+        """Replace an existing session's (encoded) data and return the updated item
+
+        Raises ClientError (ConditionalCheckFailedException) if the session
+        does not exist.
+        """
+        key = self._key(session_id)
+        if key is None:
+            raise _not_found('UpdateItem')
+        response = self.client.update_item(
+            TableName=self.table_name,
+            Key=key,
+            UpdateExpression='SET #data = :data, updatedAt = :updated',
+            ConditionExpression='attribute_exists(id)',
+            ExpressionAttributeNames={'#data': 'data'},
+            ExpressionAttributeValues={
+                ':data': serialize_value('data', data),
+                ':updated': {'S': updated_at}
+            },
+            ReturnValues='ALL_NEW'
+        )
+        return deserialize_session(response['Attributes'])
+
+    def touch(self, session_id, ttl, bucket, now):
+        """Set a session's ttl and expiryBucket, touching no other attribute
+
+        Raises ClientError (ConditionalCheckFailedException) if the session
+        does not exist or expired before `now`; the error response carries
+        the current item when it exists.
+        """
+        key = self._key(session_id)
+        if key is None:
+            raise _not_found('UpdateItem')
+        self.client.update_item(
+            TableName=self.table_name,
+            Key=key,
+            UpdateExpression='SET #ttl = :ttl, expiryBucket = :bucket',
+            ConditionExpression='attribute_exists(id) AND #ttl > :now',
+            ExpressionAttributeNames={'#ttl': 'ttl'},
+            ExpressionAttributeValues={
+                ':ttl': {'N': str(ttl)},
+                ':bucket': {'S': bucket},
+                ':now': {'N': str(now)}
+            },
+            ReturnValuesOnConditionCheckFailure='ALL_OLD'
+        )
+
+    def delete(self, session_id):
+        """Delete a session (no error if it does not exist)"""
+        key = self._key(session_id)
+        if key is not None:
+            self.client.delete_item(TableName=self.table_name, Key=key)
+
+
+class CompositeSessionStore(SessionStore):
+    """SessionStore for the composite layout: userId partition key, createdAtId sort key
+
+    Sessions are still addressed by ID. A session's createdAtId never
+    changes, so the keys of sessions this store has written or found are
+    remembered (up to sort_key_cache_size) and addressed with single-item
+    calls. Other IDs are found with a Query on the user's partition - the
+    userId is parsed out of the ID, so only IDs generated by this API
+    (session-<userId>-<hex>) resolve.
+    """
+
+    def __init__(self, client, table_name, sort_key_cache_size=SORT_KEY_CACHE_SIZE):
+        super().__init__(client, table_name)
+        self.sort_key_cache_size = sort_key_cache_size
+        # session ID -> (userId, createdAtId), least recently used first
+        self._sort_keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def remember(self, items):
+        for item in items:
+            self._remember(item['id'], item['userId'], item[SORT_KEY_ATTRIBUTE])
+
+    def _remember(self, session_id, user_id, sort_key):
+        if self.sort_key_cache_size <= 0:
+            return
+        with self._lock:
+            self._sort_keys[session_id] = (user_id, sort_key)
+            self._sort_keys.move_to_end(session_id)
+            while len(self._sort_keys) > self.sort_key_cache_size:
+                self._sort_keys.popitem(last=False)
+
+    def _known_key(self, session_id):
+        """A remembered session's (userId, createdAtId), or None"""
+        with self._lock:
+            key = self._sort_keys.get(session_id)
+            if key is not None:
+                self._sort_keys.move_to_end(session_id)
+            return key
+
+    def _find(self, session_id, projection=None):
+        """Return a session's raw item (or just the projected attributes) by querying its user's partition"""
+        user_id = session_user_id(session_id)
+        if user_id is None:
+            return None
+
+        params = {
+            'TableName': self.table_name,
+            'KeyConditionExpression': 'userId = :user',
+            'FilterExpression': 'id = :id',
+            'ExpressionAttributeValues': {':user': {'S': user_id}, ':id': {'S': session_id}}
+        }
+        if projection:
+            params['ProjectionExpression'] = projection
+        while True:
+            response = self.client.query(**params)
+            if response.get('Items'):
+                item = response['Items'][0]
+                self._remember(session_id, user_id, item[SORT_KEY_ATTRIBUTE]['S'])
+                return item
+            if 'LastEvaluatedKey' not in response:
+                return None
+            params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def _key(self, session_id):
+        known = self._known_key(session_id)
+        if known is not None:
+            return {'userId': {'S': known[0]}, SORT_KEY_ATTRIBUTE: {'S': known[1]}}
+        return self._find(session_id, projection=f'userId, {SORT_KEY_ATTRIBUTE}')
+
+    def keys(self, session_ids):
+        """Map session IDs to table keys, with one paginated Query per user for those not remembered
+
+        IDs that don't resolve are left out.
+        """
+        keys = {}
+        wanted = defaultdict(set)
+        for session_id in session_ids:
+            known = self._known_key(session_id)
+            if known is not None:
+                keys[session_id] = {'userId': known[0], SORT_KEY_ATTRIBUTE: known[1]}
+                continue
+            user_id = session_user_id(session_id)
+            if user_id is not None:
+                wanted[user_id].add(session_id)
+
+        for user_id, ids in wanted.items():
+            params = {
+                'TableName': self.table_name,
+                'KeyConditionExpression': 'userId = :user',
+                'ProjectionExpression': f'id, {SORT_KEY_ATTRIBUTE}',
+                'ExpressionAttributeValues': {':user': {'S': user_id}}
+            }
+            while True:
+                response = self.client.query(**params)
+                for item in response.get('Items', []):
+                    if item['id']['S'] in ids:
+                        keys[item['id']['S']] = {'userId': user_id, SORT_KEY_ATTRIBUTE: item[SORT_KEY_ATTRIBUTE]['S']}
+                        self._remember(item['id']['S'], user_id, item[SORT_KEY_ATTRIBUTE]['S'])
+                if 'LastEvaluatedKey' not in response:
+                    break
+                params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        return keys
+
+    def get(self, session_id):
+        if self._known_key(session_id) is not None:
+            return super().get(session_id)
+        item = self._find(session_id)
+        return deserialize_session(item) if item is not None else None
+
+    def put(self, item):
+        super().put(item)
+        self.remember([item])
+
+
+def _not_found(operation_name):
+    """The error a conditional write on a missing session raises"""
+    return ClientError({'Error': {
+        'Code': 'ConditionalCheckFailedException', 'Message': 'The conditional request failed'
+    }}, operation_name)
+
+
+def session_store(client, table_name, layout=TABLE_LAYOUT):
+    """SessionStore for the table's key layout"""
+    if layout == 'composite':
+        return CompositeSessionStore(client, table_name)
+    return SessionStore(client, table_name)
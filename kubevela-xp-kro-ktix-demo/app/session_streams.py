@@ -0,0 +1,585 @@
+"""
+Cross-replica cache coherence from DynamoDB Streams
+One worker per pod tails the session table's stream (enabled by the
+dynamodb-streams-xp / dynamodb-streams-kro traits) and evicts - or, with
+NEW_IMAGE streams, refreshes - every cached session another replica changed
+or deleted, in its own cache and, over Unix datagram sockets, in the caches
+of the pod's other workers. DynamoDB Streams serves only about two readers
+per shard, so the workers elect the reader with a file lock instead of each
+reading the stream. While the consumer keeps up, cached sessions may
+live for STREAMS_CACHE_MAX_STALENESS_SECONDS; once it falls behind by more
+than STREAMS_MAX_LAG_SECONDS (or can't read the stream) the cache is cleared
+and drops back to SESSION_CACHE_MAX_STALENESS_SECONDS until it catches up.
+
+Positions are checkpointed per shard in memory, so expired iterators and
+transient errors resume after the last applied record. They are not
+persisted: a new reader clears the pod's caches and only needs changes
+from then on, so it starts at LATEST.
+"""
+
+import errno
+import fcntl
+import json
+import logging
+import os
+import socket
+import stat
+import threading
+import time
+from decimal import Decimal
+
+import boto3
+from botocore.exceptions import ClientError
+
+from session_codec import decode_data
+from session_common import (
+    AWS_REGION, SESSION_CACHE_MAX_STALENESS_SECONDS, STREAMS_CACHE_MAX_STALENESS_SECONDS, STREAMS_CACHE_MODE,
+    SORT_KEY_ATTRIBUTE, STREAMS_MAX_LAG_SECONDS, STREAMS_POLL_INTERVAL, STREAMS_SHARD_REFRESH_SECONDS,
+    STREAMS_SOCKET_DIR, key_session_id, session_etag, session_payload
+)
+from session_ready import CHECK_THROTTLE_ERRORS
+from session_store import client_config, deserialize_session
+
+logger = logging.getLogger(__name__)
+
+# Most records GetRecords returns per call
+GET_RECORDS_LIMIT = 1000
+# Larger refresh messages are sent to the other workers as evictions instead
+MAX_MESSAGE_BYTES = 64 * 1024
+# Receive buffer for one message
+RECEIVE_BYTES = 256 * 1024
+
+
+class StreamCacheConsumer:
+    """Applies a table's stream to a SessionCache on a background thread
+
+    Shards are read parent first. Shards open when the consumer starts are
+    read from LATEST; shards that appear later (splits) from TRIM_HORIZON,
+    so no change made after the start is skipped.
+    """
+
+    def __init__(self, dynamodb_client, streams_client, table_name, cache, mode=STREAMS_CACHE_MODE,
+                 poll_interval=STREAMS_POLL_INTERVAL, shard_refresh_seconds=STREAMS_SHARD_REFRESH_SECONDS,
+                 max_lag_seconds=STREAMS_MAX_LAG_SECONDS,
+                 long_staleness_seconds=STREAMS_CACHE_MAX_STALENESS_SECONDS,
+                 short_staleness_seconds=SESSION_CACHE_MAX_STALENESS_SECONDS):
+        if mode not in ('evict', 'refresh'):
+            raise ValueError(f"STREAMS_CACHE_MODE must be evict or refresh, got {mode!r}")
+        self.dynamodb_client = dynamodb_client
+        self.streams = streams_client
+        self.table_name = table_name
+        self.cache = cache
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.shard_refresh_seconds = shard_refresh_seconds
+        self.max_lag_seconds = max_lag_seconds
+        self.long_staleness_seconds = long_staleness_seconds
+        self.short_staleness_seconds = short_staleness_seconds
+        self.stream_arn = None
+        # shard_id -> SequenceNumber of the last applied record (the checkpoint)
+        self._checkpoints = {}
+        # shard_id -> current iterator, for shards still being read
+        self._iterators = {}
+        # shard_id -> {'lagSeconds', 'records'} for the stats
+        self._shards = {}
+        # Shards read to the end, or closed before the consumer started
+        self._finished = set()
+        self._discovered_at = None
+        self._healthy = False
+        # Short cache lifetimes until this table's stream is caught up
+        cache.set_max_staleness(table_name, short_staleness_seconds)
+        self._last_round = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.records = 0
+        self.evictions = 0
+        self.refreshes = 0
+        self.resets = 0
+        self.errors = 0
+        self.throttles = 0
+
+    def _describe_shards(self):
+        shards = []
+        kwargs = {'StreamArn': self.stream_arn}
+        while True:
+            description = self.streams.describe_stream(**kwargs)['StreamDescription']
+            shards.extend(description.get('Shards', []))
+            last = description.get('LastEvaluatedShardId')
+            if not last:
+                return shards
+            kwargs['ExclusiveStartShardId'] = last
+
+    def _iterator(self, shard_id, iterator_type):
+        kwargs = {'StreamArn': self.stream_arn, 'ShardId': shard_id, 'ShardIteratorType': iterator_type}
+        if iterator_type == 'AFTER_SEQUENCE_NUMBER':
+            kwargs['SequenceNumber'] = self._checkpoints[shard_id]
+        return self.streams.get_shard_iterator(**kwargs)['ShardIterator']
+
+    def _resume(self, shard_id):
+        """Iterator right after the checkpoint
+
+        Without one, restart at LATEST and clear the cache, since changes
+        in between are skipped.
+        """
+        if shard_id in self._checkpoints:
+            return self._iterator(shard_id, 'AFTER_SEQUENCE_NUMBER')
+        self.reset()
+        return self._iterator(shard_id, 'LATEST')
+
+    def discover(self):
+        """Find the stream and start reading any shards not seen yet"""
+        first = self.stream_arn is None
+        if first:
+            table = self.dynamodb_client.describe_table(TableName=self.table_name)['Table']
+            self.stream_arn = table.get('LatestStreamArn')
+            if not self.stream_arn or not table.get('StreamSpecification', {}).get('StreamEnabled'):
+                self.stream_arn = None
+                raise RuntimeError(f"Streams are not enabled on table {self.table_name}")
+
+        shards = self._describe_shards()
+        known = set(self._iterators) | self._finished
+        for shard in shards:
+            shard_id = shard['ShardId']
+            if shard_id in known:
+                continue
+            closed = 'EndingSequenceNumber' in shard.get('SequenceNumberRange', {})
+            if first and closed:
+                # History from before this worker had a cache
+                self._finished.add(shard_id)
+                continue
+            if shard.get('ParentShardId') in self._iterators:
+                # Picked up once the parent is read to the end
+                continue
+            self._shards.setdefault(shard_id, {'lagSeconds': 0.0, 'records': 0})
+            self._iterators[shard_id] = self._iterator(shard_id, 'LATEST' if first else 'TRIM_HORIZON')
+        self._discovered_at = time.monotonic()
+
+    def apply(self, record):
+        """Evict or refresh the cached copy of the session a stream record is about"""
+        keys = {name: value.get('S') for name, value in record['dynamodb'].get('Keys', {}).items()}
+        if 'id' not in keys and SORT_KEY_ATTRIBUTE not in keys:
+            return
+        session_id = key_session_id(keys)
+
+        image = record['dynamodb'].get('NewImage')
+        if self.mode == 'refresh' and record['eventName'] != 'REMOVE' and image and 'data' in image:
+            item = deserialize_session(image)
+            written_at = record['dynamodb']['ApproximateCreationDateTime'].timestamp()
+            self.cache.refresh(
+                session_id, session_payload(item, decode_data(item['data'])), item['ttl'],
+                session_etag(item), written_at
+            )
+            self.refreshes += 1
+        else:
+            self.cache.invalidate(session_id)
+            self.evictions += 1
+
+    def _read_shard(self, shard_id):
+        """One GetRecords call; returns the shard's lag in seconds"""
+        try:
+            response = self.streams.get_records(ShardIterator=self._iterators[shard_id], Limit=GET_RECORDS_LIMIT)
+        except ClientError as e:
+            code = e.response['Error']['Code']
+            if code == 'ExpiredIteratorException':
+                self._iterators[shard_id] = self._resume(shard_id)
+                return self._shards[shard_id]['lagSeconds']
+            if code == 'TrimmedDataAccessException':
+                # Records past the checkpoint are gone - cached sessions may have missed changes
+                logger.warning(f"Stream shard {shard_id} trimmed past the checkpoint, clearing the cache")
+                self._checkpoints.pop(shard_id, None)
+                self._iterators[shard_id] = self._iterator(shard_id, 'TRIM_HORIZON')
+                self.reset()
+                return self._shards[shard_id]['lagSeconds']
+            raise
+
+        records = response.get('Records', [])
+        for record in records:
+            self.apply(record)
+            self._checkpoints[shard_id] = record['dynamodb']['SequenceNumber']
+        self.records += len(records)
+
+        shard = self._shards[shard_id]
+        shard['records'] += len(records)
+        if records:
+            created = records[-1]['dynamodb']['ApproximateCreationDateTime'].timestamp()
+            shard['lagSeconds'] = max(0.0, time.time() - created)
+        else:
+            # Nothing left to read right now: caught up
+            shard['lagSeconds'] = 0.0
+
+        next_iterator = response.get('NextShardIterator')
+        if next_iterator is None:
+            # Closed shard read to the end; its children start on the next discovery
+            del self._iterators[shard_id]
+            self._finished.add(shard_id)
+            self._discovered_at = None
+        else:
+            self._iterators[shard_id] = next_iterator
+        return shard['lagSeconds']
+
+    def poll(self):
+        """Read every open shard once; returns the largest lag in seconds"""
+        if self._discovered_at is None or time.monotonic() - self._discovered_at >= self.shard_refresh_seconds:
+            self.discover()
+
+        lag = 0.0
+        for shard_id in list(self._iterators):
+            lag = max(lag, self._read_shard(shard_id))
+        self._last_round = time.monotonic()
+        self._set_healthy(lag <= self.max_lag_seconds)
+        return lag
+
+    def reset(self):
+        """Forget every cached session; changes may have been missed"""
+        self.cache.clear()
+        self.resets += 1
+
+    def _set_healthy(self, healthy):
+        """Long cache lifetimes only while the stream is being applied promptly"""
+        if healthy == self._healthy:
+            return
+        self._healthy = healthy
+        if healthy:
+            logger.info(f"Stream consumer caught up, caching sessions for up to {self.long_staleness_seconds}s")
+            self.cache.set_max_staleness(self.table_name, self.long_staleness_seconds)
+        else:
+            logger.warning(f"Stream consumer behind, caching sessions for up to {self.short_staleness_seconds}s")
+            self.cache.set_max_staleness(self.table_name, self.short_staleness_seconds)
+            # Entries cached with the long lifetime can't be trusted any more
+            self.reset()
+
+    def check_stalled(self):
+        """Drop to short cache lifetimes if no poll round has finished within max_lag_seconds"""
+        if self._last_round is None or time.monotonic() - self._last_round > self.max_lag_seconds:
+            self._set_healthy(False)
+
+    def run_forever(self):
+        """Poll every poll_interval seconds until stop() is called"""
+        delay = self.poll_interval
+        while not self._stop.is_set():
+            try:
+                self.poll()
+                delay = self.poll_interval
+            except Exception as e:
+                self.errors += 1
+                if isinstance(e, ClientError) and e.response['Error']['Code'] in CHECK_THROTTLE_ERRORS:
+                    # Shards allow ~5 GetRecords calls/s shared by every reader
+                    self.throttles += 1
+                    delay = min(delay * 2, max(self.max_lag_seconds, self.poll_interval))
+                else:
+                    logger.error(f"Reading the session table stream failed: {str(e)}")
+                    # Not found yet (e.g. streams not enabled): look again at the shard refresh pace
+                    delay = self.poll_interval if self.stream_arn else self.shard_refresh_seconds
+                    if isinstance(e, ClientError) and e.response['Error']['Code'] == 'ResourceNotFoundException':
+                        # Stream disabled or replaced - look it up again
+                        self.stream_arn = None
+                        self._discovered_at = None
+                        self._iterators.clear()
+                        self._checkpoints.clear()
+                        self._finished.clear()
+                        self.reset()
+                self.check_stalled()
+            self._stop.wait(delay)
+
+    def start(self):
+        """Consume the stream on a background thread"""
+        self._thread = threading.Thread(target=self.run_forever, name='session-streams', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        """Return consumer counters and per-shard lag"""
+        # Read without locking: the consumer thread only adds shards and replaces values
+        shards = {
+            shard_id: dict(self._shards[shard_id], checkpoint=self._checkpoints.get(shard_id))
+            for shard_id in list(self._iterators)
+        }
+        return {
+            'enabled': True,
+            'mode': self.mode,
+            'streamArn': self.stream_arn,
+            'healthy': self._healthy,
+            'maxLagSeconds': round(max((s['lagSeconds'] for s in shards.values()), default=0.0), 3),
+            'secondsSinceLastPoll': (
+                round(time.monotonic() - self._last_round, 3) if self._last_round is not None else None
+            ),
+            'cacheMaxStalenessSeconds': self.cache.max_staleness_seconds,
+            'records': self.records,
+            'evictions': self.evictions,
+            'refreshes': self.refreshes,
+            'resets': self.resets,
+            'errors': self.errors,
+            'throttles': self.throttles,
+            'shards': shards
+        }
+
+
+class CacheFanout:
+    """Stands in for the SessionCache of the pod's stream reader
+
+    Every change is applied to this worker's cache and, while this worker
+    is the reader, sent to the sockets of the pod's other workers as JSON
+    encoded by json_provider. A worker whose socket buffer was full is sent
+    a clear before its next message, since it missed a change.
+    """
+
+    def __init__(self, cache, json_provider, socket_dir, own_path):
+        self.cache = cache
+        self.json_provider = json_provider
+        self.socket_dir = socket_dir
+        self.own_path = own_path
+        self.leading = False
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+        self.peers = []
+        self._missed = set()
+        # owner -> max staleness last set, repeated in every heartbeat
+        self._staleness = {}
+        self.sent = 0
+        self.dropped = 0
+
+    @property
+    def max_staleness_seconds(self):
+        return self.cache.max_staleness_seconds
+
+    def set_max_staleness(self, owner, seconds):
+        self.cache.set_max_staleness(owner, seconds)
+        self._staleness[owner] = seconds
+        self._send(('staleness', owner, seconds))
+
+    def invalidate(self, session_id):
+        self.cache.invalidate(session_id)
+        self._send(('invalidate', session_id))
+
+    def refresh(self, session_id, payload, ttl, etag, written_at):
+        self.cache.refresh(session_id, payload, ttl, etag, written_at)
+        self._send(('refresh', session_id, payload, ttl, etag, written_at))
+
+    def clear(self):
+        self.cache.clear()
+        self._send(('clear',))
+
+    def heartbeat(self):
+        """Pick up workers that started since the last one, and repeat the staleness in effect"""
+        try:
+            names = os.listdir(self.socket_dir)
+        except OSError:
+            names = []
+        self.peers = [
+            path for path in (os.path.join(self.socket_dir, name) for name in names if name.endswith('.sock'))
+            if path != self.own_path
+        ]
+        for owner, seconds in list(self._staleness.items()):
+            self._send(('staleness', owner, seconds))
+
+    def _encode(self, message):
+        # Decimals in session data are written as exact JSON numbers
+        return self.json_provider.dumps(message).encode('utf-8')
+
+    def _send(self, message):
+        if not self.leading:
+            return
+        data = self._encode(message)
+        if len(data) > MAX_MESSAGE_BYTES and message[0] == 'refresh':
+            message = ('invalidate', message[1])
+            data = self._encode(message)
+        for path in self.peers:
+            try:
+                if path in self._missed:
+                    self._socket.sendto(self._encode(('clear',)), path)
+                    self._missed.discard(path)
+                self._socket.sendto(data, path)
+                self.sent += 1
+            except BlockingIOError:
+                # The worker is behind; it gets a clear once it has room again
+                self._missed.add(path)
+                self.dropped += 1
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Left behind by a worker that exited
+                self._missed.discard(path)
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            except OSError as e:
+                if e.errno != errno.EMSGSIZE:
+                    raise
+                self._socket.sendto(self._encode(('invalidate', message[1])), path)
+
+
+class PodStreamReader:
+    """Runs the stream consumers in one worker of the pod and applies their changes in the others
+
+    Every worker listens on its own socket in socket_dir and waits for the
+    lock file there; the one holding it reads the streams until it exits,
+    then the next worker takes over. A worker that hears nothing from the
+    reader for max_silence seconds falls back to the short staleness and
+    clears its cache. The directory must belong to the app's user and be
+    closed to everyone else, so no other user can send changes.
+    """
+
+    def __init__(self, cache, table_names, json_provider, socket_dir=STREAMS_SOCKET_DIR,
+                 heartbeat_interval=STREAMS_POLL_INTERVAL, max_silence=STREAMS_MAX_LAG_SECONDS,
+                 short_staleness_seconds=SESSION_CACHE_MAX_STALENESS_SECONDS, consumer_factory=None):
+        os.makedirs(socket_dir, mode=0o700, exist_ok=True)
+        # makedirs leaves an existing directory alone, e.g. one another user created first
+        info = os.lstat(socket_dir)
+        if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+            raise RuntimeError(
+                f"STREAMS_SOCKET_DIR {socket_dir} must be a directory owned by uid {os.getuid()} "
+                f"with no group or other permissions"
+            )
+        self.cache = cache
+        self.socket_dir = socket_dir
+        self.heartbeat_interval = heartbeat_interval
+        self.max_silence = max_silence
+        self.short_staleness_seconds = short_staleness_seconds
+        self.path = os.path.join(socket_dir, f'{os.getpid()}.sock')
+        self.fanout = CacheFanout(cache, json_provider, socket_dir, self.path)
+        self.table_names = table_names
+        self.consumer_factory = consumer_factory or stream_consumer
+        # Created once this worker is elected
+        self.consumers = {}
+        # owner -> staleness the reader last announced, as applied in this worker
+        self._announced = {name: short_staleness_seconds for name in table_names}
+        self._inbox = None
+        self._lock_fd = None
+        self._last_message = None
+        self._stop = threading.Event()
+        self.received = 0
+        self.silences = 0
+
+    @property
+    def leading(self):
+        return self.fanout.leading
+
+    def start(self):
+        """Listen for the reader's changes and stand for election"""
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        self._inbox = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._inbox.bind(self.path)
+        self._inbox.settimeout(self.max_silence)
+        threading.Thread(target=self._listen, name='session-streams-inbox', daemon=True).start()
+        threading.Thread(target=self._elect, name='session-streams-election', daemon=True).start()
+
+    def _elect(self):
+        fd = os.open(os.path.join(self.socket_dir, 'reader.lock'), os.O_RDWR | os.O_CREAT, 0o600)
+        # Blocks until the reading worker exits (the lock goes with its file descriptor)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        if self._stop.is_set():
+            os.close(fd)
+            return
+        self._lock_fd = fd
+        logger.info(f"Worker {os.getpid()} is the pod's stream reader")
+        self.consumers = {name: self.consumer_factory(self.fanout, name) for name in self.table_names}
+        self.fanout.heartbeat()
+        self.fanout.leading = True
+        # Changes made while no worker was reading were missed
+        self.fanout.clear()
+        for consumer in self.consumers.values():
+            consumer.start()
+        while not self._stop.is_set():
+            self.fanout.heartbeat()
+            self._stop.wait(self.heartbeat_interval)
+
+    def _listen(self):
+        while not self._stop.is_set():
+            try:
+                data = self._inbox.recv(RECEIVE_BYTES)
+            except socket.timeout:
+                if not self.leading:
+                    self._silent()
+                continue
+            except OSError:
+                # Closed by stop()
+                return
+            self._last_message = time.monotonic()
+            self.received += 1
+            self.apply(json.loads(data, parse_float=Decimal))
+
+    def apply(self, message):
+        """Apply a change the reading worker sent"""
+        kind = message[0]
+        if kind == 'invalidate':
+            self.cache.invalidate(message[1])
+        elif kind == 'refresh':
+            session_id, payload, ttl, etag, written_at = message[1:]
+            self.cache.refresh(session_id, payload, ttl, etag, float(written_at))
+        elif kind == 'clear':
+            self.cache.clear()
+        elif kind == 'staleness':
+            owner, seconds = message[1], float(message[2])
+            if seconds < self._announced.get(owner, seconds):
+                # Sessions cached for longer may have missed changes
+                self.cache.clear()
+            self._announced[owner] = seconds
+            self.cache.set_max_staleness(owner, seconds)
+
+    def _silent(self):
+        """No word from the reader: it exited or stalled, so stop trusting long cache lifetimes"""
+        if all(seconds <= self.short_staleness_seconds for seconds in self._announced.values()):
+            return
+        logger.warning(f"No stream changes received for {self.max_silence}s, "
+                       f"caching sessions for up to {self.short_staleness_seconds}s")
+        self.silences += 1
+        self.cache.clear()
+        for owner in self._announced:
+            self._announced[owner] = self.short_staleness_seconds
+            self.cache.set_max_staleness(owner, self.short_staleness_seconds)
+
+    def stop(self):
+        self._stop.set()
+        for consumer in self.consumers.values():
+            consumer.stop()
+        if self._inbox is not None:
+            self._inbox.close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+        if self._lock_fd is not None:
+            # Lets the next worker take over
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def stats(self):
+        """Return this worker's role and counters, plus the consumers' stats on the reader"""
+        stats = {
+            'enabled': True,
+            'role': 'reader' if self.leading else 'follower',
+            'cacheMaxStalenessSeconds': self.cache.max_staleness_seconds,
+            'received': self.received,
+            'secondsSinceLastMessage': (
+                round(time.monotonic() - self._last_message, 3) if self._last_message is not None else None
+            ),
+            'silences': self.silences
+        }
+        if self.leading:
+            stats.update({
+                'workers': len(self.fanout.peers) + 1,
+                'sent': self.fanout.sent,
+                'dropped': self.fanout.dropped,
+                'tables': {name: consumer.stats() for name, consumer in self.consumers.items()}
+            })
+        return stats
+
+
+def stream_consumer(cache, table_name):
+    """StreamCacheConsumer for a session table with its own clients"""
+    return StreamCacheConsumer(
+        boto3.client('dynamodb', region_name=AWS_REGION, config=client_config()),
+        boto3.client('dynamodbstreams', region_name=AWS_REGION, config=client_config()),
+        table_name, cache
+    )
+
+
+def pod_stream_reader(cache, table_names, json_provider):
+    """PodStreamReader for the session tables, sharing STREAMS_SOCKET_DIR with the pod's other workers"""
+    return PodStreamReader(cache, table_names, json_provider)
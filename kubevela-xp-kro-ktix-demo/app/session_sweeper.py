@@ -0,0 +1,257 @@
+"""
+Expired-session sweeper
+DynamoDB TTL deletes expired items eventually (typically within a few days),
+so expired sessions linger in scans and per-user queries until then. The
+sweeper deletes them promptly: it reads expired keys from the sparse
+expiryBucket-ttl-index one TTL bucket at a time - never scanning the table -
+and removes them with rate-limited BatchWriteItem deletes.
+
+Run it as a CronJob / sidecar:
+
+    python session_sweeper.py            # sweep once and exit
+    python session_sweeper.py --loop     # sweep every SWEEPER_INTERVAL seconds
+    python session_sweeper.py --scan     # no index (or pre-index sessions): scan instead
+    python session_sweeper.py --dry-run  # count expired sessions without deleting
+
+or in-process with SWEEPER_ENABLED=true (see session-api.py).
+"""
+
+import argparse
+import json
+import logging
+import signal
+import threading
+import time
+
+import boto3
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
+
+from session_batch import BATCH_WRITE_LIMIT, batch_write
+from session_common import (
+    AWS_REGION, BATCH_MAX_RETRIES, BATCH_RETRY_BASE_DELAY, EXPIRY_BUCKET_SECONDS, EXPIRY_BUCKET_SHARDS,
+    EXPIRY_INDEX_NAME, KEY_ATTRIBUTES, SCAN_MAX_WORKERS, SCAN_SEGMENTS, SWEEPER_DELETES_PER_SECOND,
+    SWEEPER_INTERVAL, SWEEPER_LOOKBACK_HOURS, TABLE_NAME, session_key
+)
+from session_migrate import dual_writer
+from session_scan import parallel_scan, scan_pages
+from session_store import client_config
+
+logger = logging.getLogger(__name__)
+
+
+class SessionSweeper:
+    """Deletes expired sessions found through the expiry-bucket index
+
+    Each run covers the buckets from where the last complete run stopped
+    (or SWEEPER_LOOKBACK_HOURS back on the first run) up to the current
+    one. A bucket whose whole TTL range has passed can't gain sessions -
+    touches only move ttl forward - so once swept it is never read again.
+    """
+
+    def __init__(self, dynamodb, table_name, index_name=EXPIRY_INDEX_NAME,
+                 bucket_seconds=EXPIRY_BUCKET_SECONDS, shards=EXPIRY_BUCKET_SHARDS,
+                 lookback_seconds=SWEEPER_LOOKBACK_HOURS * 3600,
+                 deletes_per_second=SWEEPER_DELETES_PER_SECOND,
+                 max_retries=BATCH_MAX_RETRIES, base_delay=BATCH_RETRY_BASE_DELAY):
+        self.dynamodb = dynamodb
+        self.table = dynamodb.Table(table_name)
+        self.table_name = table_name
+        self.index_name = index_name
+        self.bucket_seconds = bucket_seconds
+        self.shards = shards
+        self.lookback_seconds = lookback_seconds
+        self.deletes_per_second = deletes_per_second
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        # Start of the oldest bucket that may still hold expired sessions
+        self._swept_until = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.runs = 0
+        self.deleted = 0
+        self.failed = 0
+        self.last_run = None
+
+    def index_active(self):
+        """True if the expiry index exists and is ACTIVE"""
+        try:
+            description = self.table.meta.client.describe_table(TableName=self.table_name)['Table']
+        except ClientError as e:
+            logger.warning(f"Could not describe table {self.table_name}: {str(e)}")
+            return False
+
+        for index in description.get('GlobalSecondaryIndexes', []):
+            if index['IndexName'] == self.index_name:
+                return index.get('IndexStatus', 'ACTIVE') == 'ACTIVE'
+        return False
+
+    def expired_keys(self, now, use_index=True):
+        """Yield (bucket, key) for sessions whose ttl is before `now`
+
+        bucket is None for keys found by scanning.
+        """
+        if not use_index:
+            for item in parallel_scan(
+                self.table.scan, SCAN_SEGMENTS, SCAN_MAX_WORKERS,
+                FilterExpression=Attr('ttl').lt(now),
+                ProjectionExpression=', '.join(f'#k{n}' for n in range(len(KEY_ATTRIBUTES))),
+                ExpressionAttributeNames={f'#k{n}': name for n, name in enumerate(KEY_ATTRIBUTES)}
+            ):
+                yield None, session_key(item)
+            return
+
+        current = now // self.bucket_seconds * self.bucket_seconds
+        start = self._swept_until
+        if start is None:
+            start = (now - self.lookback_seconds) // self.bucket_seconds * self.bucket_seconds
+
+        for bucket in range(start, current + 1, self.bucket_seconds):
+            for shard in range(self.shards):
+                for response in scan_pages(
+                    self.table.query,
+                    IndexName=self.index_name,
+                    KeyConditionExpression=Key('expiryBucket').eq(f'{bucket}#{shard}') & Key('ttl').lt(now)
+                ):
+                    # The index projects the table's key attributes, whatever the layout
+                    for item in response.get('Items', []):
+                        yield bucket, session_key(item)
+
+    def sweep(self, use_index=True, dry_run=False):
+        """Delete every expired session once and return the run's counters"""
+        now = int(time.time())
+        started = time.monotonic()
+        found = deleted = failed = 0
+        buckets = set()
+        chunk = []
+        next_report = 1000
+
+        def flush():
+            nonlocal deleted, failed
+            errors = batch_write(
+                self.dynamodb, self.table_name,
+                [{'DeleteRequest': {'Key': key}} for key in chunk],
+                max_retries=self.max_retries, base_delay=self.base_delay
+            )
+            deleted += len(chunk) - len(errors)
+            failed += len(errors)
+            chunk.clear()
+            # Pace deletes so a backlog doesn't eat the table's write capacity
+            if self.deletes_per_second > 0:
+                ahead = (deleted + failed) / self.deletes_per_second - (time.monotonic() - started)
+                if ahead > 0:
+                    self._stop.wait(ahead)
+
+        for bucket, key in self.expired_keys(now, use_index):
+            if bucket is not None and bucket not in buckets:
+                buckets.add(bucket)
+                logger.info(f"Sweeping expiry bucket {bucket} ({found} expired sessions so far)")
+            found += 1
+            if dry_run:
+                continue
+            chunk.append(key)
+            if len(chunk) >= BATCH_WRITE_LIMIT:
+                flush()
+                if deleted >= next_report:
+                    logger.info(f"Deleted {deleted} expired sessions")
+                    next_report += 1000
+            if self._stop.is_set():
+                break
+        if chunk:
+            flush()
+
+        stopped = self._stop.is_set()
+        if use_index and not dry_run and not failed and not stopped:
+            # Every bucket before the current one ended before `now` and is empty for good
+            self._swept_until = now // self.bucket_seconds * self.bucket_seconds
+
+        run = {
+            'mode': 'index' if use_index else 'scan',
+            'dryRun': dry_run,
+            'buckets': len(buckets),
+            'found': found,
+            'deleted': deleted,
+            'failed': failed,
+            'seconds': round(time.monotonic() - started, 3)
+        }
+        with self._lock:
+            self.runs += 1
+            self.deleted += deleted
+            self.failed += failed
+            self.last_run = dict(run, finishedAt=int(time.time()))
+        logger.info(
+            f"Sweep finished: {found} expired sessions found, {deleted} deleted, "
+            f"{failed} failed in {run['seconds']}s"
+        )
+        return run
+
+    def run_forever(self, interval=SWEEPER_INTERVAL, use_index=True):
+        """Sweep every `interval` seconds until stop() is called"""
+        while not self._stop.is_set():
+            try:
+                self.sweep(use_index=use_index)
+            except Exception as e:
+                logger.error(f"Session sweep failed: {str(e)}")
+            self._stop.wait(interval)
+
+    def start(self, interval=SWEEPER_INTERVAL):
+        """Sweep on a background thread; uses the index if it is ACTIVE"""
+        use_index = self.index_active()
+        if not use_index:
+            logger.warning(f"Index {self.index_name} not found or not ACTIVE on {self.table_name}, sweeper will scan")
+        self._thread = threading.Thread(
+            target=self.run_forever, args=(interval, use_index), name='session-sweeper', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop sweeping after the current delete batch"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        """Return sweeper counters"""
+        with self._lock:
+            return {
+                'enabled': True,
+                'runs': self.runs,
+                'deleted': self.deleted,
+                'failed': self.failed,
+                'sweptUntil': self._swept_until,
+                'lastRun': self.last_run
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Delete expired sessions ahead of DynamoDB TTL')
+    parser.add_argument('--loop', action='store_true', help='keep sweeping every SWEEPER_INTERVAL seconds')
+    parser.add_argument('--scan', action='store_true', help='scan the table instead of querying the expiry index')
+    parser.add_argument('--dry-run', action='store_true', help='count expired sessions without deleting them')
+    parser.add_argument('--table', default=TABLE_NAME, help='table to sweep (default: DYNAMODB_TABLE_NAME)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    dynamodb = boto3.resource('dynamodb', region_name=AWS_REGION, config=client_config())
+    sweeper = SessionSweeper(dynamodb, args.table)
+    # Mid-migration, deletes reach the composite-layout table too
+    migration = dual_writer()
+    if migration is not None:
+        migration.observe(dynamodb.meta.client)
+
+    use_index = not args.scan
+    if use_index and not sweeper.index_active():
+        logger.warning(f"Index {EXPIRY_INDEX_NAME} not found or not ACTIVE on {args.table}, scanning instead")
+        use_index = False
+
+    if args.loop:
+        signal.signal(signal.SIGTERM, lambda *_: sweeper.stop())
+        sweeper.run_forever(use_index=use_index)
+    else:
+        sweeper.sweep(use_index=use_index, dry_run=args.dry_run)
+    print(json.dumps(sweeper.stats()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Debounce tracker for sliding session expiration
+Remembers when this process last extended each session's TTL so repeated
+POST /sessions/<id>/touch calls within the debounce window skip the write
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class TouchTracker:
+    """Thread-safe bounded map of session ID -> (ttl written, when it was written)"""
+
+    def __init__(self, window_seconds, max_size):
+        self.window_seconds = window_seconds
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.writes = 0
+        self.debounced = 0
+
+    def claim(self, session_id, ttl):
+        """Decide whether a touch should write `ttl`
+
+        Returns None if the caller should write (the touch is recorded
+        up front so concurrent touches don't write too), or the TTL from
+        the last write if it happened within the window.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None and now - entry[1] < self.window_seconds:
+                self.debounced += 1
+                return entry[0]
+
+            self._entries[session_id] = (ttl, now)
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self.writes += 1
+            return None
+
+    def forget(self, session_id):
+        """Drop a session, e.g. after a failed touch or when it is deleted"""
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def stats(self):
+        """Return touch counters"""
+        with self._lock:
+            return {
+                'tracked': len(self._entries),
+                'windowSeconds': self.window_seconds,
+                'writes': self.writes,
+                'debounced': self.debounced
+            }
@@ -0,0 +1,202 @@
+"""
+Write-behind buffer for new sessions
+Requests hand complete session items to a bounded in-memory queue and
+return; background flusher threads write them with BatchWriteItem in
+batches of 25, as soon as a batch is full or the oldest pending item
+reaches the flush deadline
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from session_batch import BATCH_WRITE_LIMIT, batch_write
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    """Thread-safe bounded queue of session puts flushed in the background
+
+    Items stay visible through get() until their write has completed, so
+    the process that accepted a session can always read it back.
+    """
+
+    def __init__(self, dynamodb, table_name, max_pending, flush_interval, enqueue_timeout,
+                 flushers=1, max_retries=5, base_delay=0.05):
+        self.dynamodb = dynamodb
+        self.table_name = table_name
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.flushers = flushers
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        # session_id -> (item, enqueued_at), oldest first
+        self._queue = OrderedDict()
+        # session_id -> item, for batches currently being written
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._work = threading.Condition(self._lock)
+        self._space = threading.Condition(self._lock)
+        self._written = threading.Condition(self._lock)
+        # Number of settle() callers waiting - flush without waiting for the deadline
+        self._urgent = 0
+        self._closing = False
+        self._threads = []
+        self.accepted = 0
+        self.rejected = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+
+    def start(self):
+        """Start the flusher threads"""
+        for n in range(self.flushers):
+            thread = threading.Thread(target=self._run, name=f'write-behind-{n}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, item):
+        """Queue a session item for writing
+
+        Blocks for up to enqueue_timeout while the queue is full and
+        returns False if there is still no room (or the queue is closing).
+        """
+        deadline = time.monotonic() + self.enqueue_timeout
+        with self._lock:
+            while len(self._queue) >= self.max_pending and not self._closing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._space.wait(remaining)
+
+            if self._closing or len(self._queue) >= self.max_pending:
+                self.rejected += 1
+                return False
+
+            self._queue[item['id']] = (item, time.monotonic())
+            self.accepted += 1
+            self._work.notify()
+            return True
+
+    def get(self, session_id):
+        """Return a session item that is accepted but not yet written, or None"""
+        with self._lock:
+            entry = self._queue.get(session_id)
+            if entry is not None:
+                return entry[0]
+            return self._inflight.get(session_id)
+
+    def pending_ids(self, user_id):
+        """IDs of a user's sessions that are accepted but not yet written"""
+        with self._lock:
+            queued = [session_id for session_id, (item, _) in self._queue.items() if item['userId'] == user_id]
+            inflight = [session_id for session_id, item in self._inflight.items() if item['userId'] == user_id]
+        return queued + inflight
+
+    def settle(self, session_id, timeout):
+        """Wait until a pending session has been written (e.g. before updating or deleting it)
+
+        Returns False if it is still pending after `timeout` seconds.
+        """
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            if session_id not in self._queue and session_id not in self._inflight:
+                return True
+
+            self._urgent += 1
+            self._work.notify_all()
+            try:
+                while session_id in self._queue or session_id in self._inflight:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._written.wait(remaining)
+                return True
+            finally:
+                self._urgent -= 1
+
+    def close(self, timeout=None):
+        """Stop accepting sessions, flush everything pending and stop the flushers"""
+        with self._lock:
+            if self._closing:
+                return
+            self._closing = True
+            pending = len(self._queue)
+            self._work.notify_all()
+            self._space.notify_all()
+
+        if pending:
+            logger.info(f"Flushing {pending} pending session writes before exit")
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def stats(self):
+        """Return queue counters"""
+        with self._lock:
+            return {
+                'enabled': True,
+                'pending': len(self._queue),
+                'inflight': len(self._inflight),
+                'maxPending': self.max_pending,
+                'accepted': self.accepted,
+                'rejected': self.rejected,
+                'written': self.written,
+                'failed': self.failed,
+                'batches': self.batches
+            }
+
+    def _next_batch(self):
+        """Wait for a batch to be due and move it from the queue to in-flight
+
+        Returns None once the queue is closing and empty.
+        """
+        with self._lock:
+            while True:
+                if self._queue:
+                    _, oldest = next(iter(self._queue.values()))
+                    wait = oldest + self.flush_interval - time.monotonic()
+                    if len(self._queue) >= BATCH_WRITE_LIMIT or self._urgent or self._closing or wait <= 0:
+                        break
+                elif self._closing:
+                    return None
+                else:
+                    wait = None
+                self._work.wait(wait)
+
+            batch = []
+            while self._queue and len(batch) < BATCH_WRITE_LIMIT:
+                session_id, (item, _) = self._queue.popitem(last=False)
+                self._inflight[session_id] = item
+                batch.append(item)
+            self._space.notify_all()
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+
+            try:
+                failed = batch_write(
+                    self.dynamodb, self.table_name,
+                    [{'PutRequest': {'Item': item}} for item in batch],
+                    max_retries=self.max_retries, base_delay=self.base_delay
+                )
+            except Exception as e:
+                logger.error(f"Write-behind flush of {len(batch)} sessions failed: {str(e)}")
+                failed = [({'PutRequest': {'Item': item}}, str(e)) for item in batch]
+
+            for write, error in failed:
+                logger.error(f"Dropping session {write['PutRequest']['Item']['id']} after failed write: {error}")
+
+            with self._lock:
+                for item in batch:
+                    del self._inflight[item['id']]
+                self.batches += 1
+                self.written += len(batch) - len(failed)
+                self.failed += len(failed)
+                self._written.notify_all()
@@ -89,4 +89,47 @@ echo "✅ Test 12: Cleanup - Delete Second Session"
 curl -s -X DELETE "${API_URL}/sessions/${SESSION_ID_2}" | jq '.'
 echo ""
 
+# Test 13: Batch create sessions
+echo "✅ Test 13: Batch Create Sessions"
+BATCH_RESPONSE=$(curl -s -X POST "${API_URL}/sessions:batchCreate" \
+  -H "Content-Type: application/json" \
+  -d '{"sessions": [{"userId": "batchuser1", "data": {"n": 1}}, {"userId": "batchuser2", "data": {"n": 2}}]}')
+echo "$BATCH_RESPONSE" | jq '.'
+BATCH_IDS=$(echo "$BATCH_RESPONSE" | jq -c '[.results[].sessionId]')
+echo ""
+
+# Test 14: Batch get sessions
+echo "✅ Test 14: Batch Get Sessions"
+curl -s -X POST "${API_URL}/sessions:batchGet" \
+  -H "Content-Type: application/json" \
+  -d "{\"sessionIds\": ${BATCH_IDS}}" | jq '.'
+echo ""
+
+# Test 15: Batch delete sessions
+echo "✅ Test 15: Batch Delete Sessions"
+curl -s -X POST "${API_URL}/sessions:batchDelete" \
+  -H "Content-Type: application/json" \
+  -d "{\"sessionIds\": ${BATCH_IDS}}" | jq '.'
+echo ""
+
+# Test 16: Touch a session twice (second touch is debounced)
+echo "✅ Test 16: Touch Session (Second Touch Should Return extended: false)"
+TOUCH_ID=$(curl -s -X POST "${API_URL}/sessions" \
+  -H "Content-Type: application/json" \
+  -d '{"userId": "testuser123"}' | jq -r '.sessionId')
+curl -s -X POST "${API_URL}/sessions/${TOUCH_ID}/touch" | jq '.'
+curl -s -X POST "${API_URL}/sessions/${TOUCH_ID}/touch" | jq '.'
+curl -s -X DELETE "${API_URL}/sessions/${TOUCH_ID}" > /dev/null
+echo ""
+
+# Test 17: Log a user out of every session at once
+echo "✅ Test 17: Delete All Sessions of a User"
+for n in 1 2 3; do
+  curl -s -X POST "${API_URL}/sessions" \
+    -H "Content-Type: application/json" \
+    -d '{"userId": "logoutuser"}' > /dev/null
+done
+curl -s -X DELETE "${API_URL}/sessions/user/logoutuser" | jq '.'
+echo ""
+
 echo "✅ All tests completed!"
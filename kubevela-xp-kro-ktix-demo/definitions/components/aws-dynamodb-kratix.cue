@@ -31,6 +31,9 @@ template: {
 			billingMode:           parameter.billingMode
 			attributeDefinitions:  parameter.attributeDefinitions
 			keySchema:             parameter.keySchema
+			if parameter.globalSecondaryIndexes != _|_ {
+				globalSecondaryIndexes: parameter.globalSecondaryIndexes
+			}
 			if parameter.billingMode == "PROVISIONED" {
 				provisioned: {
 					readCapacity:  parameter.provisioned.readCapacity
@@ -62,6 +65,17 @@ template: {
 			keyType:       "HASH" | "RANGE"
 		}]
 
+		// Global secondary indexes (key attributes must be in attributeDefinitions)
+		globalSecondaryIndexes?: [...{
+			indexName: string
+			keySchema: [...{
+				attributeName: string
+				keyType:       "HASH" | "RANGE"
+			}]
+			projectionType:    *"ALL" | "KEYS_ONLY" | "INCLUDE"
+			nonKeyAttributes?: [...string]
+		}]
+
 		// Provisioned throughput (only used when billingMode is PROVISIONED)
 		provisioned?: {
 			readCapacity:  *5 | (int & >=1 & <=40000)
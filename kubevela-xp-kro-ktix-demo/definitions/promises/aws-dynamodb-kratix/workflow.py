@@ -31,6 +31,52 @@ ATTRIBUTE_TYPES = {"S", "N", "B"}
 # Valid key types
 KEY_TYPES = {"HASH", "RANGE"}
 
+# Valid index projection types
+PROJECTION_TYPES = {"ALL", "KEYS_ONLY", "INCLUDE"}
+
+# AWS limit on global secondary indexes per table
+MAX_GLOBAL_SECONDARY_INDEXES = 20
+
+
+def validate_key_schema(key_schema: list, attr_names: set, owner: str) -> tuple[bool, str]:
+    """
+    Validate a table or index key schema.
+
+    Returns:
+        Tuple of (is_valid, error_message)
+    """
+    if not key_schema:
+        return False, f"{owner} keySchema is required and must have at least one key"
+    if len(key_schema) > 2:
+        return False, f"{owner} keySchema can have at most 2 keys (partition + sort)"
+
+    hash_key_count = 0
+    range_key_count = 0
+    for key in key_schema:
+        if not isinstance(key, dict):
+            return False, f"each key in {owner} keySchema must be an object"
+        key_attr = key.get("attributeName", "").strip()
+        key_type = key.get("keyType", "").strip()
+
+        if not key_attr:
+            return False, "each key must have an attributeName"
+        if key_attr not in attr_names:
+            return False, f"key attribute '{key_attr}' must be defined in attributeDefinitions"
+        if key_type not in KEY_TYPES:
+            return False, f"keyType must be HASH or RANGE, got {key_type}"
+
+        if key_type == "HASH":
+            hash_key_count += 1
+        else:
+            range_key_count += 1
+
+    if hash_key_count != 1:
+        return False, f"{owner} keySchema must have exactly one HASH (partition) key"
+    if range_key_count > 1:
+        return False, f"{owner} keySchema can have at most one RANGE (sort) key"
+
+    return True, ""
+
 
 def validate_request(request: dict) -> tuple[bool, str]:
     """
@@ -76,35 +122,35 @@ def validate_request(request: dict) -> tuple[bool, str]:
 
     # Validate key schema
     key_schema = spec.get("keySchema", [])
-    if not key_schema:
-        return False, "keySchema is required and must have at least one key"
-    if len(key_schema) > 2:
-        return False, "keySchema can have at most 2 keys (partition + sort)"
-
-    hash_key_count = 0
-    range_key_count = 0
-    for key in key_schema:
-        if not isinstance(key, dict):
-            return False, "each key in keySchema must be an object"
-        key_attr = key.get("attributeName", "").strip()
-        key_type = key.get("keyType", "").strip()
-
-        if not key_attr:
-            return False, "each key must have an attributeName"
-        if key_attr not in attr_names:
-            return False, f"key attribute '{key_attr}' must be defined in attributeDefinitions"
-        if key_type not in KEY_TYPES:
-            return False, f"keyType must be HASH or RANGE, got {key_type}"
-
-        if key_type == "HASH":
-            hash_key_count += 1
-        else:
-            range_key_count += 1
-
-    if hash_key_count != 1:
-        return False, "keySchema must have exactly one HASH (partition) key"
-    if range_key_count > 1:
-        return False, "keySchema can have at most one RANGE (sort) key"
+    is_valid, error_msg = validate_key_schema(key_schema, attr_names, "table")
+    if not is_valid:
+        return False, error_msg
+
+    # Validate global secondary indexes
+    indexes = spec.get("globalSecondaryIndexes", [])
+    if not isinstance(indexes, list):
+        return False, "globalSecondaryIndexes must be a list"
+    if len(indexes) > MAX_GLOBAL_SECONDARY_INDEXES:
+        return False, f"at most {MAX_GLOBAL_SECONDARY_INDEXES} globalSecondaryIndexes are allowed"
+
+    index_names = set()
+    for index in indexes:
+        if not isinstance(index, dict):
+            return False, "each globalSecondaryIndex must be an object"
+        index_name = index.get("indexName", "").strip()
+        if not index_name:
+            return False, "each globalSecondaryIndex must have an indexName"
+        if index_name in index_names:
+            return False, f"duplicate globalSecondaryIndex name '{index_name}'"
+        index_names.add(index_name)
+
+        is_valid, error_msg = validate_key_schema(index.get("keySchema", []), attr_names, f"index '{index_name}'")
+        if not is_valid:
+            return False, error_msg
+
+        projection_type = index.get("projectionType", "ALL").strip()
+        if projection_type not in PROJECTION_TYPES:
+            return False, f"projectionType must be ALL, KEYS_ONLY, or INCLUDE, got {projection_type}"
 
     # Validate billing mode
     billing_mode = spec.get("billingMode", "PAY_PER_REQUEST").strip()
@@ -175,15 +221,37 @@ def generate_ack_table_manifest(request: dict) -> dict:
     }
 
     # Add billing mode configuration
+    provisioned_throughput = None
     if billing_mode == "PAY_PER_REQUEST":
         manifest["spec"]["billingMode"] = "PAY_PER_REQUEST"
     else:
         provisioned = spec.get("provisioned", {})
-        manifest["spec"]["billingMode"] = "PROVISIONED"
-        manifest["spec"]["provisionedThroughput"] = {
+        provisioned_throughput = {
             "readCapacityUnits": provisioned.get("readCapacity", 5),
             "writeCapacityUnits": provisioned.get("writeCapacity", 5)
         }
+        manifest["spec"]["billingMode"] = "PROVISIONED"
+        manifest["spec"]["provisionedThroughput"] = provisioned_throughput
+
+    # Add global secondary indexes (e.g. userId + createdAt for per-user queries)
+    global_indexes = []
+    for index in spec.get("globalSecondaryIndexes", []):
+        projection = {"projectionType": index.get("projectionType", "ALL").strip()}
+        if index.get("nonKeyAttributes"):
+            projection["nonKeyAttributes"] = index["nonKeyAttributes"]
+
+        global_index = {
+            "indexName": index["indexName"].strip(),
+            "keySchema": index["keySchema"],
+            "projection": projection
+        }
+        # Provisioned tables need capacity on every index; mirror the table's
+        if provisioned_throughput:
+            global_index["provisionedThroughput"] = dict(provisioned_throughput)
+        global_indexes.append(global_index)
+
+    if global_indexes:
+        manifest["spec"]["globalSecondaryIndexes"] = global_indexes
 
     return manifest
 